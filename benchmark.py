@@ -0,0 +1,532 @@
+'''
+Times every import_*.py command end to end against fake_api.py, with made up
+input files, so changes to the importers can be checked for speed without a
+real API.
+
+For each importer it reports the rows imported per second, the 50th and
+99th percentile time a request took as the importer saw it (from its
+--metrics-jsonl stats, so retries and waiting for a connection count too),
+and the peak memory (RSS) of the import process. The results are compared with the baseline in
+~/.landavailability-import/benchmark-baseline.json, and it exits with an
+error if an importer got more than --tolerance slower, or bigger, than the
+baseline.
+
+Example usage:
+
+    python benchmark.py
+    python benchmark.py codepoints busstops --rows 20000 --latency 0.005 --import-options "--workers 8"
+    python benchmark.py --save-baseline
+
+The baseline is only compared against runs with the same settings (rows,
+latency etc.), and depends on the machine, so it is kept in your home
+directory rather than with the code - save one before making changes.
+'''
+import collections
+import csv
+import json
+import math
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import shapefile
+
+from fake_api import FakeAPIServer
+from naptan import NAPTAN_HEADER
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(
+    os.path.expanduser('~'), '.landavailability-import',
+    'benchmark-baseline.json')
+
+Benchmark = collections.namedtuple(
+    'Benchmark', 'script api_path make_input takes_import_options')
+
+
+# Input files
+
+def write_csv(file_name, rows, header=None, encoding='utf-8'):
+    with open(file_name, 'w', newline='', encoding=encoding) as csvfile:
+        writer = csv.writer(csvfile)
+        if header:
+            writer.writerow(header)
+        writer.writerows(rows)
+    return [file_name]
+
+
+def postcode(i):
+    return 'CB{} {}{}'.format(i // 1000 % 100, i % 10,
+                              'ABDEFGHJLN'[i // 10 % 10] + 'PQ'[i // 100 % 2])
+
+
+def ring(x, y, radius, num_points=20):
+    '''A clockwise ring of points around (x, y), like a shapefile polygon.'''
+    points = [(x + radius * math.cos(-2 * math.pi * i / num_points),
+               y + radius * math.sin(-2 * math.pi * i / num_points))
+              for i in range(num_points)]
+    return points + points[:1]
+
+
+def write_shapefile(file_name, shape_type, fields, features):
+    '''Writes (geometry, record) features to a shapefile, where geometry is
+    (x, y) for a point, or a list of parts for a line or polygon.
+    '''
+    if int(shapefile.__version__.split('.')[0]) >= 2:
+        writer = shapefile.Writer(file_name, shapeType=shape_type)
+    else:
+        writer = shapefile.Writer(shape_type)
+    for field in fields:
+        writer.field(*field)
+    for geometry, record in features:
+        if shape_type == shapefile.POINT:
+            writer.point(*geometry)
+        elif shape_type == shapefile.POLYLINE:
+            writer.line(geometry)
+        else:
+            writer.poly(geometry)
+        writer.record(*record)
+    if int(shapefile.__version__.split('.')[0]) >= 2:
+        writer.close()
+    else:
+        writer.save(file_name)
+    return ['--filename', file_name]
+
+
+def naptan_input(directory, rows):
+    stop_types = ['BCT', 'BCS', 'MET', 'RLY', 'BCT', 'PLT', 'BST', 'RSE']
+    data = []
+    for i in range(rows):
+        row = [''] * len(NAPTAN_HEADER)
+        row[0] = '0100BRP{:05d}'.format(i)
+        row[1] = 'bstgwpa{}'.format(i)
+        row[4] = 'Stop {}'.format(i)
+        row[6] = 'Stop'
+        row[8] = 'Landmark'
+        row[10] = 'High Street'
+        row[14] = 'NE-bound'
+        row[17] = 'E0035604'
+        row[18] = 'Bristol'
+        row[19] = 'Bristol'
+        row[29] = '{:.6f}'.format(-2.5 + i / 1e6)
+        row[30] = '{:.6f}'.format(51.4 + i / 1e6)
+        row[31] = stop_types[i % len(stop_types)]
+        data.append(row)
+    return write_csv(os.path.join(directory, 'Stops.csv'), data,
+                     NAPTAN_HEADER, 'latin1')
+
+
+def addresses_input(directory, rows):
+    return write_csv(os.path.join(directory, 'addresses.csv'), (
+        [str(100000000 + i), '', '{} High Street'.format(i), '', '',
+         'Cambridge', 'Cambridgeshire', postcode(i), '',
+         '{:.6f}'.format(52.2 + i / 1e6), '{:.6f}'.format(0.12 + i / 1e6)]
+        for i in range(rows)))
+
+
+BROADBAND_HEADER = [
+    'postcode', 'Postcode Data Status', 'SFBB availability (% premises)',
+    '% of premises unable to receive 2Mbit/s',
+    '% of premises unable to receive 5Mbit/s',
+    '% of premises unable to receive 10Mbit/s',
+    '% of premises unable to receive 30Mbit/s',
+    'Average download speed (Mbit/s)', 'Median download speed (Mbit/s)',
+    'Minimum download speed (Mbit/s)', 'Maximum download speed (Mbit/s)',
+    'Average download speed (Mbit/s) for lines < 10Mbit/s',
+    'Average download speed (Mbit/s) for lines 10<30Mbit/s',
+    'Average download speed (Mbit/s) for lines 30<300Mbit/s',
+    'Average download speed (Mbit/s) for SFBB lines',
+    'Average upload speed (Mbit/s)', 'Median upload speed (Mbit/s)',
+    'Minimum upload speed (Mbit/s)', 'Maximum upload speed (Mbit/s)',
+]
+
+
+def broadbands_input(directory, rows):
+    return write_csv(
+        os.path.join(directory, 'broadband.csv'),
+        ([postcode(i).replace(' ', ''), 'Y', '85.5', '0', '<1', '1', '1',
+          '45.2', '0', '5.5', 'N/A', '0', '0', '0', '0', '8.5', '0', '1.1',
+          '20'] for i in range(rows)),
+        BROADBAND_HEADER)
+
+
+def codepoints_input(directory, rows):
+    return write_csv(os.path.join(directory, 'cb.csv'), (
+        [postcode(i), '10', str(545000 + i % 1000), str(258000 + i // 1000),
+         'E92000001', 'E19000001', 'E18000002', '', 'E07000008', 'E05002702']
+        for i in range(rows)))
+
+
+def lr_uprns_input(directory, rows):
+    return write_csv(os.path.join(directory, 'uprns.csv'), (
+        ['CB{}'.format(i), str(100000000 + i)] for i in range(rows)))
+
+
+def schools_input(directory, rows):
+    data = []
+    for i in range(rows):
+        row = [''] * 72
+        row[0] = str(100000 + i)
+        row[2] = 'Cambridgeshire'
+        row[4] = 'School {}'.format(i)
+        row[11] = ('Community Primary', 'Secondary', 'Special')[i % 3]
+        row[20] = '420'
+        row[23] = '398'
+        row[44] = postcode(i)
+        row[70] = str(545000 + i % 1000)
+        row[71] = str(258000 + i // 1000)
+        data.append(row)
+    header = ['column {}'.format(i) for i in range(72)]
+    for index, name in ((0, 'URN'), (2, 'LA (name)'),
+                        (4, 'EstablishmentName'),
+                        (11, 'PhaseOfEducation (name)'),
+                        (20, 'SchoolCapacity'), (23, 'NumberOfPupils'),
+                        (44, 'Postcode'), (70, 'Easting'), (71, 'Northing')):
+        header[index] = name
+    return write_csv(os.path.join(directory, 'edubase.csv'), data, header,
+                     'latin1')
+
+
+def cambridge_input(directory, rows):
+    data = []
+    for i in range(rows):
+        row = [''] * 15
+        row[0] = 'Cambridge'
+        row[3] = str(100090000000 + i)
+        row[4] = str(20000 + i)
+        row[6] = 'Unit {}'.format(i)
+        row[7] = '{} High Street, Cambridge'.format(i)
+        row[14] = ('EPRN', 'EPRI', 'OCC')[i % 3]
+        data.append(row)
+    return write_csv(os.path.join(directory, 'nndr.csv'), data,
+                     ['column {}'.format(i) for i in range(15)])
+
+
+def voa_input(directory, rows):
+    file_name = os.path.join(directory, 'voa.csv')
+    with open(file_name, 'w', encoding='utf-8') as voafile:
+        for i in range(rows):
+            voafile.write(
+                '01*{0}*{1}*BA1*Firm*1****High St*Cambridge**Cambs*{2}*S1*'
+                'Shop*100.5*200*300*400*2017*BA*REF*VO*01-APR-2017**249*M2*'
+                '10\n'.format(i, 100000 + i, postcode(i)))
+            voafile.write('02*1*Ground*Retail*50.25*10*502.5\n')
+            voafile.write('02*2*First*Office*50.25*10*502.5\n')
+            voafile.write('03*Other*1*2*3\n')
+    return [file_name]
+
+
+def manchester_input(directory, rows):
+    file_name = os.path.join(directory, 'manchester.json')
+    features = []
+    for i in range(rows):
+        features.append({
+            'type': 'Feature',
+            'uprn': str(77000000 + i) if i % 10 else None,
+            'geometry': {
+                'type': 'MultiPolygon',
+                'coordinates': [[ring(-250000 + i, 7070000, 10)]]},
+            'properties': {'address': '{} Deansgate'.format(i),
+                           'la': 'Manchester'},
+        })
+    with open(file_name, 'w') as jsonfile:
+        json.dump({'type': 'FeatureCollection', 'features': features},
+                  jsonfile)
+    return ['--filename', file_name]
+
+
+def greenbelts_input(directory, rows):
+    return write_shapefile(
+        os.path.join(directory, 'greenbelt.shp'), shapefile.POLYGON,
+        [('GB_name', 'C', 80), ('LA_name', 'C', 80), ('ONS_code', 'C', 10),
+         ('Perim_km', 'N', 18, 8), ('Area_ha', 'N', 18, 8)],
+        (([ring(-1.3 + i / 1000.0, 53.3, 0.001)],
+          ['Greenbelt {}'.format(i // 5), 'District {}'.format(i // 10),
+           'E0700{:04d}'.format(i // 10), 1.5, 10.25])
+         for i in range(rows)))
+
+
+def lr_polygons_input(directory, rows):
+    return write_shapefile(
+        os.path.join(directory, 'polygons.shp'), shapefile.POLYGON,
+        [('POLY_ID', 'N', 10, 0), ('TITLE_NO', 'C', 20),
+         ('INSERT', 'C', 20), ('UPDATE', 'C', 20), ('REC_STATUS', 'C', 2)],
+        (([ring(545000 + i * 10, 258000, 4)],
+          [i, 'CB{}'.format(i), '2004-11-08', '2004-11-09', 'A'])
+         for i in range(rows)))
+
+
+def motorways_input(directory, rows):
+    return write_shapefile(
+        os.path.join(directory, 'motorways.shp'), shapefile.POINT,
+        [('IDENTIFIER', 'C', 20), ('NUMBER', 'C', 10)],
+        (((545000 + i, 258000 + i), ['J{}'.format(i), 'M{}'.format(i % 99)])
+         for i in range(rows)))
+
+
+def ohl_input(directory, rows):
+    return write_shapefile(
+        os.path.join(directory, 'ohl.shp'), shapefile.POLYLINE,
+        [('GDO_GID', 'N', 10, 0), ('ROUTE_ASSE', 'C', 20),
+         ('TOWERS', 'C', 50), ('ACTION_DTT', 'C', 20), ('STATUS', 'C', 10),
+         ('OPERATING_', 'C', 10), ('CIRCUIT_1', 'C', 50),
+         ('CIRCUIT_2', 'C', 50)],
+        (([[(545000 + i * 100 + j * 10, 258000 + j * 5)
+            for j in range(10)]],
+          [i, '4VK', 'VK1-VK10', '2015-01-01', 'LIVE', '400', 'A', 'B'])
+         for i in range(rows)))
+
+
+def substations_input(directory, rows):
+    return write_shapefile(
+        os.path.join(directory, 'substations.shp'), shapefile.POLYGON,
+        [('NAME', 'C', 50), ('OPERATING_', 'C', 10), ('ACTION_DTT', 'C', 20),
+         ('STATUS', 'C', 10), ('DESCRIPTIO', 'C', 50),
+         ('OWNER_FLAG', 'C', 5), ('GDO_GID', 'N', 10, 0)],
+        (([ring(545000 + i * 100, 258000, 20)],
+          ['Substation {}'.format(i), '400', '2015-01-01', 'LIVE',
+           'Substation', 'Y', i])
+         for i in range(rows)))
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('addresses', Benchmark(
+        'import_addresses.py', 'api/addresses/', addresses_input, True)),
+    ('broadbands', Benchmark(
+        'import_broadbands.py', 'api/broadbands/', broadbands_input, True)),
+    ('busstops', Benchmark(
+        'import_busstops.py', 'api/busstops/', naptan_input, True)),
+    ('cambridge_lands', Benchmark(
+        'import_cambridge_lands.py', 'api/locations/', cambridge_input,
+        True)),
+    ('codepoints', Benchmark(
+        'import_codepoints.py', 'api/codepoints/', codepoints_input, True)),
+    ('greenbelts', Benchmark(
+        'import_greenbelts.py', 'api/greenbelts/', greenbelts_input, False)),
+    ('lr_polygons', Benchmark(
+        'import_lr_polygons.py', 'api/polygons/', lr_polygons_input, True)),
+    ('lr_uprns', Benchmark(
+        'import_lr_uprns.py', 'api/uprns/', lr_uprns_input, True)),
+    ('manchester_lands', Benchmark(
+        'import_manchester_lands.py', 'api/locations/', manchester_input,
+        True)),
+    ('metrotubes', Benchmark(
+        'import_metrotubes.py', 'api/metrotubes/', naptan_input, True)),
+    ('motorways', Benchmark(
+        'import_motorways.py', 'api/motorways/', motorways_input, True)),
+    ('naptan', Benchmark(
+        'import_naptan.py', None, naptan_input, True)),
+    ('ohl', Benchmark(
+        'import_ohl.py', 'api/overheadlines/', ohl_input, True)),
+    ('schools', Benchmark(
+        'import_schools.py', 'api/schools/', schools_input, True)),
+    ('substations', Benchmark(
+        'import_substations.py', 'api/substations/', substations_input,
+        True)),
+    ('trainstops', Benchmark(
+        'import_trainstops.py', 'api/trainstops/', naptan_input, True)),
+    ('voa', Benchmark('import_voa.py', 'api/voa/', voa_input, True)),
+])
+
+
+# Running
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0
+    index = int(math.ceil(percent / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(index, 0)]
+
+
+def client_latencies(metrics_file_name):
+    '''Returns the 50th and 99th percentile seconds of the requests in the
+    last stats an importer wrote to its --metrics-jsonl file, or Nones if
+    it didn't write any.
+    '''
+    network = {}
+    try:
+        with open(metrics_file_name, encoding='utf-8') as metrics_file:
+            for line in metrics_file:
+                network = json.loads(line)['stage_seconds'].get(
+                    'network', network)
+    except FileNotFoundError:
+        pass
+    return network.get('p50'), network.get('p99')
+
+
+def run_benchmark(name, rows, latency=0, error_rate=0, import_options=()):
+    '''Runs the importer on `rows` made up rows, against a fake API on a
+    background thread, and returns a dict of its timings.
+    '''
+    benchmark = BENCHMARKS[name]
+    directory = tempfile.mkdtemp()
+    server = FakeAPIServer(latency=latency, error_rate=error_rate,
+                           keep_latencies=True).start()
+    try:
+        command = [sys.executable, os.path.join(HERE, benchmark.script)] + \
+            benchmark.make_input(directory, rows) + \
+            ['--apitoken', 'benchmark']
+        if name == 'naptan':
+            command += ['--bus-url', server.url + 'api/busstops/',
+                        '--metro-tube-url', server.url + 'api/metrotubes/',
+                        '--train-url', server.url + 'api/trainstops/']
+        else:
+            command += ['--apiurl', server.url + benchmark.api_path]
+        if name == 'cambridge_lands':
+            command += ['--lrapiurl', server.url + 'api/',
+                        '--voaapiurl', server.url + 'api/voa/']
+        metrics_file_name = os.path.join(directory, 'metrics.jsonl')
+        if benchmark.takes_import_options:
+            command += list(import_options) + [
+                '--metrics-jsonl', metrics_file_name]
+        # keep manifests, dead letters and caches in the temp directory
+        env = dict(os.environ, HOME=directory,
+                   HMRC_API_URL=server.url + 'v2/uk/addresses',
+                   HMRC_THROTTLE='0', HMRC_USER='benchmark',
+                   HMRC_PASSWORD='benchmark')
+
+        output_file_name = os.path.join(directory, 'output.txt')
+        with open(output_file_name, 'w') as output:
+            start = time.monotonic()
+            process = subprocess.Popen(
+                command, cwd=directory, env=env, stdout=output,
+                stderr=subprocess.STDOUT)
+            # unlike Popen.wait(), wait4 gives the resource usage of the
+            # process, including its peak RSS
+            _, status, usage = os.wait4(process.pid, 0)
+            seconds = time.monotonic() - start
+        process.returncode = os.WEXITSTATUS(status) \
+            if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        if process.returncode:
+            with open(output_file_name) as output:
+                raise BenchmarkError('{} failed:\n{}'.format(
+                    ' '.join(command), output.read()[-2000:]))
+
+        latencies = sorted(server.latencies)
+        p50, p99 = client_latencies(metrics_file_name)
+        # ru_maxrss is in KB on Linux but bytes on macOS
+        peak_rss = usage.ru_maxrss / (
+            1024.0 * 1024 if sys.platform == 'darwin' else 1024.0)
+        return {
+            'rows': rows,
+            'seconds': round(seconds, 3),
+            'rows_per_sec': round(rows / seconds, 1),
+            'requests': len(latencies),
+            # None for the importers without --metrics-jsonl
+            'p50_ms': None if p50 is None else round(p50 * 1000, 3),
+            'p99_ms': None if p99 is None else round(p99 * 1000, 3),
+            # the time the fake API took to answer, not counting the network
+            # or the time the importer took to send and read
+            'server_p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'server_p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'peak_rss_mb': round(peak_rss, 1),
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(directory)
+
+
+def regressions(results, baseline, tolerance):
+    '''Yields a description of each result that is more than tolerance (a
+    fraction) slower or bigger than its baseline.
+    '''
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['rows_per_sec'] < base['rows_per_sec'] * (1 - tolerance):
+            yield '{}: {:,.0f} rows/sec, down from {:,.0f}'.format(
+                name, result['rows_per_sec'], base['rows_per_sec'])
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            yield '{}: peak RSS {:,.1f} MB, up from {:,.1f} MB'.format(
+                name, result['peak_rss_mb'], base['peak_rss_mb'])
+
+
+def load_baseline(file_name):
+    try:
+        with open(file_name) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def milliseconds(value):
+    return '-' if value is None else '{:,.2f}'.format(value)
+
+
+def print_result(name, result):
+    print('{:<17} {:>10,.0f} {:>9} {:>9} {:>9,} {:>8,.1f}'.format(
+        name, result['rows_per_sec'], milliseconds(result['p50_ms']),
+        milliseconds(result['p99_ms']), result['requests'],
+        result['peak_rss_mb']))
+
+
+@click.command()
+@click.argument('names', nargs=-1, type=click.Choice(list(BENCHMARKS)))
+@click.option('--rows', default=2000, help='Rows of input per importer')
+@click.option('--latency', type=float, default=0, metavar='SECONDS',
+              help='Average time the fake API waits before replying')
+@click.option('--error-rate', type=float, default=0, metavar='FRACTION',
+              help='Fraction of requests the fake API replies 500 to')
+@click.option('--import-options', default='',
+              help='Options to give the importers e.g. "--workers 8"')
+@click.option('--baseline', default=BASELINE_FILE, type=click.Path(),
+              help='File with the baseline results')
+@click.option('--save-baseline', is_flag=True,
+              help='Save the results as the new baseline')
+@click.option('--tolerance', type=float, default=0.25,
+              help='Fraction slower or bigger than the baseline that counts '
+              'as a regression (default: 0.25)')
+def benchmark(names, rows, latency, error_rate, import_options, baseline,
+              save_baseline, tolerance):
+    settings = {'rows': rows, 'latency': latency, 'error_rate': error_rate,
+                'import_options': import_options}
+    print('{:<17} {:>10} {:>9} {:>9} {:>9} {:>8}'.format(
+        'importer', 'rows/sec', 'p50 ms', 'p99 ms', 'requests', 'RSS MB'))
+    results = collections.OrderedDict()
+    for name in names or BENCHMARKS:
+        try:
+            results[name] = run_benchmark(
+                name, rows, latency, error_rate, shlex.split(import_options))
+        except BenchmarkError as e:
+            raise click.ClickException(str(e))
+        print_result(name, results[name])
+
+    if save_baseline:
+        saved = load_baseline(baseline) or {}
+        if saved.get('settings') != settings:
+            saved = {'settings': settings, 'results': {}}
+        saved['results'].update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(baseline)),
+                    exist_ok=True)
+        with open(baseline, 'w') as baseline_file:
+            json.dump(saved, baseline_file, indent=2, sort_keys=True)
+        print('Saved the baseline in {}'.format(baseline))
+        return
+
+    saved = load_baseline(baseline)
+    if not saved:
+        print('No baseline to compare with - save one with --save-baseline')
+    elif saved['settings'] != settings:
+        print('The baseline was run with different settings {} - not '
+              'comparing'.format(saved['settings']))
+    else:
+        problems = list(regressions(results, saved['results'], tolerance))
+        for problem in problems:
+            print('REGRESSION {}'.format(problem))
+        if problems:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    benchmark()
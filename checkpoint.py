@@ -0,0 +1,163 @@
+'''
+Checkpoints let an import that died partway through carry on from where it
+got to, with --resume, instead of starting again from the first row.
+
+While a file is imported, a sidecar file '<input file>.checkpoint' is written
+every so often, e.g.:
+
+    {"file_name": "Stops.csv", "position": 51234567, "complete": false,
+     "count": 200000, "counts": {"imported": 199990, "ERROR...": 10},
+     "examples": {"imported": "0100BRP90310", ...}}
+
+The position is a byte offset for CSV files and a record number for
+shapefiles, or when the payloads saved by --cache are being sent instead,
+the number of the cache entry - marked by "from_cache": true. The sidecar
+files are removed when the whole import finishes.
+
+Checkpoints are only written with --checkpoint-every or --resume, so a
+plain import leaves nothing next to its input files.
+'''
+import codecs
+import collections
+import json
+import locale
+import os
+
+from inputs import sidecar_path, skip_to
+
+
+class LineReader(object):
+    '''Iterates over the lines of a file just opened in binary mode, from
+    position (e.g. that of a checkpoint) on, decoding them for the csv
+    module. It counts the bytes of the lines as it goes, rather than asking
+    the file with tell(), which zip members can't do before Python 3.7, so
+    that a checkpoint can seek straight back to where it has got to.
+    '''
+    def __init__(self, binary_file, encoding=None, position=None):
+        self.file = binary_file
+        self.decoder = codecs.getincrementaldecoder(
+            encoding or locale.getpreferredencoding(False))()
+        if position:
+            skip_to(binary_file, position)
+        self.offset = position or 0
+        self.line_start = self.offset
+        self.finished = False
+
+    def __iter__(self):
+        decode = self.decoder.decode
+        for line in self.file:
+            self.line_start = self.offset
+            self.offset += len(line)
+            yield decode(line)
+        self.finished = True
+
+    def current_line_start(self):
+        '''Returns the offset of the line read last, or of the end of the file
+        once it has all been read.
+        '''
+        return self.offset if self.finished else self.line_start
+
+
+class Checkpoint(object):
+    '''Keeps track of how far through an input file an import has got, and
+    saves it every `every` records.
+
+    It stands in for the LoopStats given to ImportCommand.process_all(),
+    passing each outcome on to it. With several workers records can finish in
+    a different order to the one they were read in, so the saved position -
+    and the saved counts - only move past a record once every record before
+    it has finished too.
+    '''
+    def __init__(self, file_name, loopstats, every=0):
+        self.file_name = file_name
+        self.path = sidecar_path(file_name, '.checkpoint')
+        self.loopstats = loopstats
+        self.every = every
+        self.position = None
+        # True if the position is that of an entry in the payload cache
+        self.from_cache = False
+        self.complete = False
+        self.counts = collections.Counter()
+        self.examples = {}
+        self.unsaved = 0
+        # [position after the record, finished?, outcome, iteration_id] in
+        # the order the records were read
+        self.pending = collections.deque()
+
+    def __getattr__(self, name):
+        # anything else goes to the LoopStats e.g. print_every_x_seconds()
+        return getattr(self.loopstats, name)
+
+    def load(self):
+        '''Reads a saved checkpoint, if there is one, and adds its outcome
+        counts to the LoopStats. Returns True if one was loaded.
+        '''
+        try:
+            with open(self.path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return False
+        self.position = saved['position']
+        self.from_cache = saved.get('from_cache', False)
+        self.complete = saved['complete']
+        for outcome, count in saved['counts'].items():
+            self.counts[outcome] += count
+            self.examples[outcome] = saved['examples'].get(outcome)
+            self.loopstats.add_count(
+                outcome, count, saved['examples'].get(outcome))
+        return True
+
+    def track(self, items):
+        '''Takes (iteration_id, item, position) tuples, where position is
+        where to resume reading from after that item, and yields
+        (iteration_id, item) pairs for process_all().
+        '''
+        for iteration_id, item, position in items:
+            entry = [position, False, None, None]
+            self.pending.append(entry)
+            yield (iteration_id, entry), item
+
+    def add(self, outcome, tracked_id, seconds=None):
+        iteration_id, entry = tracked_id
+        self.loopstats.add(outcome, iteration_id, seconds)
+        # counted the same way as the LoopStats, so a compact one keeps the
+        # checkpoint small too
+        entry[1:] = [True, self.loopstats.outcome_key(outcome), iteration_id]
+
+        while self.pending and self.pending[0][1]:
+            self.position, _, outcome, iteration_id = self.pending.popleft()
+            self.counts[outcome] += 1
+            if outcome not in self.examples:
+                self.examples[outcome] = iteration_id
+        self.unsaved += 1
+        if self.every and self.unsaved >= self.every:
+            self.save()
+
+    def finish(self):
+        '''Marks the file as completely imported.'''
+        self.complete = True
+        self.save()
+
+    def save(self):
+        if not self.every:
+            return
+        self.unsaved = 0
+        checkpoint = {
+            'file_name': os.path.basename(self.file_name),
+            'position': self.position,
+            'from_cache': self.from_cache,
+            'complete': self.complete,
+            'count': sum(self.counts.values()),
+            'counts': self.counts,
+            'examples': self.examples,
+        }
+        # write the whole file before replacing the old one, so a crash
+        # never leaves half a checkpoint
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, default=str)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
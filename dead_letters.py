@@ -0,0 +1,80 @@
+'''
+Dead letters are the payloads the API didn't accept. Each is written as a
+line of JSON, so they can be looked at, fixed up if need be, and sent again
+with replay.py - without re-running the whole import:
+
+    {"url": "http://localhost:8000/api/codepoints/", "identifier": "CB1 1AA",
+     "status_code": 400, "error": "{\"point\": [\"Invalid\"]}",
+     "payload": {"postcode": "CB11AA", ...}}
+
+status_code is null when the request couldn't be made at all. A record that
+failed before its payload was made (e.g. a VOA record that didn't parse) has
+its "record" instead of a "payload", and can't be replayed.
+'''
+import json
+import threading
+
+import payload_json
+
+
+class DeadLetterFile(object):
+    '''Appends dead letters to an NDJSON file, which is only created when
+    the first one is written.
+
+    Each line goes to the file in a single write, so the threads of --workers
+    and processes of --jobs can share the file without mixing up lines.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['file'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def write(self, url, identifier, status_code, error, payload=None,
+              encoded_payload=None, record=None):
+        '''Writes a dead letter. The payload can be given already encoded as
+        JSON bytes, as the bulk mode batches have it.
+        '''
+        letter = {
+            'url': url,
+            'identifier': identifier,
+            'status_code': status_code,
+            'error': error,
+        }
+        if record is not None:
+            letter['record'] = record
+        elif encoded_payload is None:
+            letter['payload'] = payload
+        line = payload_json.dumps(letter, default=str).encode('utf-8')
+        if encoded_payload is not None:
+            line = line[:-1] + b', "payload": ' + encoded_payload + b'}'
+        with self.lock:
+            if self.file is None:
+                print('Writing the payloads that fail to {}'.format(
+                    self.path))
+                self.file = open(self.path, 'ab', buffering=0)
+            self.file.write(line + b'\n')
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_dead_letters(path):
+    '''Yields the dead letters in an NDJSON file.'''
+    with open(path, encoding='utf-8') as dead_letters_file:
+        for line in dead_letters_file:
+            if line.strip():
+                yield json.loads(line)
+
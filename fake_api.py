@@ -0,0 +1,214 @@
+'''
+A stand-in for the Land Availability API, for trying out and timing imports
+without a real server.
+
+It accepts a POST of a JSON object, or of a JSON array of objects (bulk
+mode), on any path e.g. /api/busstops/, /api/voa/, /api/greenbelts/,
+/api/locations/ and replies 201. A record containing the --reject text
+anywhere in its JSON is treated as invalid, and the whole request gets a 400,
+like a bulk endpoint that saves all the records or none of them.
+
+It also answers the GETs the Cambridge import makes, with made up data:
+
+    /api/uprns/<uprn>/                    Land Registry titles for a UPRN
+    /api/polygons-from-point?lat=&long=   Land Registry polygons at a point
+    /api/voa/<ba_ref>                     VOA data for a rating
+    /v2/uk/addresses?uprn=                HMRC AddressBase lookup (set
+                                          HMRC_API_URL to use it)
+
+To see how the importers cope with a slow or flaky API, --latency makes it
+wait before replying (between half and one and a half times as long),
+--error-rate replies 500 to that fraction of the requests at random, and
+--fail-first N replies 503 to the first N requests.
+
+Example usage:
+
+    python fake_api.py --port 8000 --reject '"postcode": "XX"' --latency 0.02
+    python import_codepoints.py codepoints.csv --apiurl http://localhost:8000/api/codepoints/ --batch-size 500
+'''
+import json
+import random
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+
+# a small square in Cambridge, the way Land Registry returns them
+FAKE_POLYGON = {
+    'type': 'Polygon',
+    'coordinates': [[[0.12, 52.2], [0.1201, 52.2], [0.1201, 52.2001],
+                     [0.12, 52.2001], [0.12, 52.2]]]}
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send the headers and body without waiting for an ACK in between
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.start = time.monotonic()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.wait()
+        if self.server.should_fail():
+            return self.reply(503, {'error': 'unavailable'},
+                              {'Retry-After': '0'})
+        if self.server.should_error():
+            return self.reply(500, {'error': 'injected error'})
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            return self.reply(400, {'error': 'invalid JSON: {}'.format(e)})
+        records = data if isinstance(data, list) else [data]
+
+        for record in records:
+            if self.server.is_rejected(record):
+                self.server.count_request(self.path, [])
+                return self.reply(400, {'error': 'invalid record',
+                                        'record': record})
+        self.server.count_request(self.path, records)
+        self.reply(201, {'created': len(records)})
+
+    def do_GET(self):
+        self.start = time.monotonic()
+        self.server.wait()
+        if self.server.should_error():
+            return self.reply(500, {'error': 'injected error'})
+        url = urlparse(self.path)
+        query = {name: values[0]
+                 for name, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        if parts[-2:-1] == ['uprns']:
+            data = {'uprn': parts[-1], 'titles': [
+                {'title': 'CB{}'.format(parts[-1]),
+                 'polygons': [{'id': 1, 'status': 'A',
+                               'geom': FAKE_POLYGON}]}]}
+        elif parts[-1:] == ['polygons-from-point']:
+            data = [{'title': 'CB1', 'uprns': ['100090000001'],
+                     'polygon': json.dumps(FAKE_POLYGON)}]
+        elif parts[-2:-1] == ['voa']:
+            data = {'ba_ref': parts[-1], 'total_area': 123.45}
+        elif parts[-1:] == ['addresses']:
+            data = [{'uprn': query.get('uprn'),
+                     'address': {'lines': ['1 High Street'],
+                                 'town': 'Cambridge', 'postcode': 'CB1 1AA'},
+                     'location': [52.2, 0.12]}]
+        else:
+            return self.reply(404, {'error': 'not found'})
+        self.reply(200, data)
+
+    def reply(self, status_code, data, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record_latency(time.monotonic() - self.start)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(FakeAPIHandler, self).log_message(format, *args)
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), reject=None, verbose=False,
+                 keep_records=False, fail_first=0, latency=0, error_rate=0,
+                 keep_latencies=False):
+        super(FakeAPIServer, self).__init__(address, FakeAPIHandler)
+        self.reject = reject
+        self.verbose = verbose
+        self.fail_first = fail_first
+        self.latency = latency
+        self.error_rate = error_rate
+        self.num_failed = 0
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        # path: number of records created
+        self.records_created = {}
+        # the records themselves, if keep_records (for tests)
+        self.records = [] if keep_records else None
+        # seconds taken to answer each request, if keep_latencies (for
+        # benchmark.py)
+        self.latencies = [] if keep_latencies else None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server_address[:2])
+
+    def is_rejected(self, record):
+        return bool(self.reject) and self.reject in json.dumps(record)
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def should_fail(self):
+        with self.lock:
+            if self.num_failed < self.fail_first:
+                self.num_failed += 1
+                return True
+            return False
+
+    def should_error(self):
+        return bool(self.error_rate) and random.random() < self.error_rate
+
+    def count_request(self, path, records):
+        with self.lock:
+            self.num_requests += 1
+            self.records_created[path] = \
+                self.records_created.get(path, 0) + len(records)
+            if self.records is not None:
+                self.records.extend(records)
+
+    def record_latency(self, latency):
+        if self.latencies is not None:
+            with self.lock:
+                self.latencies.append(latency)
+
+    def start(self):
+        '''Serves requests on a background thread (for tests).'''
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', default=8000, help='Port to listen on')
+@click.option('--reject', metavar='TEXT',
+              help='Reply 400 to records whose JSON contains this text')
+@click.option('--latency', type=float, default=0, metavar='SECONDS',
+              help='Average time to wait before replying')
+@click.option('--error-rate', type=float, default=0, metavar='FRACTION',
+              help='Reply 500 to this fraction of the requests e.g. 0.01')
+@click.option('--fail-first', type=int, default=0, metavar='N',
+              help='Reply 503 to the first N requests')
+@click.option('--verbose', is_flag=True, help='Log every request')
+def fake_api(host, port, reject, latency, error_rate, fail_first, verbose):
+    server = FakeAPIServer((host, port), reject=reject, verbose=verbose,
+                           fail_first=fail_first, latency=latency,
+                           error_rate=error_rate)
+    print('Fake API listening on {}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('{:,} requests, records created: {}'.format(
+        server.num_requests, server.records_created))
+
+
+if __name__ == '__main__':
+    fake_api()
@@ -0,0 +1,441 @@
+'''
+Geometries kept as flat arrays of coordinates, instead of the nested lists
+and tuples of GeoJSON. A float in a tuple of a list costs over 30 bytes as
+Python objects, but 8 bytes in an array, so this matters for importers that
+hold the shapes of a whole file - e.g. import_greenbelts.py, which merges the
+polygons of each greenbelt into a MultiPolygon before posting any of them.
+
+A Geometry is a Point, LineString, MultiLineString, Polygon or MultiPolygon,
+made of:
+
+    coordinates       array of x, y (and z, with 3 dimensions) of every
+                      vertex, one after another
+    ring_offsets      the vertex each ring (or line) starts at, and then the
+                      number of vertices
+    polygon_offsets   the ring each polygon starts at, and then the number of
+                      rings
+    z                 the z of every vertex of a 2D geometry that with_z()
+                      has given a third dimension, or None
+    integers          a bytearray with a 1 for each coordinate that was an
+                      int in the GeoJSON, so it is written as one again, or
+                      None if none were
+
+so a Polygon with a hole of 5 vertices, in a ring of 10, has ring_offsets
+[0, 10, 15] and polygon_offsets [0, 2]. The GeoJSON is only made when the
+payload is, with __geo_interface__.
+
+Full precision coordinates (e.g. 0.8607692231732531) make big payloads, so
+rounded() can round them to the PRECISION of their SRID, and simplified()
+can drop the vertices that barely change the shape.
+'''
+import itertools
+import math
+import operator
+from array import array
+
+import shapefile
+
+
+# decimal places of the coordinates of each SRID that are worth keeping:
+# 7 of a degree is about a centimetre, and the others are in metres
+PRECISION = {
+    4326: 7,
+    27700: 2,
+    3857: 2,
+}
+
+
+class Geometry(object):
+    # no __dict__, as there can be a lot of them
+    __slots__ = ('type', 'coordinates', 'dimensions', 'ring_offsets',
+                 'polygon_offsets', 'z', 'integers')
+
+    def __init__(self, geometry_type, coordinates, dimensions=2,
+                 ring_offsets=None, polygon_offsets=None, z=None,
+                 integers=None):
+        self.type = geometry_type
+        self.coordinates = coordinates
+        self.dimensions = dimensions
+        self.z = z
+        self.integers = integers
+        num_vertices = len(coordinates) // dimensions
+        self.ring_offsets = ring_offsets if ring_offsets is not None \
+            else array('i', [0, num_vertices])
+        self.polygon_offsets = polygon_offsets \
+            if polygon_offsets is not None \
+            else array('i', [0, len(self.ring_offsets) - 1])
+
+    @classmethod
+    def from_shape(cls, shape):
+        '''Returns the Geometry of a pyshp shape, without making its
+        __geo_interface__ where that can be helped.
+        '''
+        # older pyshp doesn't give points parts
+        num_parts = len(getattr(shape, 'parts', ()))
+        if shape.shapeType == shapefile.POINT and shape.points:
+            return cls('Point', flatten(shape.points[:1]))
+        if shape.shapeType == shapefile.POLYLINE and num_parts:
+            return cls(
+                'LineString' if num_parts == 1 else 'MultiLineString',
+                flatten(shape.points),
+                ring_offsets=array('i', list(shape.parts) + [
+                    len(shape.points)]))
+        if shape.shapeType == shapefile.POLYGON and num_parts == 1:
+            coordinates = flatten(shape.points)
+            # a clockwise ring is the outside of a polygon
+            if signed_area(coordinates) < 0:
+                return cls('Polygon', coordinates)
+        # which rings are the holes of which polygons is up to pyshp
+        return cls.from_geo_interface(shape.__geo_interface__)
+
+    @classmethod
+    def from_geo_interface(cls, geometry):
+        '''Returns the Geometry of a GeoJSON geometry dict.'''
+        geometry_type = geometry['type']
+        if geometry_type == 'Point':
+            polygons = [[[geometry['coordinates']]]]
+        elif geometry_type == 'LineString':
+            polygons = [[geometry['coordinates']]]
+        elif geometry_type in ('MultiLineString', 'Polygon'):
+            polygons = [geometry['coordinates']]
+        elif geometry_type == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            raise NotImplementedError(geometry_type)
+        dimensions = 2
+        for polygon in polygons:
+            for ring in polygon:
+                if ring and ring[0]:
+                    dimensions = len(ring[0])
+                    break
+            else:
+                continue
+            break
+        coordinates = array('d')
+        integers = bytearray()
+        ring_offsets = array('i', [0])
+        polygon_offsets = array('i', [0])
+        for polygon in polygons:
+            for ring in polygon:
+                values = list(itertools.chain.from_iterable(ring))
+                coordinates.extend(values)
+                integers.extend(isinstance(value, int) for value in values)
+                ring_offsets.append(len(coordinates) // dimensions)
+            polygon_offsets.append(len(ring_offsets) - 1)
+        return cls(geometry_type, coordinates, dimensions, ring_offsets,
+                   polygon_offsets, integers=integers if any(integers)
+                   else None)
+
+    @classmethod
+    def multipolygon(cls, dimensions=2):
+        '''Returns an empty MultiPolygon, to extend() with polygons.'''
+        return cls('MultiPolygon', array('d'), dimensions, array('i', [0]),
+                   array('i', [0]))
+
+    def num_vertices(self):
+        return len(self.coordinates) // self.dimensions
+
+    def num_polygons(self):
+        return len(self.polygon_offsets) - 1
+
+    def extend(self, other):
+        '''Adds the polygons of a Polygon or MultiPolygon to this
+        MultiPolygon.
+        '''
+        if self.type != 'MultiPolygon' or \
+                other.type not in ('Polygon', 'MultiPolygon'):
+            raise ValueError('Can only add a {} to a MultiPolygon, not to a '
+                             '{}'.format(other.type, self.type))
+        if (other.dimensions, other.z) != (self.dimensions, self.z):
+            raise ValueError('Can not add a geometry with {} dimensions and '
+                             'z {} to one with {} and {}'.format(
+                                 other.dimensions, other.z, self.dimensions,
+                                 self.z))
+        vertex_base = self.num_vertices()
+        ring_base = len(self.ring_offsets) - 1
+        if self.integers is not None or other.integers is not None:
+            self.integers = (self.integers or bytearray(
+                len(self.coordinates))) + (other.integers or bytearray(
+                    len(other.coordinates)))
+        self.coordinates.extend(other.coordinates)
+        self.ring_offsets.extend(array('i', [
+            offset + vertex_base for offset in other.ring_offsets[1:]]))
+        self.polygon_offsets.extend(array('i', [
+            offset + ring_base for offset in other.polygon_offsets[1:]]))
+
+    def with_z(self, z=0):
+        '''Returns a copy of the 2D geometry with a third dimension, of z at
+        every vertex. Only the one z is kept, rather than one per vertex, and
+        it stays an int if it is one, so its GeoJSON has e.g. [x, y, 0].
+        '''
+        if self.dimensions != 2 or self.z is not None:
+            raise ValueError('The geometry already has 3 dimensions')
+        return Geometry(self.type, array('d', self.coordinates), 2,
+                        array('i', self.ring_offsets),
+                        array('i', self.polygon_offsets), z,
+                        copy_of(self.integers))
+
+    def rounded(self, decimals):
+        '''Returns a copy with the coordinates rounded to that many decimal
+        places.
+        '''
+        coordinates = array('d', map(
+            round, self.coordinates, itertools.repeat(decimals)))
+        return Geometry(self.type, coordinates, self.dimensions,
+                        array('i', self.ring_offsets),
+                        array('i', self.polygon_offsets),
+                        None if self.z is None else round(self.z, decimals),
+                        copy_of(self.integers))
+
+    def simplified(self, tolerance):
+        '''Returns a copy without the vertices that are less than tolerance
+        from the line between the vertices either side of them (the
+        Douglas-Peucker algorithm). Rings keep at least 4 vertices, and lines
+        their ends, so no ring, line or polygon disappears.
+
+        The rings of polygons are simplified one at a time, which can leave
+        one crossing itself or another, or a hole outside the ring it was
+        in. Each ring like that is put back as it was, so the polygons stay
+        valid - they just aren't simplified as much as they could be.
+        '''
+        if self.type == 'Point':
+            return self
+        dimensions = self.dimensions
+        polygons = self.type in ('Polygon', 'MultiPolygon')
+        originals = []
+        rings = []
+        kept_vertices = []
+        for ring in range(len(self.ring_offsets) - 1):
+            start = self.ring_offsets[ring]
+            end = self.ring_offsets[ring + 1]
+            ring_coordinates = self.coordinates[
+                start * dimensions:end * dimensions]
+            kept = douglas_peucker(
+                ring_coordinates, dimensions, tolerance,
+                4 if polygons else 2)
+            originals.append(ring_coordinates)
+            rings.append(array('d', itertools.chain.from_iterable(
+                ring_coordinates[vertex * dimensions:
+                                 (vertex + 1) * dimensions]
+                for vertex in kept)))
+            kept_vertices.append([start + vertex for vertex in kept])
+        if polygons:
+            restore_invalid_rings(
+                rings, originals, self.polygon_offsets, dimensions)
+        coordinates = array('d')
+        ring_offsets = array('i', [0])
+        for ring_coordinates in rings:
+            coordinates.extend(ring_coordinates)
+            ring_offsets.append(len(coordinates) // dimensions)
+        integers = None
+        if self.integers is not None:
+            integers = bytearray()
+            for ring, ring_coordinates in enumerate(rings):
+                # the vertices of a ring that was put back are all there
+                vertices = range(
+                    self.ring_offsets[ring], self.ring_offsets[ring + 1]) \
+                    if ring_coordinates is originals[ring] \
+                    else kept_vertices[ring]
+                for vertex in vertices:
+                    integers += self.integers[
+                        vertex * dimensions:(vertex + 1) * dimensions]
+        return Geometry(self.type, coordinates, dimensions, ring_offsets,
+                        array('i', self.polygon_offsets), self.z, integers)
+
+    @property
+    def __geo_interface__(self):
+        polygons = [
+            [self.positions(ring)
+             for ring in range(self.polygon_offsets[polygon],
+                               self.polygon_offsets[polygon + 1])]
+            for polygon in range(self.num_polygons())]
+        if self.type == 'Point':
+            positions = polygons[0][0]
+            coordinates = positions[0] if positions else ()
+        elif self.type == 'LineString':
+            coordinates = polygons[0][0]
+        elif self.type in ('MultiLineString', 'Polygon'):
+            coordinates = polygons[0]
+        else:
+            coordinates = polygons
+        return {'type': self.type, 'coordinates': coordinates}
+
+    def positions(self, ring):
+        '''Returns the (x, y) or (x, y, z) of each vertex in a ring.'''
+        dimensions = self.dimensions
+        ring_coordinates = self.coordinates[
+            self.ring_offsets[ring] * dimensions:
+            self.ring_offsets[ring + 1] * dimensions]
+        if self.integers is not None:
+            ring_coordinates = [
+                int(value) if integer else value
+                for value, integer in zip(ring_coordinates, self.integers[
+                    self.ring_offsets[ring] * dimensions:
+                    self.ring_offsets[ring + 1] * dimensions])]
+        positions = zip(*[iter(ring_coordinates)] * dimensions)
+        if self.z is not None:
+            return [(x, y, self.z) for x, y in positions]
+        return list(positions)
+
+
+def copy_of(integers):
+    return None if integers is None else bytearray(integers)
+
+
+def flatten(points):
+    return array('d', itertools.chain.from_iterable(points))
+
+
+def signed_area(coordinates, dimensions=2):
+    '''Returns the area of a closed ring of coordinates, using their x and y
+    - negative if it goes clockwise.
+    '''
+    xs = coordinates[0::dimensions]
+    ys = coordinates[1::dimensions]
+    return (sum(map(operator.mul, xs, ys[1:])) -
+            sum(map(operator.mul, xs[1:], ys))) / 2.0
+
+
+def douglas_peucker(coordinates, dimensions, tolerance, min_vertices=2):
+    '''Returns the numbers of the vertices of a line (or ring) to keep, to
+    simplify it to within tolerance, using their x and y. At least
+    min_vertices are kept, if it has that many.
+    '''
+    num_vertices = len(coordinates) // dimensions
+    if num_vertices <= min_vertices:
+        return list(range(num_vertices))
+    xs = coordinates[0::dimensions]
+    ys = coordinates[1::dimensions]
+    keep = bytearray(num_vertices)
+    keep[0] = keep[-1] = 1
+    num_kept = 2
+    sections = [(0, num_vertices - 1)]
+    while sections:
+        first, last = sections.pop()
+        x1, y1, x2, y2 = xs[first], ys[first], xs[last], ys[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        furthest = None
+        # split at the furthest vertex regardless, until there are enough
+        furthest_distance = tolerance if num_kept >= min_vertices else -1.0
+        for vertex in range(first + 1, last):
+            if length:
+                distance = abs(dy * xs[vertex] - dx * ys[vertex] +
+                               x2 * y1 - y2 * x1) / length
+            else:
+                # the ends of a ring are the same vertex
+                distance = math.hypot(xs[vertex] - x1, ys[vertex] - y1)
+            if distance > furthest_distance:
+                furthest, furthest_distance = vertex, distance
+        if furthest is not None:
+            keep[furthest] = 1
+            num_kept += 1
+            sections.append((first, furthest))
+            sections.append((furthest, last))
+    return [vertex for vertex in range(num_vertices) if keep[vertex]]
+
+
+def restore_invalid_rings(rings, originals, polygon_offsets, dimensions):
+    '''Puts the original back in place of each simplified ring of the
+    polygons that is no longer valid: one with fewer than 4 vertices, that
+    has turned inside out, that crosses itself or another ring, or that a
+    hole of its polygon is no longer inside. It carries on until they are
+    all valid, as a ring that is put back can cross another simplified one.
+    '''
+    simplified = set(ring for ring in range(len(rings))
+                     if len(rings[ring]) != len(originals[ring]))
+    while simplified:
+        invalid = set(
+            ring for ring in simplified
+            if len(rings[ring]) < 4 * dimensions or
+            not signed_area(rings[ring], dimensions) *
+            signed_area(originals[ring], dimensions) > 0)
+        invalid.update(crossing_rings(rings, simplified, dimensions))
+        for polygon in range(len(polygon_offsets) - 1):
+            outer = polygon_offsets[polygon]
+            if outer not in simplified or outer in invalid:
+                continue
+            for hole in range(outer + 1, polygon_offsets[polygon + 1]):
+                # the first vertex of a hole is always kept, so it is still
+                # inside the original ring
+                if not inside_ring(rings[hole][0], rings[hole][1],
+                                   rings[outer], dimensions):
+                    invalid.add(outer)
+                    break
+        if not invalid:
+            return
+        for ring in invalid:
+            rings[ring] = originals[ring]
+        simplified -= invalid
+
+
+def crossing_rings(rings, simplified, dimensions):
+    '''Returns the rings numbered in simplified that cross themselves or
+    any of the other rings.
+
+    The segments are put in the cells of a grid that they overlap, so only
+    the segments in the same cell need to be compared.
+    '''
+    segments = []
+    for ring, coordinates in enumerate(rings):
+        xs = coordinates[0::dimensions]
+        ys = coordinates[1::dimensions]
+        segments.extend(zip(xs, ys, xs[1:], ys[1:], itertools.repeat(ring)))
+    if not segments:
+        return set()
+    # about a segment to a cell
+    size = sum(max(abs(x2 - x1), abs(y2 - y1))
+               for x1, y1, x2, y2, _ in segments) / len(segments) or 1.0
+    # the segments in each cell, and those of simplified rings
+    cells = {}
+    for segment in segments:
+        x1, y1, x2, y2, ring = segment
+        for column in range(int(math.floor(min(x1, x2) / size)),
+                            int(math.floor(max(x1, x2) / size)) + 1):
+            for row in range(int(math.floor(min(y1, y2) / size)),
+                             int(math.floor(max(y1, y2) / size)) + 1):
+                cell = cells.get((column, row))
+                if cell is None:
+                    cell = cells[column, row] = ([], [])
+                cell[0].append(segment)
+                if ring in simplified:
+                    cell[1].append(segment)
+    crossing = set()
+    for cell_segments, simplified_segments in cells.values():
+        for segment in simplified_segments:
+            if segment[4] in crossing:
+                continue
+            for other in cell_segments:
+                if segments_cross(segment, other):
+                    crossing.add(segment[4])
+                    if other[4] in simplified:
+                        crossing.add(other[4])
+                    break
+    return crossing
+
+
+def segments_cross(segment, other):
+    '''Returns True if two (x1, y1, x2, y2, ...) segments cross at a point
+    inside both of them, rather than just touching.
+    '''
+    ax, ay, bx, by = segment[:4]
+    cx, cy, dx, dy = other[:4]
+    side_c = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    side_d = (bx - ax) * (dy - ay) - (by - ay) * (dx - ax)
+    if not side_c * side_d < 0:
+        return False
+    side_a = (dx - cx) * (ay - cy) - (dy - cy) * (ax - cx)
+    side_b = (dx - cx) * (by - cy) - (dy - cy) * (bx - cx)
+    return side_a * side_b < 0
+
+
+def inside_ring(x, y, coordinates, dimensions):
+    '''Returns True if (x, y) is inside the closed ring.'''
+    xs = coordinates[0::dimensions]
+    ys = coordinates[1::dimensions]
+    inside = False
+    for x1, y1, x2, y2 in zip(xs, ys, xs[1:], ys[1:]):
+        if (y1 > y) != (y2 > y) and \
+                x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
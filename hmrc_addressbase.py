@@ -4,6 +4,11 @@ Setup:
 pip install requests_cache
 export HMRC_USER=<username>
 export HMRC_PASSWORD=<password>
+
+To use another server e.g. fake_api.py, which doesn't need throttling:
+
+export HMRC_API_URL=http://localhost:8000/v2/uk/addresses
+export HMRC_THROTTLE=0
 '''
 import os
 import time
@@ -12,15 +17,20 @@ import requests_cache
 
 requests_cache.install_cache('hmrc_api')
 
+HMRC_API_URL = os.environ.get(
+    'HMRC_API_URL', 'https://txm-al-demo.tax.service.gov.uk/v2/uk/addresses')
+# seconds to wait after each request that isn't answered from the cache
+HMRC_THROTTLE = float(os.environ.get('HMRC_THROTTLE', 1.0))
+
 
 def lookup_postcode_in_addressbase(postcode):
-    url = 'https://txm-al-demo.tax.service.gov.uk/v2/uk/addresses'
+    url = HMRC_API_URL
     # params e.g. ?postcode=CB21NS'
     params = dict(postcode=str(postcode.replace(' ', '')))
     return call_hmrc(url, params)
 
 def lookup_uprn_in_addressbase(uprn):
-    url = 'https://txm-al-demo.tax.service.gov.uk/v2/uk/addresses'
+    url = HMRC_API_URL
     # params e.g. ?uprn=200003273799'
     params = dict(uprn=int(uprn))
     return call_hmrc(url, params)
@@ -29,7 +39,8 @@ def call_hmrc(url, params):
     headers = {'user-agent': 'gds-import'}
     auth = (os.environ['HMRC_USER'], os.environ['HMRC_PASSWORD'])
     requests_session = requests_cache.CachedSession('hmrc_api')
-    requests_session.hooks = {'response': make_requests_throttle_hook(1.0)}
+    requests_session.hooks = {
+        'response': make_requests_throttle_hook(HMRC_THROTTLE)}
     response = requests_session.get(
         url, params=params, auth=auth, headers=headers)
     response.raise_for_status()
@@ -37,7 +48,7 @@ def call_hmrc(url, params):
 
 def make_requests_throttle_hook(timeout=1.0):
     def hook(response, *args, **kwargs):
-        if not getattr(response, 'from_cache', False):
+        if timeout and not getattr(response, 'from_cache', False):
             print('sleeping')
             time.sleep(timeout)
         return response
@@ -1,40 +1,38 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, transform_options)
+from mapping import Column, Constant, FieldMapping, Point
+from profiling import profile_options
 import click
 
 
+# the address CSVs have no header
+ADDRESS_COLUMNS = [
+    'uprn', 'organisation', 'address_line_1', 'address_line_2',
+    'address_line_3', 'city', 'county', 'postcode', 'country',
+    'latitude', 'longitude'
+]
+
+
 class AddressImportCommand(CSVImportCommand):
+    mapping = FieldMapping([
+        ('uprn', 'uprn'),
+        ('address_line_1', 'address_line_1'),
+        ('address_line_2', 'address_line_2'),
+        ('address_line_3', 'address_line_3'),
+        ('city', 'city'),
+        ('county', 'county'),
+        ('postcode', 'postcode'),
+        # as it has always been sent - the latitude
+        ('country_code', 'latitude'),
+        ('point', Point(Column('longitude', float),
+                        Column('latitude', float))),
+        ('srid', Constant(4326)),
+    ], columns=ADDRESS_COLUMNS)
 
     def process_row(self, row):
-        address = {
-            "uprn": row[0],
-            "address_line_1": row[2],
-            "address_line_2": row[3],
-            "address_line_3": row[4],
-            "city": row[5],
-            "county": row[6],
-            "postcode": row[7],
-            "country_code": row[9],
-            "point": {
-                "type": "Point",
-                "coordinates": [float(row[10]), float(row[9])]
-            },
-            "srid": 4326
-        }
-
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=address,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(row[0]))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    row[0], response.text))
+        address = self.extract(row)
+        return self.post_payload(address, address['uprn'])
 
 
 @click.command()
@@ -43,8 +41,14 @@ class AddressImportCommand(CSVImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/addresses/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_addresses(filenames, apiurl, apitoken):
-    command = AddressImportCommand(filenames, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@profile_options
+def import_addresses(filenames, apiurl, apitoken, **options):
+    command = AddressImportCommand(filenames, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
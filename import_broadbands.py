@@ -1,43 +1,37 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, transform_options)
+from mapping import Column, FieldMapping
+from profiling import profile_options
 import click
 
 
-class BroadbandImportCommand(CSVImportCommand):
+def clean_number(column):
+    clean = column.replace('<', '').replace('N/A', '')
+    return float(clean or '0')
+
 
-    def clean_column(self, column):
-        clean = column.replace('<', '').replace('N/A', '')
+def speed(name):
+    return Column(name + ' speed (Mbit/s)', clean_number)
 
-        if clean == '':
-            return '0'
-        else:
-            return clean
+
+class BroadbandImportCommand(CSVImportCommand):
+    # the columns of Ofcom's Connected Nations fixed broadband postcode CSV
+    mapping = FieldMapping([
+        ('postcode', 'postcode'),
+        ('speed_30_mb_percentage',
+         Column('SFBB availability (% premises)', clean_number)),
+        ('avg_download_speed', speed('Average download')),
+        ('min_download_speed', speed('Minimum download')),
+        ('max_download_speed', speed('Maximum download')),
+        ('avg_upload_speed', speed('Average upload')),
+        ('min_upload_speed', speed('Minimum upload')),
+        ('max_upload_speed', speed('Maximum upload')),
+    ])
 
     def process_row(self, row):
-        data = {
-            "postcode": row[0],
-            "speed_30_mb_percentage": float(self.clean_column(row[2])),
-            "avg_download_speed": float(self.clean_column(row[7])),
-            "min_download_speed": float(self.clean_column(row[9])),
-            "max_download_speed": float(self.clean_column(row[10])),
-            "avg_upload_speed": float(self.clean_column(row[15])),
-            "min_upload_speed": float(self.clean_column(row[17])),
-            "max_upload_speed": float(self.clean_column(row[18]))
-        }
-
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(row[0]))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    row[0], response.text))
+        data = self.extract(row)
+        return self.post_payload(data, data['postcode'])
 
 
 @click.command()
@@ -46,8 +40,15 @@ class BroadbandImportCommand(CSVImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/broadbands/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_broadbands(filenames, apiurl, apitoken):
-    command = BroadbandImportCommand(filenames, apiurl, apitoken, True)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@profile_options
+def import_broadbands(filenames, apiurl, apitoken, **options):
+    command = BroadbandImportCommand(
+        filenames, apiurl, apitoken, True, **options)
     command.run()
 
 if __name__ == '__main__':
@@ -1,48 +1,33 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, manifest_options, transform_options)
+from naptan import (
+    BUS_STOP_MAPPING, BUS_STOP_TYPES, NAPTAN_HEADER, STOP_TYPE)
+from profiling import profile_options
 import click
 
 
 class BusImportCommand(CSVImportCommand):
+    natural_key = 'amic_code'
+    mapping = BUS_STOP_MAPPING
 
     def __init__(self, *kargs, **kwargs):
         self.dry_run = kwargs.pop('dry_run')
-        kwargs['num_expected_records'] = 430525
         super(BusImportCommand, self).__init__(
             *kargs, **kwargs)
 
     def process_row(self, row):
         # Import the record only if it's one of the possible bus stops
-        if row[31] in ['BCT', 'BCE', 'BST', 'BCS', 'BCQ']:
-            bus_stop = {
-                "amic_code": row[0],
-                "point": {
-                    "type": "Point",
-                    "coordinates": [float(row[29]), float(row[30])]
-                },
-                "name": row[4],
-                "direction": row[14],
-                "area": row[19],
-                "road": row[10],
-                "nptg_code": row[1],
-                "srid": 4326
-            }
+        if row[STOP_TYPE] in BUS_STOP_TYPES:
+            bus_stop = self.extract(row)
+            return self.post_payload(bus_stop, bus_stop['amic_code'])
 
-            if self.dry_run:
-                return 'didn\'t import - dry run'
-            headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-            response = requests.post(
-                self.api_url,
-                json=bus_stop,
-                headers=headers)
-
-            if response.status_code == 201:
-                print('{0} imported correctly'.format(row[0]))
-            else:
-                print(
-                    'ERROR: could not import {0} because of {1}'.format(
-                        row[0], response.text))
+    def send_payload(self, payload, identifier=None):
+        # after the payload is made, so that --cache keeps it for the real
+        # import
+        if self.dry_run:
+            return 'didn\'t import - dry run'
+        return super(BusImportCommand, self).send_payload(payload, identifier)
 
 
 @click.command()
@@ -53,22 +38,17 @@ class BusImportCommand(CSVImportCommand):
 @click.option('--apitoken', help='API authentication token')
 @click.option('--dry-run', is_flag=True, help='Does everything up to but '
               'not including writing the data to the API')
-def import_busstops(filenames, apiurl, apitoken, dry_run):
-    expected_header = [
-        'ATCOCode', 'NaptanCode', 'PlateCode', 'CleardownCode', 'CommonName',
-        'CommonNameLang', 'ShortCommonName', 'ShortCommonNameLang', 'Landmark',
-        'LandmarkLang', 'Street', 'StreetLang', 'Crossing', 'CrossingLang',
-        'Indicator', 'IndicatorLang', 'Bearing', 'NptgLocalityCode',
-        'LocalityName', 'ParentLocalityName', 'GrandParentLocalityName',
-        'Town', 'TownLang', 'Suburb', 'SuburbLang', 'LocalityCentre',
-        'GridType', 'Easting', 'Northing', 'Longitude', 'Latitude', 'StopType',
-        'BusStopType', 'TimingStatus', 'DefaultWaitTime', 'Notes', 'NotesLang',
-        'AdministrativeAreaCode', 'CreationDateTime', 'ModificationDateTime',
-        'RevisionNumber', 'Modification', 'Status'
-    ]
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@manifest_options
+@profile_options
+def import_busstops(filenames, apiurl, apitoken, dry_run, **options):
     command = BusImportCommand(
-        filenames, apiurl, apitoken, True, expected_header=expected_header,
-        encoding='latin1', dry_run=dry_run)
+        filenames, apiurl, apitoken, True, expected_header=NAPTAN_HEADER,
+        encoding='latin1', dry_run=dry_run, **options)
     command.run()
 
 
@@ -1,11 +1,12 @@
 import itertools
 import csv
 import os
+import threading
 
-import requests
 import click
 
-from importers import CSVImportCommand
+from importers import CSVImportCommand, import_options
+from profiling import profile_options
 from utils import transform_polygons_to_multipolygon
 import hmrc_addressbase
 
@@ -16,17 +17,24 @@ class CambridgeLandsImportCommand(CSVImportCommand):
             voa_api_url, voa_token,
             skip_header=True, encoding=None,
             filter_uprn=None, vacant_csv_filename=None,
-            ):
-        self.api_url = api_url
-        self.token = token
+            **options):
+        if options.get('use_async'):
+            raise click.UsageError(
+                'The Cambridge import can\'t use --async, as its Land '
+                'Registry, AddressBase and VOA lookups would hold up the '
+                'event loop - use --workers instead')
+        super(CambridgeLandsImportCommand, self).__init__(
+            file_names, api_url, token, skip_header=skip_header,
+            encoding=encoding, **options)
         self.lr_api_url = lr_api_url
         self.lr_token = lr_token
+        self.lr_headers = {'Authorization': 'Token {0}'.format(lr_token)}
         self.voa_api_url = voa_api_url
         self.voa_token = voa_token
-        self.file_names = file_names
-        self.skip_header = skip_header
-        self.encoding = encoding
+        self.voa_headers = {'Authorization': 'Token {0}'.format(voa_token)}
         self.filter_uprn = filter_uprn
+        # rows may be processed on several worker threads
+        self.vacant_csv_lock = threading.Lock()
         if vacant_csv_filename:
             self.vacant_csv_filename = vacant_csv_filename
             self.vacant_csv_file = open(vacant_csv_filename, 'w', newline='')
@@ -42,8 +50,7 @@ class CambridgeLandsImportCommand(CSVImportCommand):
 
     def get_lr_data(self, uprn):
         url = '{0}uprns/{1}/'.format(self.lr_api_url, uprn)
-        headers = {'Authorization': 'Token {0}'.format(self.lr_token)}
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=self.lr_headers)
 
         if response.status_code == 404:
             return None
@@ -53,16 +60,14 @@ class CambridgeLandsImportCommand(CSVImportCommand):
     def get_lr_polygons_from_point(self, lat, long):
         url = '{url}polygons-from-point?lat={lat}&long={long}'.format(
             url=self.lr_api_url, lat=lat, long=long)
-        headers = {'Authorization': 'Token {0}'.format(self.lr_token)}
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=self.lr_headers)
 
         response.raise_for_status()
         return response.json()
 
     def get_voa_data(self, ba_ref):
         url = '{0}{1}'.format(self.voa_api_url, ba_ref)
-        headers = {'Authorization': 'Token {0}'.format(self.voa_token)}
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=self.voa_headers)
 
         if response.status_code == 404:
             return None
@@ -193,25 +198,15 @@ class CambridgeLandsImportCommand(CSVImportCommand):
             "srid": 4326
         }
 
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(uprn))
-            return 'processed ' + voa_status
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    uprn, response.text))
-            return 'Error saving data to API: {} {}'.format(
-                response.status_code, response.text)
+        # in bulk mode the outcome is a Future, until the batch is sent
+        return self.map_outcome(
+            self.post_payload(data, uprn),
+            lambda outcome: 'processed ' + voa_status
+            if outcome == 'imported' else outcome)
 
     def write_vacant_csv_row(self, site_dict):
-        self.vacant_csv.writerow(site_dict)
+        with self.vacant_csv_lock:
+            self.vacant_csv.writerow(site_dict)
 
     def postprocess(self):
         if self.vacant_csv_file and not self.filter_uprn:
@@ -255,9 +250,11 @@ class FinishedProcessingRow(Exception):
 @click.option('-u', '--filter-uprn', help='Filter rows for a particular UPRN')
 @click.option('--vacant-csv', metavar='FILENAME',
               help='Output the vacant sites to a CSV')
+@import_options
+@profile_options
 def import_cambridge(
         filenames, apiurl, apitoken, lrapiurl, lrtoken, voaapiurl, voatoken,
-        filter_uprn, vacant_csv):
+        filter_uprn, vacant_csv, **options):
     '''Import Cambridge vacant properties data as Locations.
 
     1. Get data from:
@@ -276,7 +273,7 @@ def import_cambridge(
     '''
     command = CambridgeLandsImportCommand(
         filenames, apiurl, apitoken, lrapiurl, lrtoken, voaapiurl, voatoken,
-        vacant_csv_filename=vacant_csv, filter_uprn=filter_uprn)
+        vacant_csv_filename=vacant_csv, filter_uprn=filter_uprn, **options)
     command.run()
 
 
@@ -1,42 +1,42 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, manifest_options, transform_options)
+from mapping import Column, Constant, FieldMapping, Point
+from profiling import profile_options
 import click
 
 
+# Code-Point Open's CSVs have no header
+CODEPOINT_COLUMNS = [
+    'Postcode', 'Positional_quality_indicator', 'Eastings', 'Northings',
+    'Country_code', 'NHS_regional_HA_code', 'NHS_HA_code', 'Admin_county_code',
+    'Admin_district_code', 'Admin_ward_code'
+]
+
+
+def normalise_postcode(postcode):
+    return postcode.strip().replace(' ', '').upper()
+
+
 class CodepointImportCommand(CSVImportCommand):
+    natural_key = 'postcode'
+    mapping = FieldMapping([
+        ('postcode', Column('Postcode', normalise_postcode)),
+        ('quality', 'Positional_quality_indicator'),
+        ('country', 'Country_code'),
+        ('nhs_region', 'NHS_regional_HA_code'),
+        ('nhs_health_authority', 'NHS_HA_code'),
+        ('county', 'Admin_county_code'),
+        ('district', 'Admin_district_code'),
+        ('ward', 'Admin_ward_code'),
+        ('point', Point(Column('Eastings', float),
+                        Column('Northings', float))),
+        ('srid', Constant(27700)),
+    ], columns=CODEPOINT_COLUMNS)
 
     def process_row(self, row):
-        postcode = row[0].strip().replace(' ', '').upper()
-
-        data = {
-            "postcode": postcode,
-            "quality": row[1],
-            "country": row[4],
-            "nhs_region": row[5],
-            "nhs_health_authority": row[6],
-            "county": row[7],
-            "district": row[8],
-            "ward": row[9],
-            "point": {
-                "type": "Point",
-                "coordinates": [float(row[2]), float(row[3])]
-            },
-            "srid": 27700
-        }
-
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(postcode))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    postcode, response.text))
+        data = self.extract(row)
+        return self.post_payload(data, data['postcode'])
 
 
 @click.command()
@@ -45,8 +45,15 @@ class CodepointImportCommand(CSVImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/codepoints/', nargs=1, help='API url')
 @click.option('--apitoken', nargs=1, help='API authentication token')
-def import_codepoints(filenames, apiurl, apitoken):
-    command = CodepointImportCommand(filenames, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@manifest_options
+@profile_options
+def import_codepoints(filenames, apiurl, apitoken, **options):
+    command = CodepointImportCommand(filenames, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
@@ -1,35 +1,67 @@
 '''
 Imports Greenbelt shapefiles into landavailability-api.
 
-NB this script uses 2.8GB memory to store all the polygons before importing
-them. This is needed to aggregate them.
+The polygons of each greenbelt are aggregated into a MultiPolygon, which is
+imported as soon as the greenbelt's last record has been read. Greenbelts
+whose records are split up by another's are kept on disk in the meantime
+(see spill.py), so only one greenbelt is held in memory at a time - rather
+than all of them, which used to take 2.8GB. The polygons are kept as flat
+arrays of coordinates (see geometry.py).
 
 Example usage:
 
     curl 'http://maps.communities.gov.uk/geoserver/dclg_inspire/ows?service=WFS&version=2.0.0&request=GetFeature&typeName=dclg_inspire:Local_Authority_Greenbelt_boundaries_2013-14&outputFormat=shape-zip&srsName=EPSG:4326' -o ~/Downloads/greenbelt.shp.zip
-    mkdir ~/Downloads/greenbelt
-    unzip ~/Downloads/greenbelt.shp.zip -d ~/Downloads/greenbelt
     workon landavailability-import
-    python import_greenbelts.py --filename ~/Downloads/greenbelt/Local_Authority_Greenbelt_boundaries_2013-14.shp --apiurl http://localhost:8000/api/greenbelts/ --apitoken $API_LOCAL_TOKEN
-'''
-import sys
+    python import_greenbelts.py --filename ~/Downloads/greenbelt.shp.zip --apiurl http://localhost:8000/api/greenbelts/ --apitoken $API_LOCAL_TOKEN
 
-import requests
+The shapefile is read straight out of the zip file, without unzipping it.
+'''
 import click
 
-from importers import ShapefileImportCommand
-from loopstats import LoopStats
+from geometry import Geometry
+from importers import ShapefileImportCommand, geometry_options
+from inputs import close_shapefile, open_shapefile
+from profiling import profile_options
+from spill import SpillFile
 
 
 class GreenbeltsImportCommand(ShapefileImportCommand):
 
-    def __init__(self, file_name, api_url, token, trial_run):
+    def __init__(self, file_name, api_url, token, trial_run, **options):
         assert api_url.endswith('/api/greenbelts/')
-        self.greenbelts = {}
-        self.processed_identifiers = set()
+        # the greenbelt whose records are being read
+        self.greenbelt = None
+        # the number of each greenbelt's last record, to import it then
+        self.last_records = None
+        self.num_records_read = 0
+        # the greenbelts whose records were interrupted by another's
+        self.spilled = None
+        self.greenbelt_stats = None
         self.trial_run = trial_run
         super(GreenbeltsImportCommand, self).__init__(
-            file_name, api_url, token)
+            file_name, api_url, token, **options)
+
+    def run(self):
+        if self.trial_run:
+            print('Skipping import (because --trial-run)')
+        shp_reader = open_shapefile(self.file_name)
+        try:
+            self.last_records = last_records(shp_reader)
+        finally:
+            close_shapefile(shp_reader)
+        self.greenbelt_stats = self.create_loopstats(len(self.last_records))
+        with SpillFile() as self.spilled:
+            super(GreenbeltsImportCommand, self).run()
+
+    def process_shape_record(self, record):
+        index = self.num_records_read
+        self.num_records_read += 1
+        outcome = super(GreenbeltsImportCommand, self).process_shape_record(
+            record)
+        identifier = greenbelt_identifier(record.record)
+        if index == self.last_records[identifier]:
+            self.import_greenbelt(identifier)
+        return outcome
 
     def process_record(self, record):
         # e.g. ['Liverpool, Manchester and West Yorks Greenbelt',
@@ -47,56 +79,72 @@ class GreenbeltsImportCommand(ShapefileImportCommand):
         # ['Stoke Greenbelt', 'Newcastle-under-Lyme District (B)', 'E07000195', 13.3962570581, 3.27651873009]
         # ['Stoke Greenbelt', 'Newcastle-under-Lyme District (B)', 'E07000195', 109.047552065, 8.93446203709]
         # ['Stoke Greenbelt', 'Newcastle-under-Lyme District (B)', 'E07000195', 5.47853192949, 1.2090565881]
-        greenbelt_identifier = '{} | {}'.format(greenbelt_name, la_name)
-
-        if greenbelt_identifier not in self.greenbelts:
-            self.greenbelts[greenbelt_identifier] = dict(
+        # Each greenbelt is imported after its last record, so only the
+        # greenbelt being read is kept in memory, and any that are
+        # interrupted by another one are spilled to disk until they continue.
+        identifier = greenbelt_identifier(record.record)
+
+        if self.greenbelt is not None and \
+                self.greenbelt['greenbelt_identifier'] != identifier:
+            self.spilled.add(self.greenbelt['greenbelt_identifier'],
+                             self.greenbelt)
+            self.greenbelt = None
+        if self.greenbelt is None:
+            result = 'added to existing greenbelt' \
+                if identifier in self.spilled else 'new greenbelt'
+            self.greenbelt = dict(
+                greenbelt_identifier=identifier,
                 greenbelt_name=greenbelt_name,
                 la_name=la_name,
                 la_ons_id=la_ons_id,
                 perimeter_km=0.0,
                 area_ha=0.0,
-                shape={
-                    "type": "MultiPolygon",
-                    "coordinates": []
-                    }
+                shape=Geometry.multipolygon()
                 )
-            result = 'new greenbelt'
         else:
             result = 'added to existing greenbelt'
-        greenbelt = self.greenbelts[greenbelt_identifier]
+        greenbelt = self.greenbelt
         greenbelt['perimeter_km'] += perimeter_km
         greenbelt['area_ha'] += area_ha
-        shape = record.shape.__geo_interface__
-        if shape['type'] == 'MultiPolygon':
-            greenbelt['shape']['coordinates'].extend(
-                shape['coordinates'])
-        elif shape['type'] == 'Polygon':
-            greenbelt['shape']['coordinates'].append(
-                shape['coordinates'])
-        else:
+        shape = Geometry.from_shape(record.shape)
+        if shape.type not in ('Polygon', 'MultiPolygon'):
             raise Exception(
                 'ERROR: not sure how to deal with shape {}'.format(
-                    shape['type']))
+                    shape.type))
+        greenbelt['shape'].extend(shape)
         return result
 
-    def postprocess(self):
-        if self.trial_run:
-            print('Skipping import (because --trial-run)')
-            sys.exit(0)
+    def import_greenbelt(self, identifier):
+        '''Imports a greenbelt once all its records have been read, merging
+        any parts of it that were spilled.
+        '''
+        parts = self.spilled.pop(identifier)
+        if self.greenbelt is not None and \
+                self.greenbelt['greenbelt_identifier'] == identifier:
+            parts.append(self.greenbelt)
+            self.greenbelt = None
+        if not parts:
+            # its records had no shapes
+            return
+        greenbelt = parts[0]
+        for part in parts[1:]:
+            greenbelt['perimeter_km'] += part['perimeter_km']
+            greenbelt['area_ha'] += part['area_ha']
+            greenbelt['shape'].extend(part['shape'])
+        outcome = self.import_(**greenbelt)
+        self.greenbelt_stats.add(outcome, identifier)
+        self.greenbelt_stats.print_every_x_seconds(
+            self.options.reporting.every)
 
-        loop_stats = LoopStats(len(self.greenbelts))
-        print ('\nImporting {} greenbelts'.format(len(self.greenbelts)))
-        for greenbelt_identifier, greenbelt in self.greenbelts.items():
-            outcome = self.import_(greenbelt_identifier=greenbelt_identifier,
-                                   **greenbelt)
-            loop_stats.add(outcome, greenbelt_identifier)
-            loop_stats.print_every_x_iterations(10)
-        print(loop_stats)
+    def postprocess(self):
+        print('\nImported greenbelts:')
+        self.greenbelt_stats.report()
 
     def import_(self, greenbelt_identifier=None, greenbelt_name=None,
                 la_name=None, la_ons_id=None, perimeter_km=None, area_ha=None,
                 shape=None):
+        if self.trial_run:
+            return 'not imported (--trial-run)'
         print('Importing: {} / {}'.format(greenbelt_name, la_name))
 
         data = {
@@ -109,62 +157,49 @@ class GreenbeltsImportCommand(ShapefileImportCommand):
             "area": round(float(area_ha), 2),
             "perimeter": round(
                 float(perimeter_km), 2),
-            "geom": add_third_dimension(shape),
+            "geom": self.geojson(shape, 4326, z=0),
             "srid": 4326
         }
 
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 404:
-            print('API URL returns 404 Not Found: {}'.format(self.api_url))
-            sys.exit(1)
-        if response.status_code != 201:
-            print(
-                'ERROR: could not import {} - {} {}'.format(
-                    greenbelt_name, response.status_code, response.text))
-            return 'ERROR: could not import - {} {}'.format(
-                response.status_code, response.text)
-
-        #print('{0} imported correctly'.format(greenbelt_name))
-        return 'imported'
-
-def add_third_dimension(shape):
-    # e.g. {'type': 'Polygon', 'coordinates': (((-1.30442, 53.31290), ...))}
-    if shape['type'] == 'Polygon':
-        shape['coordinates'] = \
-            add_third_dimension_to_polygon(shape['coordinates'])
-    elif shape['type'] == 'MultiPolygon':
-        shape['coordinates'] = [
-            add_third_dimension_to_polygon(polygon)
-            for polygon in shape['coordinates']
-            ]
-    else:
-        raise NotImplementedError(shape['type'])
-    return shape
-
-def add_third_dimension_to_polygon(polygon):
-    return [add_third_dimension_to_ring(ring)
-            for ring in polygon]
-
-def add_third_dimension_to_ring(ring):
-    # e.g. ((-1.30442, 53.31290), ...)
-    return [(x, y, 0) for x, y in ring]
+        return self.post_payload(data, greenbelt_name)
+
+    def response_outcome(self, status_code, text, identifier=None):
+        # record it against the greenbelt and carry on, rather than exiting
+        # partway through and losing the rest of the import
+        if status_code == 404:
+            print('ERROR: could not import {} - API URL returns 404 Not '
+                  'Found: {}'.format(identifier, self.api_url))
+            return 'ERROR: API URL returns 404 Not Found'
+        return super(GreenbeltsImportCommand, self).response_outcome(
+            status_code, text, identifier)
+
+
+def greenbelt_identifier(record):
+    # e.g. 'Stoke Greenbelt | Newcastle-under-Lyme District (B)'
+    return '{} | {}'.format(record[0], record[1])
+
+
+def last_records(shp_reader):
+    '''Returns the number of the last record of each greenbelt, from the
+    .dbf alone, without reading the shapes.
+    '''
+    return {greenbelt_identifier(record): index
+            for index, record in enumerate(shp_reader.iterRecords())}
 
 @click.command()
-@click.option('--filename', help='Greenbelts *.shp file (ie unzipped)')
+@click.option('--filename',
+              help='Greenbelts *.shp file, or the .zip file it came in')
 @click.option('--apiurl',
               default='http://localhost:8000/api/greenbelts/',
               help='Land Availability API url, with ending /api/greenbelts/')
 @click.option('--apitoken', help='API authentication token')
 @click.option('--trial-run', is_flag=True, help='Does everything up to but '
               'not including writing the data to the API')
-def import_greenbelts(filename, apiurl, apitoken, trial_run):
-    command = GreenbeltsImportCommand(filename, apiurl, apitoken, trial_run)
+@geometry_options
+@profile_options
+def import_greenbelts(filename, apiurl, apitoken, trial_run, **options):
+    command = GreenbeltsImportCommand(
+        filename, apiurl, apitoken, trial_run, **options)
     command.run()
 
 
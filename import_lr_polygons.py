@@ -1,5 +1,7 @@
-from importers import ShapefileImportCommand
-import requests
+from importers import (
+    ShapefileImportCommand, cache_option, checkpoint_options,
+    geometry_options, import_options, jobs_option, transform_options)
+from profiling import profile_options
 import click
 from datetime import datetime
 
@@ -12,7 +14,7 @@ class PolygonsImportCommand(ShapefileImportCommand):
         insert_date = record.record[2]
         update_date = record.record[3]
         status = record.record[4]
-        geometry = record.shape.__geo_interface__
+        geometry = self.geojson(record.shape, 27700)
 
         data = {
             "id": polygon_id,
@@ -24,19 +26,7 @@ class PolygonsImportCommand(ShapefileImportCommand):
             "srid": 27700
         }
 
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(polygon_id))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    polygon_id, response.text))
+        return self.post_payload(data, polygon_id)
 
 
 @click.command()
@@ -45,8 +35,15 @@ class PolygonsImportCommand(ShapefileImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/polygons/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_polygons(filename, apiurl, apitoken):
-    command = PolygonsImportCommand(filename, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@geometry_options
+@profile_options
+def import_polygons(filename, apiurl, apitoken, **options):
+    command = PolygonsImportCommand(filename, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
@@ -1,32 +1,21 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, transform_options)
+from mapping import FieldMapping
+from profiling import profile_options
 import click
 
 
 class UprnsImportCommand(CSVImportCommand):
+    # the CSV of Land Registry title numbers and UPRNs has no header
+    mapping = FieldMapping([
+        ('uprn', 'UPRN'),
+        ('title', 'Title'),
+    ], columns=['Title', 'UPRN'])
 
     def process_row(self, row):
-        uprn = row[1]
-        title = row[0]
-
-        data = {
-            "uprn": uprn,
-            "title": title
-        }
-
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(row[0]))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    uprn, response.text))
+        data = self.extract(row)
+        return self.post_payload(data, data['uprn'])
 
 
 @click.command()
@@ -35,8 +24,14 @@ class UprnsImportCommand(CSVImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/uprns/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_uprns(filenames, apiurl, apitoken):
-    command = UprnsImportCommand(filenames, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@profile_options
+def import_uprns(filenames, apiurl, apitoken, **options):
+    command = UprnsImportCommand(filenames, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
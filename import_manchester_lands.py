@@ -1,13 +1,15 @@
-import requests
 import click
 import json
 
+from importers import ImportCommand, geometry_options, import_options
+from profiling import profile_options
 
-class ManchesterLandsImportCommand(object):
 
-    def __init__(self, file_name, api_url, token):
-        self.api_url = api_url
-        self.token = token
+class ManchesterLandsImportCommand(ImportCommand):
+
+    def __init__(self, file_name, api_url, token, **options):
+        super(ManchesterLandsImportCommand, self).__init__(
+            api_url, token, **options)
         self.file_name = file_name
 
     def run(self):
@@ -15,8 +17,12 @@ class ManchesterLandsImportCommand(object):
             with open(self.file_name) as jsonfile:
                 data = json.load(jsonfile)
 
-            for feature in data['features']:
-                self.process_feature(feature)
+            loopstats = self.create_loopstats(len(data['features']))
+            self.process_all(
+                ((feature.get('uprn'), feature)
+                 for feature in data['features']),
+                self.process_feature, loopstats)
+            loopstats.report()
 
     def process_feature(self, feature):
         uprn = feature.get('uprn')
@@ -28,25 +34,14 @@ class ManchesterLandsImportCommand(object):
             data = {
                 "uprn": uprn,
                 "name": feature['properties']['address'],
-                "geom": feature['geometry'],
+                "geom": self.geojson(feature['geometry'], 3857),
                 "authority": feature['properties']['la'],
                 "owner": feature['properties']['la'],
                 "srid": 3857
             }
 
-            headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-            response = requests.post(
-                self.api_url,
-                json=data,
-                headers=headers)
-
-            if response.status_code == 201:
-                print('{0} imported correctly'.format(uprn))
-            else:
-                print(
-                    'ERROR: could not import {0} because of {1}'.format(
-                        uprn, response.text))
+            return self.post_payload(data, uprn)
+        return 'skipped - no uprn or not a MultiPolygon'
 
 
 @click.command()
@@ -55,8 +50,12 @@ class ManchesterLandsImportCommand(object):
     '--apiurl',
     default='http://localhost:8000/api/locations/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_lands(filename, apiurl, apitoken):
-    command = ManchesterLandsImportCommand(filename, apiurl, apitoken)
+@import_options
+@geometry_options
+@profile_options
+def import_lands(filename, apiurl, apitoken, **options):
+    command = ManchesterLandsImportCommand(
+        filename, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
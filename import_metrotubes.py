@@ -1,38 +1,20 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, transform_options)
+from naptan import (
+    METRO_TUBE_MAPPING, METRO_TUBE_STOP_TYPES, NAPTAN_HEADER, STOP_TYPE)
+from profiling import profile_options
 import click
 
 
 class MetroTubeImportCommand(CSVImportCommand):
+    mapping = METRO_TUBE_MAPPING
 
     def process_row(self, row):
         try:
-            if row[31] in ['TMU', 'MET', 'PLT']:
-                data = {
-                    "atco_code": row[0],
-                    "name": row[4],
-                    "naptan_code": row[1],
-                    "locality": row[18],
-                    "point": {
-                        "type": "Point",
-                        "coordinates": [float(row[29]), float(row[30])]
-                    },
-                    "srid": 4326
-                }
-
-                headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-                response = requests.post(
-                    self.api_url,
-                    json=data,
-                    headers=headers)
-
-                if response.status_code == 201:
-                    print('{0} imported correctly'.format(row[0]))
-                else:
-                    print(
-                        'ERROR: could not import {0} because of {1}'.format(
-                            row[0], response.text))
+            if row[STOP_TYPE] in METRO_TUBE_STOP_TYPES:
+                data = self.extract(row)
+                return self.post_payload(data, data['atco_code'])
         except UnicodeDecodeError as ex:
             print(
                 'ERROR: could not import {0} because of {1}'.format(row, ex))
@@ -44,22 +26,16 @@ class MetroTubeImportCommand(CSVImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/metrotubes/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_metrotubes(filenames, apiurl, apitoken):
-    expected_header = [
-        'ATCOCode', 'NaptanCode', 'PlateCode', 'CleardownCode', 'CommonName',
-        'CommonNameLang', 'ShortCommonName', 'ShortCommonNameLang',	'Landmark',
-        'LandmarkLang',	'Street', 'StreetLang',	'Crossing',	'CrossingLang',
-        'Indicator', 'IndicatorLang', 'Bearing', 'NptgLocalityCode',
-        'LocalityName',	'ParentLocalityName', 'GrandParentLocalityName',
-        'Town', 'TownLang',	'Suburb', 'SuburbLang',	'LocalityCentre',
-        'GridType',	'Easting', 'Northing', 'Longitude',	'Latitude',	'StopType',
-        'BusStopType', 'TimingStatus', 'DefaultWaitTime', 'Notes', 'NotesLang',
-        'AdministrativeAreaCode', 'CreationDateTime', 'ModificationDateTime',
-        'RevisionNumber', 'Modification', 'Status'
-    ]
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@profile_options
+def import_metrotubes(filenames, apiurl, apitoken, **options):
     command = MetroTubeImportCommand(
         filenames, apiurl, apitoken, True, encoding='ISO-8859-1',
-        expected_header=expected_header)
+        expected_header=NAPTAN_HEADER, **options)
     command.run()
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
-from importers import ShapefileImportCommand
-import requests
+from importers import (
+    ShapefileImportCommand, cache_option, checkpoint_options,
+    geometry_options, import_options, jobs_option, transform_options)
+from profiling import profile_options
 import click
 
 
@@ -9,23 +11,11 @@ class MotorwaysImportCommand(ShapefileImportCommand):
         data = {
             "identifier": record.record[0],
             "number": record.record[1],
-            "point": record.shape.__geo_interface__,
+            "point": self.geojson(record.shape, 27700),
             "srid": 27700
         }
 
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(record.record[0]))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    record.record[0], response.text))
+        return self.post_payload(data, record.record[0])
 
 
 @click.command()
@@ -34,8 +24,15 @@ class MotorwaysImportCommand(ShapefileImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/motorways/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_motorways(filename, apiurl, apitoken):
-    command = MotorwaysImportCommand(filename, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@geometry_options
+@profile_options
+def import_motorways(filename, apiurl, apitoken, **options):
+    command = MotorwaysImportCommand(filename, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
@@ -0,0 +1,184 @@
+'''
+Imports the bus stops, metro/tube stops and train stops from NaPTAN's
+Stops.csv in a single pass over the file, instead of running
+import_busstops.py, import_metrotubes.py and import_trainstops.py, which each
+parse all of it.
+
+Each row is sent to the endpoint for its StopType, and the outcomes are
+counted separately for each endpoint e.g. "bus stops: imported". Lines whose
+StopType none of the endpoints want aren't even parsed.
+
+Example usage:
+
+    python import_naptan.py Stops.csv --apitoken $API_LOCAL_TOKEN --workers 8
+'''
+import collections
+import re
+
+import click
+
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    transform_options)
+from import_busstops import BusImportCommand
+from import_metrotubes import MetroTubeImportCommand
+from import_trainstops import TrainImportCommand
+from naptan import (
+    BUS_STOP_TYPES, METRO_TUBE_STOP_TYPES, NAPTAN_HEADER, STOP_TYPE,
+    TRAIN_STOP_TYPES)
+from profiling import profile_options
+
+
+NOT_WANTED = 'not a bus, metro/tube or train stop'
+
+
+def prefix_pattern(words):
+    '''Returns a regex matching any of the words, with their common prefixes
+    factored out e.g. 'BC(?:E|T)|MET' - which re searches for several times
+    faster than a plain 'BCE|BCT|MET'.
+    '''
+    by_first = collections.defaultdict(list)
+    for word in words:
+        by_first[word[:1]].append(word[1:])
+    alternatives = []
+    for first, rests in sorted(by_first.items()):
+        if not first:
+            continue
+        if len(rests) == 1:
+            alternatives.append(re.escape(first + rests[0]))
+        else:
+            optional = '?' if '' in rests else ''
+            alternatives.append('{}(?:{}){}'.format(
+                re.escape(first), prefix_pattern(rests), optional))
+    return '|'.join(alternatives)
+
+
+# Lines with one of the wanted StopTypes anywhere in them. It's only a quick
+# first check, so it doesn't matter that other columns might match too.
+WANTED_LINE = re.compile(prefix_pattern(
+    BUS_STOP_TYPES | METRO_TUBE_STOP_TYPES | TRAIN_STOP_TYPES))
+
+
+class Destination(object):
+    '''One of the endpoints the rows are sent to, with the ImportCommand that
+    makes their payloads and uploads them.
+    '''
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+
+    def label(self, outcome):
+        '''Returns the outcome of a row, marked with the destination - or a
+        Future or Task of it, if the outcome isn't known yet.
+        '''
+        return self.command.map_outcome(
+            outcome, lambda outcome: '{}: {}'.format(
+                self.name, outcome or 'processed'))
+
+
+class NaptanImportCommand(CSVImportCommand):
+    def __init__(self, file_names, bus_url, metro_tube_url, train_url, token,
+                 **options):
+        if options.get('bulk_url'):
+            raise click.UsageError(
+                '--bulk-url can\'t be used for several endpoints - each gets '
+                'its batches at its own url')
+        super(NaptanImportCommand, self).__init__(
+            file_names, None, token, skip_header=True, encoding='latin1',
+            expected_header=NAPTAN_HEADER, **options)
+        self.destinations = [
+            Destination('bus stops', BusImportCommand(
+                file_names, bus_url, token, dry_run=False, **options)),
+            Destination('metro/tube stops', MetroTubeImportCommand(
+                file_names, metro_tube_url, token, **options)),
+            Destination('train stops', TrainImportCommand(
+                file_names, train_url, token, **options)),
+        ]
+        # StopType: Destination
+        self.routes = {}
+        for index, (destination, stop_types) in enumerate(zip(
+                self.destinations, (BUS_STOP_TYPES, METRO_TUBE_STOP_TYPES,
+                                    TRAIN_STOP_TYPES))):
+            destination.command.extract = destination.command.mapping \
+                .compile(NAPTAN_HEADER)
+            destination.command.cache_target = index
+            # the destinations upload on this command's worker threads, so
+            # add their upload time to the same thread's total
+            destination.command.local = self.local
+            for stop_type in stop_types:
+                self.routes[stop_type] = destination
+
+    def filter_lines(self, lines, skip):
+        '''Skips the lines without one of the wanted StopTypes, as long as
+        they aren't part of a row that spans several lines.
+        '''
+        search = WANTED_LINE.search
+        in_quotes = False
+        for line in lines:
+            quotes = line.count('"') % 2
+            if not in_quotes and not quotes and search(line) is None:
+                skip(NOT_WANTED, line[:line.find(',')].strip('"'))
+                continue
+            if quotes:
+                in_quotes = not in_quotes
+            yield line
+
+    def process_row(self, row):
+        destination = self.routes.get(row[STOP_TYPE])
+        if destination is None:
+            return NOT_WANTED
+        return destination.label(self.prepare(destination).process_row(row))
+
+    def process_cached(self, entry):
+        iteration_id, outcome, payloads = entry
+        for target, identifier, payload in payloads:
+            destination = self.destinations[target]
+            outcome = destination.label(
+                self.prepare(destination).post_payload(payload, identifier))
+        return outcome
+
+    def prepare(self, destination):
+        '''Returns the command of the destination, ready to upload a row.'''
+        command = destination.command
+        # time the stages in this import's LoopStats, and upload on its
+        # event loop with --async
+        command.stage_stats = self.stage_stats
+        command.async_loop = self.async_loop
+        command.async_session = self.async_session
+        return command
+
+    def flush_batches(self):
+        for destination in self.destinations:
+            destination.command.flush_batches()
+
+    def save_manifest(self):
+        for destination in self.destinations:
+            destination.command.save_manifest()
+
+
+@click.command()
+@click.argument('filenames', nargs=-1, type=click.Path())
+@click.option(
+    '--bus-url', default='http://localhost:8000/api/busstops/',
+    help='API url for the bus stops')
+@click.option(
+    '--metro-tube-url', default='http://localhost:8000/api/metrotubes/',
+    help='API url for the metro and tube stops')
+@click.option(
+    '--train-url', default='http://localhost:8000/api/trainstops/',
+    help='API url for the train stops')
+@click.option('--apitoken', help='API authentication token')
+@import_options
+@checkpoint_options
+@cache_option
+@transform_options
+@profile_options
+def import_naptan(filenames, bus_url, metro_tube_url, train_url, apitoken,
+                  **options):
+    command = NaptanImportCommand(
+        filenames, bus_url, metro_tube_url, train_url, apitoken, **options)
+    command.run()
+
+
+if __name__ == '__main__':
+    import_naptan()
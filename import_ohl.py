@@ -1,9 +1,13 @@
-from importers import ShapefileImportCommand
-import requests
+from importers import (
+    ShapefileImportCommand, cache_option, checkpoint_options,
+    geometry_options, import_options, jobs_option, manifest_options,
+    transform_options)
+from profiling import profile_options
 import click
 
 
 class OverheadLinesImportCommand(ShapefileImportCommand):
+    natural_key = 'gdo_gid'
 
     def process_record(self, record):
         data = {
@@ -15,23 +19,11 @@ class OverheadLinesImportCommand(ShapefileImportCommand):
             "operating": str(record.record[5]),
             "circuit_1": str(record.record[6]),
             "circuit_2": str(record.record[7]),
-            "geom": record.shape.__geo_interface__,
+            "geom": self.geojson(record.shape, 27700),
             "srid": 27700
         }
 
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-        response = requests.post(
-            self.api_url,
-            json=data,
-            headers=headers)
-
-        if response.status_code == 201:
-            print('{0} imported correctly'.format(record.record[0]))
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    record.record[0], response.text))
+        return self.post_payload(data, record.record[0])
 
 
 @click.command()
@@ -40,8 +32,16 @@ class OverheadLinesImportCommand(ShapefileImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/overheadlines/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_overheadlines(filename, apiurl, apitoken):
-    command = OverheadLinesImportCommand(filename, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@manifest_options
+@geometry_options
+@profile_options
+def import_overheadlines(filename, apiurl, apitoken, **options):
+    command = OverheadLinesImportCommand(filename, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
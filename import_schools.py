@@ -1,48 +1,47 @@
-from importers import CSVImportCommand
-import requests
+from importers import (
+    CSVImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, manifest_options, transform_options)
+from mapping import Column, Constant, FieldMapping, Point
+from profiling import profile_options
 import click
 
 
+def school_type(type_of_establishment):
+    if 'Primary' in type_of_establishment:
+        return 'PRIMARY'
+    elif 'Secondary' in type_of_establishment:
+        return 'SECONDARY'
+    return 'UNKNOWN'
+
+
+def int_or_zero(column):
+    return int(column) if column else 0
+
+
+def remove_spaces(column):
+    return column.replace(' ', '')
+
+
 class SchoolsImportCommand(CSVImportCommand):
+    natural_key = 'urn'
+    # the columns of Edubase's edubasealldata CSV
+    mapping = FieldMapping([
+        ('urn', 'URN'),
+        ('la_name', 'LA (name)'),
+        ('school_name', 'EstablishmentName'),
+        ('school_type', Column('PhaseOfEducation (name)', school_type)),
+        ('school_capacity', Column('SchoolCapacity', int_or_zero)),
+        ('school_pupils', Column('NumberOfPupils', int_or_zero)),
+        ('postcode', Column('Postcode', remove_spaces)),
+        ('point', Point(Column('Easting', float), Column('Northing', float))),
+        ('srid', Constant(27700)),
+    ], required=['Easting', 'Northing'])
 
     def process_row(self, row):
         # Only import schools with easting and northing information
-        if row[70] and row[71]:
-            if 'Primary' in row[11]:
-                school_type = 'PRIMARY'
-            elif 'Secondary' in row[11]:
-                school_type = 'SECONDARY'
-            else:
-                school_type = 'UNKNOWN'
-
-            data = {
-                "urn": row[0],
-                "la_name": row[2],
-                "school_name": row[4],
-                "school_type": school_type,
-                "school_capacity": int(row[20]) if row[20] else 0,
-                "school_pupils": int(row[23]) if row[23] else 0,
-                "postcode": row[44].replace(' ', ''),
-                "point": {
-                    "type": "Point",
-                    "coordinates": [float(row[70]), float(row[71])]
-                },
-                "srid": 27700
-            }
-
-            headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-            response = requests.post(
-                self.api_url,
-                json=data,
-                headers=headers)
-
-            if response.status_code == 201:
-                print('{0} imported correctly'.format(row[0]))
-            else:
-                print(
-                    'ERROR: could not import {0} because of {1}'.format(
-                        row[0], response.text))
+        data = self.extract(row)
+        if data is not None:
+            return self.post_payload(data, data['urn'])
 
 
 @click.command()
@@ -51,9 +50,16 @@ class SchoolsImportCommand(CSVImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/schools/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_schools(filenames, apiurl, apitoken):
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@manifest_options
+@profile_options
+def import_schools(filenames, apiurl, apitoken, **options):
     command = SchoolsImportCommand(
-        filenames, apiurl, apitoken, True, encoding='ISO-8859-1')
+        filenames, apiurl, apitoken, True, encoding='ISO-8859-1', **options)
     command.run()
 
 if __name__ == '__main__':
@@ -1,12 +1,18 @@
-from importers import ShapefileImportCommand
-import requests
+from geometry import Geometry
+from importers import (
+    ShapefileImportCommand, cache_option, checkpoint_options,
+    geometry_options, import_options, jobs_option, manifest_options,
+    transform_options)
+from profiling import profile_options
 import click
 
 
 class SubstationsImportCommand(ShapefileImportCommand):
+    natural_key = 'gdo_gid'
 
     def process_record(self, record):
-        if record.shape.__geo_interface__['type'] == 'Polygon':
+        geometry = Geometry.from_shape(record.shape)
+        if geometry.type == 'Polygon':
             data = {
                 "name": str(record.record[0]),
                 "operating": str(record.record[1]),
@@ -15,23 +21,11 @@ class SubstationsImportCommand(ShapefileImportCommand):
                 "description": str(record.record[4]),
                 "owner_flag": str(record.record[5]),
                 "gdo_gid": str(record.record[6]),
-                "geom": record.shape.__geo_interface__,
+                "geom": self.geojson(geometry, 27700),
                 "srid": 27700
             }
 
-            headers = {'Authorization': 'Token {0}'.format(self.token)}
-
-            response = requests.post(
-                self.api_url,
-                json=data,
-                headers=headers)
-
-            if response.status_code == 201:
-                print('{0} imported correctly'.format(record.record[0]))
-            else:
-                print(
-                    'ERROR: could not import {0} because of {1}'.format(
-                        record.record[0], response.text))
+            return self.post_payload(data, record.record[0])
 
 
 @click.command()
@@ -40,8 +34,16 @@ class SubstationsImportCommand(ShapefileImportCommand):
     '--apiurl',
     default='http://localhost:8000/api/substations/', help='API url')
 @click.option('--apitoken', help='API authentication token')
-def import_substations(filename, apiurl, apitoken):
-    command = SubstationsImportCommand(filename, apiurl, apitoken)
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@manifest_options
+@geometry_options
+@profile_options
+def import_substations(filename, apiurl, apitoken, **options):
+    command = SubstationsImportCommand(filename, apiurl, apitoken, **options)
     command.run()
 
 if __name__ == '__main__':
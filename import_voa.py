@@ -1,26 +1,39 @@
-import time
 import csv
-from collections import defaultdict
 import traceback
 
-import requests
 import click
 
+from checkpoint import LineReader
+from importers import (
+    ImportCommand, cache_option, checkpoint_options, import_options,
+    jobs_option, manifest_options, transform_options)
+from inputs import expand_inputs, open_input
+from profiling import profile_options
+from record_counts import count_voa_records
 from voa_utils import process
-from utils import print_outcomes_and_rate
 
 
-class CSVStreamImportCommand(object):
+class CSVStreamImportCommand(ImportCommand):
+    natural_key = 'uarn'
+
     def __init__(
             self, file_names, api_url, token,
-            skip_header=False, encoding=None, pdb=False):
-        self.api_url = api_url
-        self.token = token
-        self.file_names = file_names
+            skip_header=False, encoding=None, pdb=False, **options):
+        super(CSVStreamImportCommand, self).__init__(
+            api_url, token, **options)
+        self.file_names = expand_inputs(file_names)
         self.skip_header = skip_header
         self.encoding = encoding
         self.pdb = pdb
 
+    def count_records(self, file_name):
+        return count_voa_records(file_name)
+
+    def cache_version(self):
+        return '{} {}'.format(
+            super(CSVStreamImportCommand, self).cache_version(),
+            self.encoding)
+
     def process_record(self, record):
         # Process Area payloads
         area_payload = []
@@ -127,63 +140,55 @@ class CSVStreamImportCommand(object):
             payload['adjustement_total'] = round(float(record[
                 'adjustment_totals'].get('total_adjustment')), 2)
 
-        headers = {'Authorization': 'Token {0}'.format(self.token)}
+        return self.post_payload(payload, payload['uarn'])
 
+    def process_record_or_error(self, record):
         try:
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers=headers)
-        except Exception as e:
+            return self.process_record(record)
+        except Exception as ex:
+            if 'BdbQuit' in repr(ex):
+                # this allows you to use pdb to quit, otherwise you
+                # need to kill to exit pdb
+                raise
             print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    payload['uarn'], response.text))
-            return 'Error POSTing - {}'.format(e)
-
-        if response.status_code == 201:
-            #print('{0} imported correctly'.format(payload['uarn']))
-            return 'processed'
-        else:
-            print(
-                'ERROR: could not import {0} because of {1}'.format(
-                    payload['uarn'], response.text))
-            return 'Error POSTing - {} {}'.format(response.status_code,
-                                                  response.text)
+                'ERROR: could not import {0} '
+                'because of: {1}'.format(
+                    record['details'].get('uarn'), ex))
+            self.write_dead_letter(
+                record['details'].get('uarn'), None, repr(ex), record=record)
+            if self.pdb:
+                traceback.print_exc()
+                import pdb
+                pdb.set_trace()
+            return 'Error - {}'.format(ex)
+
+    def import_file(self, file_name, loopstats):
+        checkpoint = self.open_checkpoint(file_name, loopstats)
+        if checkpoint.complete:
+            return
+        cache = self.open_payload_cache(file_name)
+        if self.replays_cache(cache, checkpoint):
+            return self.replay_payload_cache(cache, checkpoint)
+        with open_input(file_name) as csvfile:
+            lines = LineReader(csvfile, self.encoding, checkpoint.position)
+            reader = csv.reader(lines, delimiter='*', quotechar='"')
+
+            # process() only yields a record once it has read the '01' line
+            # of the next one, which is where to resume from
+            self.process_all_checkpointed(
+                ((record['details'].get('uarn'), record,
+                  lines.current_line_start())
+                 for record in process(reader)),
+                self.process_record_or_error, checkpoint, cache)
 
     def run(self):
-        for file_name in self.file_names:
-            with open(
-                    file_name,
-                    newline='', encoding=self.encoding) as csvfile:
-
-                reader = csv.reader(csvfile, delimiter='*', quotechar='"')
-
-                start_time = time.time()
-                outcomes = defaultdict(list)
-                for count, record in enumerate(process(reader)):
-                    outcome = None
-                    try:
-                        outcome = self.process_record(record)
-                    except Exception as ex:
-                        if 'BdbQuit' in repr(ex):
-                            # this allows you to use pdb to quit, otherwise you
-                            # need to kill to exit pdb
-                            raise
-                        print(
-                            'ERROR: could not import {0} '
-                            'because of: {1}'.format(
-                                record['details'].get('uarn'), ex))
-                        outcome = 'Error - {}'.format(ex)
-                        if self.pdb:
-                            traceback.print_exc()
-                            import pdb
-                            pdb.set_trace()
-                    outcomes[outcome or 'processed'].append(
-                        record['details'].get('uarn'))
-                    if count % 100 == 0:
-                        print_outcomes_and_rate(outcomes, start_time)
-                        print()
-                print_outcomes_and_rate(outcomes, start_time)
+        loopstats = self.import_files(self.file_names)
+        self.remove_checkpoints(self.file_names)
+
+        # Use GOV.UK Notify to send a notification when import is completed
+        self.notify_import_completed(', '.join(self.file_names))
+
+        loopstats.report()
 
 
 @click.command()
@@ -198,9 +203,16 @@ class CSVStreamImportCommand(object):
               ' has a BOM')
 @click.option('--pdb', is_flag=True,
               help='On exception, drop into pdb debugger')
-def import_addresses(filenames, apiurl, apitoken, encoding, pdb):
+@import_options
+@jobs_option
+@checkpoint_options
+@cache_option
+@transform_options
+@manifest_options
+@profile_options
+def import_addresses(filenames, apiurl, apitoken, encoding, pdb, **options):
     command = CSVStreamImportCommand(filenames, apiurl, apitoken,
-                                     encoding=encoding, pdb=pdb)
+                                     encoding=encoding, pdb=pdb, **options)
     command.run()
 
 
@@ -1,13 +1,588 @@
+import array
+import asyncio
+import bisect
+import collections
 import csv
+import glob
 import shapefile
 import os
+import concurrent.futures
+import itertools
+import multiprocessing
+import re
+import sys
+import threading
+import time
 from datetime import datetime
 
+import click
+import requests
+
+from checkpoint import Checkpoint, LineReader
+from dead_letters import DeadLetterFile
+from geometry import Geometry
+from inputs import (
+    close_shapefile, expand_inputs, open_input, open_shapefile, sidecar_path)
 from loopstats import LoopStats
+from manifest import Manifest, digest
+from metrics import JSONLinesSink, PrometheusTextfileSink
+from options import ImportOptions
+import payload_json
+from payload_cache import PayloadCache, source_version
+from payload_shards import ShardWriter, existing_shards
+from profiling import watch_loopstats
+from record_counts import count_csv_records, count_shapefile_records
+from retry import ConcurrencyController, ImportAborted, should_retry
 from notifications_python_client.notifications import NotificationsAPIClient
 
+try:
+    # Optional - only needed for --async, see requirements-async.txt
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def jobs_option(command):
+    '''Decorator that adds --jobs to the click command of an importer that
+    takes several input files, or a shapefile.
+    '''
+    return click.option(
+        '--jobs', type=int, default=1,
+        help='Number of processes importing in parallel, each taking a whole '
+        'file - or part of a shapefile - at a time (default: 1)')(command)
+
+
+def checkpoint_options(command):
+    '''Decorator that adds the options for checkpointing an import, and
+    resuming from a checkpoint, to the click command of an importer.
+    '''
+    command = click.option(
+        '--checkpoint-every', type=int, default=None,
+        help='Save a checkpoint of progress after this many records, in '
+        '<input file>.checkpoint (default: 10000 with --resume, otherwise '
+        'no checkpoints)')(command)
+    command = click.option(
+        '--resume', is_flag=True,
+        help='Carry on from the checkpoint saved by an import that didn\'t '
+        'finish, or start saving checkpoints to carry on from next time. '
+        'A shapefile has to be resumed with the same --jobs')(command)
+    return command
+
+
+def cache_option(command):
+    '''Decorator that adds --cache to the click command of an importer, to
+    keep the payloads made from each input file for next time.
+    '''
+    return click.option(
+        '--cache', default=None, type=click.Path(),
+        help='Directory to keep the payloads made from each input file in, so '
+        'that they can be sent again without reading it, as long as it '
+        'hasn\'t changed')(command)
+
+
+def transform_options(command):
+    '''Decorator that adds the options for writing the payloads to files for
+    load.py, instead of POSTing them, to the click command of an importer.
+    '''
+    command = click.option(
+        '--compress', is_flag=True,
+        help='With --transform-to, gzip the payload files')(command)
+    command = click.option(
+        '--shard-size', type=int, default=100000,
+        help='With --transform-to, payloads per file (default: 100000)')(
+            command)
+    command = click.option(
+        '--transform-to', default=None, type=click.Path(), metavar='DIR',
+        help='Write the payloads to NDJSON files in DIR, for load.py to send '
+        'to the API, instead of POSTing them')(command)
+    return command
+
+
+def geometry_options(command):
+    '''Decorator that adds the options for making the geometries in the
+    payloads smaller to the click command of an importer.
+    '''
+    command = click.option(
+        '--simplify', type=float, default=None, metavar='TOLERANCE',
+        help='Leave out the vertices of lines and polygons that are less '
+        'than TOLERANCE from the line between their neighbours, in the units '
+        'of the SRID (e.g. metres for 27700)')(command)
+    command = click.option(
+        '--precision', type=int, default=None, metavar='DECIMALS',
+        help='Round coordinates to this many decimal places')(command)
+    command = click.option(
+        '--round-coordinates', is_flag=True,
+        help='Round coordinates to about a centimetre: 7 decimal places for '
+        'SRID 4326, 2 for 27700 and 3857')(command)
+    return command
+
+
+def manifest_options(command):
+    '''Decorator that adds the options for re-importing only the records
+    that changed since last time to the click command of an importer.
+    '''
+    command = click.option(
+        '--manifest', default=None, type=click.Path(),
+        help='File recording what was imported, for --changed-only, which '
+        'is only kept with one of the two options (default: one per importer '
+        'and API url in ~/.landavailability-import/)')(
+            command)
+    command = click.option(
+        '--changed-only', is_flag=True,
+        help='Only send records that are new, or have changed since they '
+        'were last imported')(command)
+    return command
+
+
+def import_options(command):
+    '''Decorator that adds the options shared by all the import commands to a
+    click command. Their values are passed on as keyword arguments, ready to
+    hand to the ImportCommand constructor.
+    '''
+    command = click.option(
+        '--metrics-prom', default=None, type=click.Path(),
+        help='Prometheus textfile collector file to keep up to date with '
+        'the stats')(command)
+    command = click.option(
+        '--metrics-jsonl', default=None, type=click.Path(),
+        help='File to append the stats to as a line of JSON each time they '
+        'are reported')(command)
+    command = click.option(
+        '--report-every', type=float, default=10,
+        help='Seconds between reports of the stats (default: 10)')(command)
+    command = click.option(
+        '--dead-letters', default=None, type=click.Path(),
+        help='File to write the payloads that fail to, as lines of JSON, '
+        'for replay.py (default: failed-<importer>-<time>.ndjson)')(command)
+    command = click.option(
+        '--breaker-threshold', type=int, default=20,
+        help='Pause the import when this many requests in a row have failed '
+        'after retrying (default: 20, 0 never pauses)')(command)
+    command = click.option(
+        '--adaptive', is_flag=True,
+        help='Lower the number of requests in flight when the API slows down '
+        'or fails, up to --max-in-flight when it is healthy')(command)
+    command = click.option(
+        '--retries', type=int, default=3,
+        help='Times to retry a request that failed with a connection error, '
+        '429 or 5xx (default: 3)')(command)
+    command = click.option(
+        '--max-in-flight', type=int, default=None,
+        help='Maximum number of rows submitted to the workers but not yet '
+        'finished (default: twice the number of workers, or 1000 with '
+        '--async)')(command)
+    command = click.option(
+        '--async', 'use_async', is_flag=True,
+        help='Upload from a single asyncio event loop instead of worker '
+        'threads (needs aiohttp)')(command)
+    command = click.option(
+        '--bulk-url', default=None,
+        help='Endpoint that accepts a JSON array of records, for bulk mode '
+        '(default: the API url)')(command)
+    command = click.option(
+        '--batch-bytes', type=int, default=1000000,
+        help='Maximum size of the JSON of a batch in bulk mode (default: '
+        '1000000)')(command)
+    command = click.option(
+        '--batch-size', type=int, default=None,
+        help='Turns on bulk mode, POSTing up to this many records per '
+        'request as a JSON array')(command)
+    command = click.option(
+        '--pool-size', type=int, default=None,
+        help='Number of keep-alive connections kept open to the API '
+        '(default: 10, or the number of workers if higher)')(command)
+    command = click.option(
+        '--workers', type=int, default=1,
+        help='Number of threads transforming and POSTing rows concurrently '
+        '(default: 1)')(command)
+    return command
+
 
 class ImportCommand(object):
+    num_expected_records = None
+    # which of the importer's commands made a cached payload, for importers
+    # that post to several endpoints
+    cache_target = 0
+    # field of the payload that identifies the record, for the manifest
+    natural_key = None
+
+    def __init__(self, api_url, token, **options):
+        '''Takes the options of the click command as keyword arguments,
+        which it sorts into groups (see options.py).
+        '''
+        self.api_url = api_url
+        self.token = token
+        self.options = ImportOptions(**options)
+        self.bulk_url = self.options.bulk.url or api_url
+        concurrency = self.options.concurrency
+        self.concurrency_controller = \
+            ConcurrencyController(concurrency.max_in_flight) \
+            if concurrency.adaptive else None
+        self.manifest = self.open_manifest()
+        self.dead_letters = DeadLetterFile(
+            self.options.reporting.dead_letters or
+            'failed-{}-{}.ndjson'.format(
+                self.__class__.__name__,
+                datetime.now().strftime('%Y%m%d-%H%M%S')))
+        self.shards = self.create_shard_writer(self.options.transform)
+        self.session = self.create_session()
+        self.batcher = self.create_batcher()
+        # set while process_all() is running, to record the stage timings
+        self.stage_stats = None
+        # the time each worker thread has spent in send_payload() for the row
+        # it's on, so it can be taken off the time spent transforming it
+        self.local = threading.local()
+        # set while process_all_async() is running
+        self.async_loop = None
+        self.async_session = None
+
+    def __getstate__(self):
+        # The session and batcher hold sockets and locks, so each process
+        # started by --jobs makes its own
+        state = self.__dict__.copy()
+        state['session'] = None
+        state['batcher'] = None
+        # ...and reads the manifest itself, rather than having it pickled
+        state['manifest'] = None
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+        self.manifest = self.open_manifest()
+        self.session = self.create_session()
+        self.batcher = self.create_batcher()
+
+    def create_session(self):
+        '''Returns a requests Session that keeps up to pool_size connections
+        per host alive between rows, and sends the auth token with every
+        request.
+        '''
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.options.concurrency.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self.token:
+            session.headers['Authorization'] = 'Token {0}'.format(self.token)
+        return session
+
+    def open_manifest(self):
+        '''Returns the Manifest of the payloads imported last time, or None
+        without --changed-only or --manifest, as hashing every payload for
+        it takes time.
+        '''
+        options = self.options.manifest
+        if not options.changed_only and not options.path:
+            return None
+        if not self.natural_key:
+            if options.changed_only:
+                raise click.UsageError(
+                    '{} can\'t tell which records have changed'.format(
+                        self.__class__.__name__))
+            return None
+        if not options.path:
+            options.path = os.path.join(
+                os.path.expanduser('~'), '.landavailability-import',
+                '{}-{:016x}.manifest'.format(
+                    self.__class__.__name__, digest(self.api_url or '')))
+        manifest = Manifest(options.path, self.natural_key)
+        manifest.load()
+        return manifest
+
+    def save_manifest(self):
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def create_batcher(self):
+        if self.options.bulk.batch_size:
+            return PayloadBatcher(self, self.bulk_url, self.options.bulk)
+
+    def create_shard_writer(self, options):
+        directory = options.directory
+        if not directory:
+            return None
+        prefix = self.__class__.__name__
+        if not self.options.checkpoint.resume and \
+                existing_shards(directory, prefix):
+            raise click.UsageError(
+                '{} already has payloads from {} - move them or transform '
+                'to another directory'.format(directory, prefix))
+        return ShardWriter(
+            directory, prefix, self.api_url, options.shard_size,
+            options.compress)
+
+    def use_url(self, url):
+        '''Sends the payloads to url from now on, and in bulk mode to
+        --bulk-url, or url if that isn't given.
+        '''
+        if url == self.api_url:
+            return
+        self.flush_batches()
+        self.api_url = url
+        self.bulk_url = self.options.bulk.url or url
+        self.batcher = self.create_batcher()
+
+    def flush_batches(self):
+        '''Sends the payloads still waiting in a bulk batch, and finishes the
+        --transform-to file being written.
+        '''
+        if self.batcher:
+            self.batcher.flush()
+        if self.shards:
+            self.shards.close()
+
+    def post_payload(self, payload, identifier=None):
+        '''POSTs the payload as JSON to the API and returns the outcome, to
+        be recorded in LoopStats.
+
+        When called from the async engine it returns straight away with a
+        Task that resolves to the outcome instead, and in bulk mode with a
+        Future that resolves once the payload's batch has been sent.
+
+        With --changed-only, payloads that are the same as the one imported
+        last time for their natural key aren't sent at all.
+        '''
+        cached_payloads = getattr(self.local, 'cached_payloads', None)
+        if cached_payloads is not None:
+            cached_payloads.append((self.cache_target, identifier, payload))
+        if self.manifest is None:
+            return self.send_payload(payload, identifier)
+        key_hash, payload_hash = self.manifest.hash_payload(payload)
+        if self.options.manifest.changed_only and \
+                self.manifest.unchanged(key_hash, payload_hash):
+            return 'unchanged'
+
+        def update_manifest(outcome):
+            if outcome == 'imported':
+                self.manifest.update(key_hash, payload_hash)
+            return outcome
+
+        return self.map_outcome(
+            self.send_payload(payload, identifier), update_manifest)
+
+    def map_outcome(self, outcome, function):
+        '''Returns function(outcome), for a process_row() to say more about
+        the outcome of post_payload() - or, if that is a Future or Task that
+        the outcome isn't known for yet, one of function(outcome).
+        '''
+        if isinstance(outcome, asyncio.Future):
+            return self.async_loop.create_task(
+                self.map_outcome_async(outcome, function))
+        if isinstance(outcome, concurrent.futures.Future):
+            mapped = concurrent.futures.Future()
+
+            def done(future):
+                if future.cancelled():
+                    mapped.cancel()
+                    return
+                try:
+                    mapped.set_result(function(future.result()))
+                except Exception as e:
+                    mapped.set_exception(e)
+            outcome.add_done_callback(done)
+            return mapped
+        return function(outcome)
+
+    async def map_outcome_async(self, task, function):
+        return function(await task)
+
+    def send_payload(self, payload, identifier=None):
+        if self.shards is not None:
+            self.shards.write(payload, identifier)
+            return 'transformed'
+        if self.async_session is not None:
+            return self.async_loop.create_task(
+                self.post_payload_async(payload, identifier))
+        start = time.perf_counter()
+        try:
+            if self.batcher:
+                return self.batcher.add(payload, identifier)
+            return self.post_json(payload, identifier)
+        finally:
+            self.local.upload_seconds = getattr(
+                self.local, 'upload_seconds', 0) + time.perf_counter() - start
+
+    def encode_payload(self, payload, separators=None):
+        '''Returns the payload as JSON bytes, the same as json.dumps() would
+        make them, apart from also encoding any Geometry in it (see
+        payload_json.py).
+        '''
+        return payload_json.dumps(payload, separators).encode('utf-8')
+
+    def post_json(self, payload, identifier=None):
+        '''POSTs the payload and returns the outcome, timing each stage.'''
+        start = time.perf_counter()
+        body = self.encode_payload(payload)
+        self.add_timing('serialize', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        try:
+            response = self.send_request(
+                self.api_url, data=body, headers=JSON_HEADERS)
+        except requests.exceptions.RequestException as e:
+            self.add_timing('network', time.perf_counter() - start)
+            print('ERROR: could not import {0} because of {1}'.format(
+                identifier, e))
+            self.write_dead_letter(identifier, None, str(e), payload)
+            return 'ERROR: could not POST - {}'.format(e)
+        self.add_timing('network', time.perf_counter() - start)
+
+        start = time.perf_counter()
+        outcome = self.response_outcome(
+            response.status_code, response.text, identifier)
+        if outcome != 'imported':
+            self.write_dead_letter(
+                identifier, response.status_code, response.text, payload)
+        self.add_timing('response', time.perf_counter() - start)
+        return outcome
+
+    def geojson(self, geometry, srid, z=None):
+        '''Returns the geometry - a GeoJSON dict, a pyshp shape or a
+        Geometry - for a payload, rounded and simplified as the options say.
+        z adds a third dimension, of z at every vertex.
+
+        It is a GeoJSON dict, or a Geometry that encode_payload() writes as
+        GeoJSON. The bytes the GeoJSON would have been, and the bytes saved,
+        are added up in the LoopStats.
+        '''
+        options = self.options.geometry
+        if not options.shrinks():
+            if z is not None:
+                return as_geometry(geometry).with_z(z)
+            # as it is - a small geometry is as quick to encode from
+            # GeoJSON lists as from a Geometry
+            return geometry if isinstance(geometry, dict) \
+                else geometry.__geo_interface__
+        original = as_geometry(geometry)
+        geometry = options.shrink(original, srid)
+        if z is not None:
+            original = original.with_z(z)
+            geometry = geometry.with_z(z)
+        if self.stage_stats is not None:
+            original_bytes = len(payload_json.dumps(original))
+            self.stage_stats.add_total('geometry bytes', original_bytes)
+            self.stage_stats.add_total(
+                'geometry bytes saved',
+                original_bytes - len(payload_json.dumps(geometry)))
+        return geometry
+
+    def add_timing(self, stage, seconds):
+        '''Records how long a stage of importing a row took, in the LoopStats
+        of the process_all() that is running.
+        '''
+        if self.stage_stats is not None:
+            self.stage_stats.add_timing(stage, seconds)
+
+    def send_request(self, url, **kwargs):
+        '''POSTs to url with the session, retrying if the API is struggling.
+        Returns the last response, or raises the RequestException of the last
+        attempt.
+        '''
+        for attempt in itertools.count():
+            self.options.retry.breaker.wait()
+            start = time.monotonic()
+            try:
+                response = self.session.post(url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                response, error = None, e
+            if response is None:
+                delay = self.retry_delay(attempt, time.monotonic() - start)
+            else:
+                delay = self.retry_delay(
+                    attempt, time.monotonic() - start, response.status_code,
+                    response.headers.get('Retry-After'))
+            if delay is None:
+                if response is None:
+                    raise error
+                return response
+            time.sleep(delay)
+
+    def retry_delay(self, attempt, latency, status_code=None,
+                    retry_after=None):
+        '''Records how a request went, with status_code None for a
+        connection error. Returns how long to wait before retrying it, or None
+        if it shouldn't be retried.
+        '''
+        overloaded = should_retry(status_code)
+        if self.concurrency_controller:
+            self.concurrency_controller.record(latency, overloaded)
+        if not overloaded:
+            self.options.retry.breaker.succeeded()
+            return None
+        if attempt >= self.options.retry.policy.retries:
+            self.options.retry.breaker.failed()
+            return None
+        return self.options.retry.policy.delay(attempt, retry_after)
+
+    async def post_payload_async(self, payload, identifier=None):
+        start = time.perf_counter()
+        body = self.encode_payload(payload)
+        self.add_timing('serialize', time.perf_counter() - start)
+
+        network_start = time.perf_counter()
+        for attempt in itertools.count():
+            while self.options.retry.breaker.wait_time():
+                await asyncio.sleep(self.options.retry.breaker.wait_time())
+            start = time.monotonic()
+            try:
+                async with self.async_session.post(
+                        self.api_url, data=body,
+                        headers=JSON_HEADERS) as response:
+                    text = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response, error = None, e
+            if response is None:
+                delay = self.retry_delay(attempt, time.monotonic() - start)
+            else:
+                delay = self.retry_delay(
+                    attempt, time.monotonic() - start, response.status,
+                    response.headers.get('Retry-After'))
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+        self.add_timing('network', time.perf_counter() - network_start)
+
+        if response is None:
+            print('ERROR: could not import {0} because of {1}'.format(
+                identifier, error))
+            self.write_dead_letter(identifier, None, str(error), payload)
+            return 'ERROR: could not POST - {}'.format(error)
+        start = time.perf_counter()
+        outcome = self.response_outcome(response.status, text, identifier)
+        if outcome != 'imported':
+            self.write_dead_letter(identifier, response.status, text, payload)
+        self.add_timing('response', time.perf_counter() - start)
+        return outcome
+
+    def write_dead_letter(self, identifier, status_code, error, payload=None,
+                          **kwargs):
+        '''Records a payload the API didn't accept in the dead letters file
+        - see dead_letters.py.
+        '''
+        self.dead_letters.write(
+            self.api_url, identifier, status_code, error, payload, **kwargs)
+
+    def in_flight_limit(self):
+        '''How many items may be in flight now - max_in_flight, or less
+        with --adaptive if the API is struggling.
+        '''
+        if self.concurrency_controller:
+            return self.concurrency_controller.current_limit()
+        return self.options.concurrency.max_in_flight
+
+    def response_outcome(self, status_code, text, identifier=None):
+        if status_code == 201:
+            return 'imported'
+        print('ERROR: could not import {0} because of {1}'.format(
+            identifier, text))
+        return 'ERROR: could not import - {} {}'.format(status_code, text)
+
     def notify_import_completed(self, imported_files):
         EMAIL_TO_NOTIFY = os.environ.get('EMAIL_TO_NOTIFY')
         NOTIFY_API_TOKEN = os.environ.get('NOTIFY_API_TOKEN')
@@ -30,90 +605,806 @@ class ImportCommand(object):
                 reference=None
             )
 
+    def open_checkpoint(self, file_name, loopstats):
+        '''Returns a Checkpoint for the input file, to use in place of
+        loopstats. When resuming, the checkpoint saved last time is loaded.
+        '''
+        options = self.options.checkpoint
+        checkpoint = Checkpoint(file_name, loopstats, options.every)
+        if options.resume and checkpoint.load():
+            if checkpoint.complete:
+                print('Skipping {0} - already imported'.format(file_name))
+            else:
+                print('Resuming {0} from {1}'.format(
+                    file_name, checkpoint.position))
+        else:
+            print('Processing {0}'.format(file_name))
+        return checkpoint
+
+    def process_all_checkpointed(self, items, process, checkpoint,
+                                 cache=None):
+        '''Like process_all(), for (iteration_id, item, position) items, and
+        saving the checkpoint if the import is stopped. The payloads are
+        saved in the cache, if one is given and the import started from the
+        beginning of the file.
+        '''
+        if cache is not None and not checkpoint.position:
+            items = ((iteration_id, (iteration_id, item), position)
+                     for iteration_id, item, position in items)
+            process = self.caching_payloads(process, cache)
+            cache.start_writing()
+        else:
+            cache = None
+        try:
+            self.process_all(checkpoint.track(items), process, checkpoint)
+        except BaseException:
+            checkpoint.save()
+            if cache is not None:
+                cache.close()
+            raise
+        checkpoint.finish()
+        if cache is not None:
+            cache.finish()
+
+    def open_payload_cache(self, file_name):
+        '''Returns the PayloadCache of an input file with --cache, or None.
+        '''
+        directory = self.options.cache.directory
+        if not directory:
+            return None
+        return PayloadCache(directory, self.__class__.__name__,
+                            file_name, self.cache_version())
+
+    def cache_version(self):
+        '''Returns the version of the transform, which the cached payloads
+        must have been made by. Subclasses add the options that change the
+        payloads.
+        '''
+        options = self.options.geometry
+        if not options.shrinks():
+            return source_version()
+        return '{} {}'.format(source_version(), options.version())
+
+    def caching_payloads(self, process, cache):
+        '''Wraps process(), saving the payloads it posts for each item in the
+        cache.
+        '''
+        def process_and_cache(item):
+            iteration_id, item = item
+            self.local.cached_payloads = payloads = []
+            try:
+                outcome = process(item)
+            finally:
+                self.local.cached_payloads = None
+            cache.write(iteration_id, outcome, payloads)
+            return outcome
+        return process_and_cache
+
+    def replays_cache(self, cache, checkpoint):
+        '''Returns True if the payloads saved in the cache (or None) are to be
+        sent, instead of reading the input file again. A checkpoint is only
+        resumed the way it was saved, as its position is an entry of the
+        cache or a position in the input file.
+        '''
+        replays = cache is not None and cache.exists()
+        if not checkpoint.position or replays == checkpoint.from_cache:
+            return replays
+        if replays:
+            print('Resuming from the input file, not the cache, as the '
+                  'checkpoint was saved reading it')
+            return False
+        raise click.UsageError(
+            'The checkpoint of {} was saved sending the cached payloads - '
+            'resume with the same --cache'.format(checkpoint.file_name))
+
+    def replay_payload_cache(self, cache, checkpoint):
+        '''Sends the payloads saved in the cache, instead of reading the input
+        file again.
+        '''
+        print('Sending the payloads cached in {0}'.format(cache.path))
+        checkpoint.from_cache = True
+        start = checkpoint.position or 0
+        self.process_all_checkpointed(
+            ((payloads[0][1] if payloads else iteration_id,
+              (iteration_id, outcome, payloads), index + 1)
+             for index, (iteration_id, outcome, payloads) in enumerate(
+                 cache.entries(start), start)),
+            self.process_cached, checkpoint)
+
+    def process_cached(self, entry):
+        '''Returns the outcome of a record from the cache, POSTing its
+        payloads.
+        '''
+        iteration_id, outcome, payloads = entry
+        for target, identifier, payload in payloads:
+            outcome = self.post_payload(payload, identifier)
+        return outcome
+
+    def remove_checkpoints(self, file_names):
+        for file_name in file_names:
+            Checkpoint(file_name, None).remove()
+
+    def create_loopstats(self, num_iterations=None, metrics=True):
+        '''Returns a LoopStats for counting the outcomes of an import. It
+        keeps just the counts and a few examples of each outcome, so even an
+        import of millions of rows uses little memory. Unless metrics is
+        False, its reports also go to the --metrics-jsonl and --metrics-prom
+        files.
+        '''
+        loopstats = LoopStats(num_iterations, compact=True)
+        if metrics:
+            labels = {'importer': self.__class__.__name__}
+            options = self.options.reporting
+            if options.metrics_jsonl:
+                loopstats.sinks.append(
+                    JSONLinesSink(options.metrics_jsonl, labels))
+            if options.metrics_prom:
+                loopstats.sinks.append(
+                    PrometheusTextfileSink(options.metrics_prom, labels))
+        watch_loopstats(loopstats)
+        return loopstats
+
+    def count_records(self, file_name):
+        '''Returns the number of records in an input file, counted quickly
+        before it's imported, or None if they can't be.
+        '''
+        return None
+
+    def expected_records(self, file_names):
+        '''Returns num_expected_records or, if that isn't known, the count of
+        the records in all the files - for LoopStats to work out the progress
+        and the time remaining.
+        '''
+        if self.num_expected_records is not None:
+            return self.num_expected_records
+        start = time.monotonic()
+        counts = [self.count_records(file_name) for file_name in file_names]
+        if not counts or None in counts:
+            return None
+        print('Counted {:,} records in {:.1f}s'.format(
+            sum(counts), time.monotonic() - start))
+        return sum(counts)
+
+    def import_file(self, file_name, loopstats):
+        '''Imports one of the input files, recording the outcomes in
+        loopstats. Returns False if the rest of the files should be skipped.
+        '''
+        raise NotImplementedError
+
+    def import_files(self, file_names):
+        '''Imports the files one after another or, with jobs > 1, several at
+        once in that many worker processes. Returns a LoopStats with the
+        outcomes of all the files.
+        '''
+        loopstats = self.create_loopstats(self.expected_records(file_names))
+        jobs = self.options.concurrency.jobs
+        if jobs == 1 or len(file_names) < 2:
+            try:
+                for file_name in file_names:
+                    if self.import_file(file_name, loopstats) is False:
+                        break
+            finally:
+                self.save_manifest()
+            return loopstats
+
+        pool = multiprocessing.Pool(min(jobs, len(file_names)))
+        try:
+            for file_loopstats, manifest_updates in pool.imap_unordered(
+                    self.import_file_in_worker, file_names):
+                loopstats.merge(file_loopstats)
+                loopstats.print_every_x_seconds(self.options.reporting.every)
+                if manifest_updates:
+                    self.manifest.merge(manifest_updates)
+            pool.close()
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            self.save_manifest()
+        return loopstats
+
+    def import_file_in_worker(self, file_name):
+        '''Imports a file in a --jobs process. Returns its LoopStats and the
+        updates to the manifest, for the parent process to combine.
+        '''
+        # the parent process writes the metrics, once it has them all
+        loopstats = self.create_loopstats(metrics=False)
+        self.import_file(file_name, loopstats)
+        if self.manifest is None:
+            return loopstats, None
+        return loopstats, self.manifest.updates
+
+    def process_all(self, items, process, loopstats):
+        '''Calls process(item) for each (iteration_id, item) in items and
+        records the outcomes in loopstats.
+
+        With more than one worker the calls are made on a pool of threads, so
+        several rows can be waiting on the API at the same time. Only
+        max_in_flight items are read ahead of the ones that have finished, so
+        the input is never pulled into memory all at once.
+        '''
+        use_async = self.options.concurrency.use_async
+        if use_async and self.batcher:
+            raise click.UsageError(
+                'Bulk mode can\'t be combined with --async')
+        self.stage_stats = loopstats
+        try:
+            items = self.timed_items(items, loopstats)
+            if use_async:
+                return self.process_all_async(items, process, loopstats)
+            self.process_all_sync(items, process, loopstats)
+        finally:
+            self.stage_stats = None
+
+    def process_all_sync(self, items, process, loopstats):
+        # outcomes of the payloads that are waiting in a bulk batch
+        batched = collections.deque()
+
+        def record(outcome, iteration_id, start):
+            if isinstance(outcome, concurrent.futures.Future):
+                batched.append((outcome, iteration_id, start))
+            else:
+                loopstats.add(
+                    outcome, iteration_id, time.perf_counter() - start)
+                loopstats.print_every_x_seconds(self.options.reporting.every)
+            while batched and batched[0][0].done():
+                future, iteration_id, start = batched.popleft()
+                loopstats.add(future.result(), iteration_id,
+                              time.perf_counter() - start)
+                loopstats.print_every_x_seconds(self.options.reporting.every)
+
+        if self.options.concurrency.workers == 1:
+            for iteration_id, item in items:
+                outcome, start = self.timed_process(process, item)
+                record(outcome, iteration_id, start)
+        else:
+            self.process_all_threaded(items, process, record)
+
+        self.flush_batches()
+        for future, iteration_id, start in batched:
+            loopstats.add(future.result(), iteration_id,
+                          time.perf_counter() - start)
+
+    def timed_items(self, items, loopstats):
+        '''Yields the items, recording how long each took to read.'''
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            loopstats.add_timing('read', time.perf_counter() - start)
+            yield item
+
+    def timed_process(self, process, item):
+        '''Calls process(item), recording the time it took to transform the
+        item into a payload - that is, the time not spent in send_payload().
+        Returns the outcome and when it started.
+        '''
+        start = time.perf_counter()
+        self.local.upload_seconds = 0
+        outcome = process(item)
+        self.add_timing('transform', time.perf_counter() - start -
+                        self.local.upload_seconds)
+        return outcome, start
+
+    def process_all_threaded(self, items, process, record):
+        in_flight = {}
+
+        def record_finished(finished):
+            for future in finished:
+                outcome, start = future.result()
+                record(outcome, in_flight.pop(future), start)
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            self.options.concurrency.workers)
+        try:
+            for iteration_id, item in items:
+                while len(in_flight) >= self.in_flight_limit():
+                    finished, _ = concurrent.futures.wait(
+                        in_flight,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    record_finished(finished)
+                in_flight[executor.submit(
+                    self.timed_process, process, item)] = iteration_id
+            finished, _ = concurrent.futures.wait(in_flight)
+            record_finished(finished)
+        except KeyboardInterrupt:
+            # Drop the rows that are still queued, but let the ones already
+            # talking to the API finish, so we know what got imported
+            print('Interrupted - waiting for the rows in progress to finish')
+            for future in in_flight:
+                future.cancel()
+            raise
+        except Exception:
+            for future in in_flight:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+
+    def run_async(self, max_in_flight=1000):
+        '''Runs the import with the asyncio engine - see
+        process_all_async().
+        '''
+        self.options.concurrency.use_async = True
+        self.options.concurrency.max_in_flight = max_in_flight
+        self.run()
+
+    def process_all_async(self, items, process, loopstats):
+        '''Like process_all(), but everything runs on one asyncio event loop.
+
+        process() is still called for each item in turn, so the existing
+        process_row() payload builders are used unchanged, but its calls to
+        post_payload() don't wait for the response. Instead up to
+        max_in_flight requests are kept open on the loop at once, which suits
+        imports of many small records where the time goes on waiting for the
+        API rather than on the CPU.
+        '''
+        if aiohttp is None:
+            raise click.UsageError(
+                '--async needs the aiohttp package, which isn\'t installed - '
+                'pip install -r requirements-async.txt')
+
+        in_flight = {}
+        loop = asyncio.new_event_loop()
+        main = loop.create_task(self._process_all_async(
+            loop, items, process, loopstats, in_flight))
+        try:
+            loop.run_until_complete(main)
+        except KeyboardInterrupt:
+            print('Interrupted - cancelling the uploads in progress')
+            raise
+        finally:
+            if not main.done():
+                tasks = list(in_flight) + [main]
+                for task in tasks:
+                    task.cancel()
+                loop.run_until_complete(
+                    asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    async def _process_all_async(
+            self, loop, items, process, loopstats, in_flight):
+        slot_freed = asyncio.Event()
+        # set if an upload gave up on the API, to stop the import
+        aborted = []
+
+        def record(outcome, iteration_id, start):
+            loopstats.add(outcome, iteration_id, time.perf_counter() - start)
+            loopstats.print_every_x_seconds(self.options.reporting.every)
+
+        def finished(task):
+            slot_freed.set()
+            iteration_id, start = in_flight.pop(task)
+            if task.cancelled():
+                return
+            try:
+                outcome = task.result()
+            except ImportAborted as e:
+                aborted.append(e)
+                return
+            except Exception as e:
+                outcome = 'ERROR: could not POST - {}'.format(e)
+            record(outcome, iteration_id, start)
+
+        headers = {}
+        if self.token:
+            headers['Authorization'] = 'Token {0}'.format(self.token)
+        connector = aiohttp.TCPConnector(
+            limit=self.options.concurrency.max_in_flight)
+        async with aiohttp.ClientSession(
+                connector=connector, headers=headers) as session:
+            self.async_loop = loop
+            self.async_session = session
+            try:
+                for iteration_id, item in items:
+                    while len(in_flight) >= self.in_flight_limit():
+                        slot_freed.clear()
+                        await slot_freed.wait()
+                    if aborted:
+                        raise aborted[0]
+                    outcome, start = self.timed_process(process, item)
+                    if isinstance(outcome, asyncio.Future):
+                        in_flight[outcome] = iteration_id, start
+                        outcome.add_done_callback(finished)
+                    else:
+                        record(outcome, iteration_id, start)
+                    # give the uploads a chance to progress between rows
+                    await asyncio.sleep(0)
+                if in_flight:
+                    await asyncio.wait(list(in_flight))
+                self.flush_batches()
+                if aborted:
+                    raise aborted[0]
+            finally:
+                self.async_loop = None
+                self.async_session = None
+
+
+class PayloadBatcher(object):
+    '''Collects payloads into batches of at most batch_size records and
+    batch_bytes of JSON, and POSTs each full batch to the bulk url as a JSON
+    array.
+
+    If the API rejects a batch with a 4xx it is split in half and the halves
+    are sent again, until the records it doesn't like are isolated, so one bad
+    record only fails itself.
+    '''
+    def __init__(self, command, url, options):
+        self.command = command
+        self.url = url
+        self.batch_size = options.batch_size
+        self.batch_bytes = options.batch_bytes
+        self.lock = threading.Lock()
+        self.batch = []
+        self.num_bytes = 2
+
+    def add(self, payload, identifier=None):
+        '''Adds the payload to the current batch, and returns a Future for
+        its outcome. Sends the batch first if it's full.
+        '''
+        start = time.perf_counter()
+        encoded = self.command.encode_payload(payload, (',', ':'))
+        self.command.add_timing('serialize', time.perf_counter() - start)
+        future = concurrent.futures.Future()
+        full_batches = []
+        with self.lock:
+            if self.batch and \
+                    self.num_bytes + len(encoded) + 1 > self.batch_bytes:
+                full_batches.append(self.take_batch())
+            self.batch.append((encoded, identifier, future))
+            self.num_bytes += len(encoded) + 1
+            if len(self.batch) >= self.batch_size:
+                full_batches.append(self.take_batch())
+        # POST outside the lock, so other threads can carry on batching
+        for batch in full_batches:
+            self.post_batch(batch)
+        return future
+
+    def flush(self):
+        with self.lock:
+            batch = self.take_batch()
+        if batch:
+            self.post_batch(batch)
+
+    def take_batch(self):
+        batch = self.batch
+        self.batch = []
+        self.num_bytes = 2
+        return batch
+
+    def post_batch(self, batch):
+        body = b'[' + b','.join(encoded for encoded, _, _ in batch) + b']'
+        description = '{} (batch of {})'.format(batch[0][1], len(batch))
+        start = time.perf_counter()
+        try:
+            response = self.command.send_request(
+                self.url, data=body, headers=JSON_HEADERS)
+        except requests.exceptions.RequestException as e:
+            self.command.add_timing('network', time.perf_counter() - start)
+            print('ERROR: could not import {0} because of {1}'.format(
+                description, e))
+            outcome = 'ERROR: could not POST - {}'.format(e)
+            for encoded, identifier, future in batch:
+                self.command.write_dead_letter(
+                    identifier, None, str(e), encoded_payload=encoded)
+                future.set_result(outcome)
+            return
+
+        self.command.add_timing('network', time.perf_counter() - start)
+
+        if 400 <= response.status_code < 500 and len(batch) > 1:
+            middle = len(batch) // 2
+            self.post_batch(batch[:middle])
+            self.post_batch(batch[middle:])
+            return
+
+        start = time.perf_counter()
+        status_code = response.status_code
+        if status_code == 200:
+            status_code = 201
+        outcome = self.command.response_outcome(
+            status_code, response.text,
+            batch[0][1] if len(batch) == 1 else description)
+        for encoded, identifier, future in batch:
+            if outcome != 'imported':
+                self.command.write_dead_letter(
+                    identifier, response.status_code, response.text,
+                    encoded_payload=encoded)
+            future.set_result(outcome)
+        self.command.add_timing('response', time.perf_counter() - start)
+
 
 class CSVImportCommand(ImportCommand):
+    # FieldMapping of the columns to the payload (see mapping.py), which is
+    # compiled into self.extract(row) for the header of each file
+    mapping = None
+
     def __init__(
             self, file_names, api_url, token,
             skip_header=False, encoding=None, expected_header=None,
-            num_expected_records=None):
-        self.api_url = api_url
-        self.token = token
-        self.file_names = file_names
+            num_expected_records=None, **options):
+        super(CSVImportCommand, self).__init__(api_url, token, **options)
+        # the CSVs in zip files are imported one after another
+        self.file_names = expand_inputs(file_names)
         self.skip_header = skip_header
         self.encoding = encoding
         self.expected_header = expected_header
         self.num_expected_records = num_expected_records
+        self.extract = None
+
+    def __getstate__(self):
+        # the compiled function can't be pickled - each --jobs process
+        # compiles the mapping again
+        state = super(CSVImportCommand, self).__getstate__()
+        state['extract'] = None
+        return state
 
     def process_row(self, row):
         pass
 
+    def count_records(self, file_name):
+        return count_csv_records(file_name, self.skip_header)
+
+    def cache_version(self):
+        return '{} {}'.format(
+            super(CSVImportCommand, self).cache_version(), self.encoding)
+
+    def filter_lines(self, lines, skip):
+        '''Returns the lines of the file to parse. It can be overridden to
+        skip the lines of unwanted rows without parsing them, calling
+        skip(outcome, iteration_id) for each, so that its outcome is recorded
+        - and checkpointed and cached - like those of process_row().
+        '''
+        return lines
+
+    def process_row_or_skipped(self, row):
+        if isinstance(row, SkippedRow):
+            return row.outcome
+        return self.process_row(row)
+
+    def read_header(self, file_name):
+        with open_input(file_name) as csvfile:
+            return next(csv.reader(LineReader(csvfile, self.encoding)))
+
     def check_header(self, header, expected_header):
         if header != expected_header:
             return False
         return True
 
+    def import_file(self, file_name, loopstats):
+        checkpoint = self.open_checkpoint(file_name, loopstats)
+        if checkpoint.complete:
+            return
+        cache = self.open_payload_cache(file_name)
+        if self.replays_cache(cache, checkpoint):
+            return self.replay_payload_cache(cache, checkpoint)
+        with open_input(file_name) as csvfile:
+            lines = LineReader(csvfile, self.encoding, checkpoint.position)
+            reader = csv.reader(lines, delimiter=',', quotechar='"')
+
+            # If we want to skip the header from process_row()
+            # it means we have an header. We analyse if the header is
+            # in the format we expect, if we provide an expected_header
+            header = None
+            if self.skip_header and not checkpoint.position:
+                header = next(reader)
+
+                if self.expected_header is not None:
+                    if not self.check_header(header, self.expected_header):
+                        print('ERROR - Headers not matching: \n{0}\n{1}'
+                              .format(header, self.expected_header))
+                        return False
+            elif self.skip_header and self.mapping is not None:
+                # resuming - the mapping still needs the file's header
+                header = self.read_header(file_name)
+            if self.mapping is not None:
+                self.extract = self.mapping.compile(
+                    header or self.expected_header)
+
+            # the rest of the lines - the csv reader only reads a line at a
+            # time, so this carries on from the one after the header
+            skipped = collections.deque()
+
+            def skip(outcome, iteration_id):
+                skipped.append(
+                    (iteration_id, SkippedRow(outcome), lines.offset))
+            reader = csv.reader(self.filter_lines(lines, skip),
+                                delimiter=',', quotechar='"')
+            self.process_all_checkpointed(
+                with_skipped_rows(
+                    ((row, row, lines.offset) for row in reader), skipped),
+                self.process_row_or_skipped, checkpoint, cache)
+
     def run(self):
-        for file_name in self.file_names:
-            print('Processing {0}'.format(file_name))
-            with open(
-                    file_name,
-                    newline='', encoding=self.encoding) as csvfile:
-
-                loopstats = LoopStats(self.num_expected_records)
-                reader = csv.reader(csvfile, delimiter=',', quotechar='"')
-
-                # If we want to skip the header from process_row()
-                # it means we have an header. We analyse if the header is
-                # in the format we expect, if we provide an expected_header
-                if self.skip_header:
-                    header = next(reader)
-
-                    if 'expected_header' in dir(self):
-                        if not self.check_header(header, self.expected_header):
-                            print('ERROR - Headers not matching: \n{0}\n{1}'
-                                  .format(header, self.expected_header))
-                            break
-
-                for count, row in enumerate(reader):
-                    outcome = self.process_row(row)
-                    loopstats.add(outcome, row)
-                    loopstats.print_every_x_iterations(100)
+        loopstats = self.import_files(self.file_names)
+        self.remove_checkpoints(self.file_names)
 
         # Use GOV.UK Notify to send a notification when import is completed
         self.notify_import_completed(''.join(self.file_names))
 
-        print(loopstats)
+        loopstats.report()
         if 'postprocess' in dir(self):
             self.postprocess()
-            print(loopstats)
+            loopstats.report()
 
 
 class ShapefileImportCommand(ImportCommand):
-    def __init__(self, file_name, api_url, token, num_expected_records=None):
-        self.api_url = api_url
-        self.token = token
+    def __init__(
+            self, file_name, api_url, token, num_expected_records=None,
+            **options):
+        super(ShapefileImportCommand, self).__init__(
+            api_url, token, **options)
         self.file_name = file_name
         self.num_expected_records = num_expected_records
 
     def process_record(self, record):
         pass
 
+    def count_records(self, partition):
+        file_name, start, stop = split_partition(partition)
+        if stop is None:
+            return count_shapefile_records(file_name)
+        return stop - start
+
+    def process_shape_record(self, record):
+        if record.shape.shapeType == shapefile.NULL:
+            return 'no shapefile'
+        return self.process_record(record)
+
+    def partitions(self):
+        '''Returns the names of the parts of the shapefile to import: just
+        the file name, or with --jobs, a few parts per process of about the
+        same number of bytes, e.g. 'polygons.shp.records-0-51234'.
+        '''
+        jobs = self.options.concurrency.jobs
+        if jobs == 1:
+            return [self.file_name]
+        shp_reader = open_shapefile(self.file_name)
+        try:
+            offsets = shx_offsets(shp_reader)
+        finally:
+            close_shapefile(shp_reader)
+        boundaries = partition_records(offsets, jobs * 4)
+        return [partition_name(self.file_name, start, stop)
+                for start, stop in zip(boundaries, boundaries[1:])]
+
+    def check_checkpoints(self, partitions):
+        '''Stops a --resume if the shapefile's checkpoints are of other
+        parts than these, i.e. it was imported with another --jobs, rather
+        than starting again and leaving them behind.
+        '''
+        if not self.options.checkpoint.resume:
+            return
+        saved = glob.glob(glob.escape(sidecar_path(
+            self.file_name, '')) + '.records-*.checkpoint')
+        saved.append(sidecar_path(self.file_name, '.checkpoint'))
+        others = set(filter(os.path.exists, saved)) - set(
+            sidecar_path(partition, '.checkpoint')
+            for partition in partitions)
+        if others:
+            raise click.UsageError(
+                '{} has checkpoints saved with another --jobs: {} - resume '
+                'with the same --jobs, or remove them to start again'.format(
+                    self.file_name, ', '.join(sorted(others))))
+
+    def import_file(self, partition, loopstats):
+        file_name, start, stop = split_partition(partition)
+        checkpoint = self.open_checkpoint(partition, loopstats)
+        if checkpoint.complete:
+            return
+        # the payloads of the whole file are cached, not those of a part
+        cache = self.open_payload_cache(file_name) if stop is None else None
+        if self.replays_cache(cache, checkpoint):
+            return self.replay_payload_cache(cache, checkpoint)
+        shp_reader = open_shapefile(file_name)
+        start = checkpoint.position or start
+        try:
+            self.process_all_checkpointed(
+                ((record.record[0], record, index + 1)
+                 for index, record in enumerate(
+                     iter_shape_records(shp_reader, start, stop), start)),
+                self.process_shape_record, checkpoint, cache)
+        finally:
+            close_shapefile(shp_reader)
+
     def run(self):
-        print('Processing shapefile {}'.format(self.file_name))
-        loopstats = LoopStats(self.num_expected_records)
-        shp_reader = shapefile.Reader(self.file_name)
-        for record in shp_reader.iterShapeRecords():
-            if record.shape.shapeType == shapefile.NULL:
-                loopstats.add('no shapefile', record.record[0])
-                continue
-            outcome = self.process_record(record)
-            loopstats.add(outcome, record.record[0])
-            loopstats.print_every_x_iterations(100)
+        partitions = self.partitions()
+        self.check_checkpoints(partitions)
+        loopstats = self.import_files(partitions)
+        self.remove_checkpoints(partitions)
 
         # Use GOV.UK Notify to send a notification when import is completed
         self.notify_import_completed(self.file_name)
 
-        print(loopstats)
+        loopstats.report()
         if 'postprocess' in dir(self):
             self.postprocess()
-            print(loopstats)
+            loopstats.report()
+
+
+# in place of a row that CSVImportCommand.filter_lines() skipped
+SkippedRow = collections.namedtuple('SkippedRow', 'outcome')
+
+
+def with_skipped_rows(items, skipped):
+    '''Yields the items, each after the skipped rows that came before it
+    in the file.
+    '''
+    for item in items:
+        while skipped:
+            yield skipped.popleft()
+        yield item
+    while skipped:
+        yield skipped.popleft()
+
+
+def as_geometry(geometry):
+    '''Returns a GeoJSON dict or pyshp shape as a Geometry.'''
+    if isinstance(geometry, Geometry):
+        return geometry
+    if isinstance(geometry, dict):
+        return Geometry.from_geo_interface(geometry)
+    return Geometry.from_shape(geometry)
+
+
+def iter_shape_records(shp_reader, start=0, stop=None):
+    '''Yields the shape records of a shapefile, from record number start
+    until stop.
+    '''
+    if not start and stop is None:
+        return shp_reader.iterShapeRecords()
+    # the .shx index lets shapeRecord() jump straight to each record
+    return (shp_reader.shapeRecord(i)
+            for i in range(start, shp_reader.numRecords
+                           if stop is None else stop))
+
+
+def shx_offsets(shp_reader):
+    '''Returns the offsets in the .shp file of each record, from the .shx
+    index.
+    '''
+    shx = shp_reader.shx
+    shx.seek(100)
+    # the big-endian offset and length of each record, in 16 bit words
+    index = array.array('i', shx.read())
+    if sys.byteorder == 'little':
+        index.byteswap()
+    return [offset * 2 for offset in index[0::2]]
+
+
+def partition_records(offsets, num_partitions):
+    '''Returns the record numbers to split the records at to make
+    num_partitions parts of about the same number of bytes, from 0 to the
+    number of records.
+    '''
+    boundaries = [0]
+    if offsets:
+        first, size = offsets[0], offsets[-1] - offsets[0]
+        for part in range(1, num_partitions):
+            boundary = bisect.bisect_left(
+                offsets, first + size * part / num_partitions)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(len(offsets))
+    return boundaries
+
+
+def partition_name(file_name, start, stop):
+    return '{}.records-{}-{}'.format(file_name, start, stop)
+
+
+def split_partition(partition):
+    '''Returns (file name, start, stop) for a name from partition_name(), or
+    (file name, 0, None) for the whole of a file.
+    '''
+    match = PARTITION_NAME.match(partition)
+    if match is None:
+        return partition, 0, None
+    return match.group(1), int(match.group(2)), int(match.group(3))
+
+
+PARTITION_NAME = re.compile(r'^(.*)\.records-(\d+)-(\d+)$')
@@ -0,0 +1,250 @@
+'''
+Opens the input files of the importers straight from the compressed files
+they are downloaded as, without unpacking them first:
+
+    codepoints.csv.gz, Stops.csv.bz2   decompressed as they are read
+    codepo_gb.zip                      all the CSVs in the zip file
+    codepo_gb.zip/Data/CSV/cb.csv      one of them
+    greenbelts.zip                     the shapefile in the zip file
+    greenbelts.zip/England/gb.shp      one of several
+    motorways.shp.gz                   with motorways.shx.gz and .dbf.gz
+
+The members of zip files are read through file-like objects, so nothing is
+written to disk - apart from shapefiles in zip files on Python 3.6 and
+earlier, where zip members can't seek, which are copied to temporary files
+first. Uncompressed shapefiles are read through memory maps.
+'''
+import bz2
+import gzip
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+import shapefile
+
+
+SHAPEFILE_EXTENSIONS = ('.shp', '.shx', '.dbf')
+
+# zip members that can't seek are copied to temporary files, which are only
+# written to disk once they are bigger than this
+SPOOL_SIZE = 16 * 1024 * 1024
+
+SKIP_SIZE = 1024 * 1024
+
+
+def split_archive_path(file_name):
+    '''Returns (zip file, member) for a path to a member of a zip file e.g.
+    codepo_gb.zip/Data/CSV/cb.csv, or (None, None) for any other path.
+    '''
+    index = file_name.lower().find('.zip/')
+    while index != -1:
+        archive = file_name[:index + len('.zip')]
+        if os.path.isfile(archive):
+            return archive, file_name[index + len('.zip/'):]
+        index = file_name.lower().find('.zip/', index + 1)
+    return None, None
+
+
+def is_zip(file_name):
+    return file_name.lower().endswith('.zip')
+
+
+def expand_inputs(file_names, extension='.csv'):
+    '''Returns the file names, with each zip file replaced by the paths of
+    its members with the extension.
+    '''
+    expanded = []
+    for file_name in file_names:
+        if is_zip(file_name):
+            with zipfile.ZipFile(file_name) as zip_file:
+                expanded.extend(
+                    '{}/{}'.format(file_name, member)
+                    for member in sorted(zip_file.namelist())
+                    if member.lower().endswith(extension))
+        else:
+            expanded.append(file_name)
+    return expanded
+
+
+def sidecar_path(file_name, suffix):
+    '''Returns the path of a file to keep alongside an input, e.g. its
+    checkpoint. For a member of a zip file it is next to the zip file.
+    '''
+    archive, member = split_archive_path(file_name)
+    if archive is not None:
+        file_name = '{}-{}'.format(archive, member.replace('/', '-'))
+    return file_name + suffix
+
+
+def open_input(file_name):
+    '''Opens an input file for reading bytes, decompressing it as it is read
+    if it is .gz or .bz2, or a member of a zip file.
+    '''
+    archive, member = split_archive_path(file_name)
+    if archive is not None:
+        with zipfile.ZipFile(archive) as zip_file:
+            # the member keeps the zip file open until it is closed itself
+            return zip_file.open(member)
+    lower_name = file_name.lower()
+    if lower_name.endswith('.gz'):
+        return gzip.open(file_name, 'rb')
+    if lower_name.endswith('.bz2'):
+        return bz2.open(file_name, 'rb')
+    return open(file_name, 'rb')
+
+
+def skip_to(input_file, position):
+    '''Moves a file just opened by open_input() on to a byte position, by
+    reading up to it if the file can't seek (as zip members can't before
+    Python 3.7).
+    '''
+    if input_file.seekable():
+        input_file.seek(position)
+        return
+    while position > 0:
+        data = input_file.read(min(position, SKIP_SIZE))
+        if not data:
+            break
+        position -= len(data)
+
+
+def open_shapefile(file_name):
+    '''Returns a shapefile.Reader for a .shp file, or for a shapefile in a
+    zip file or compressed with .gz or .bz2.
+    '''
+    archive, member = split_archive_path(file_name)
+    if archive is None and is_zip(file_name):
+        archive = file_name
+    if archive is not None:
+        return shapefile.Reader(**open_zipped_shapefile(archive, member))
+
+    for compression in ('.gz', '.bz2'):
+        if file_name.lower().endswith('.shp' + compression):
+            base_name = file_name[:-len('.shp' + compression)]
+            files = {}
+            for extension in SHAPEFILE_EXTENSIONS:
+                path = base_name + extension + compression
+                files[extension[1:]] = LazySeekFile(
+                    open_input(path), gzip_size(path)) \
+                    if compression == '.gz' else open_input(path)
+            return shapefile.Reader(**files)
+    base_name, extension = os.path.splitext(file_name)
+    if extension.lower() not in SHAPEFILE_EXTENSIONS:
+        base_name = file_name
+    files = {}
+    for extension in SHAPEFILE_EXTENSIONS:
+        for path in (base_name + extension, base_name + extension.upper()):
+            if os.path.exists(path):
+                files[extension[1:]] = map_file(path)
+                break
+    if 'shp' not in files:
+        # for shapefile.Reader's error
+        return shapefile.Reader(file_name)
+    return shapefile.Reader(**files)
+
+
+def close_shapefile(shp_reader):
+    '''Closes the files of a shapefile.Reader from open_shapefile(). Its own
+    close(), where pyshp has one, leaves the memory maps and zip members
+    that were passed to it open.
+    '''
+    for shapefile_file in (shp_reader.shp, shp_reader.shx, shp_reader.dbf):
+        if shapefile_file is not None:
+            shapefile_file.close()
+    if hasattr(shp_reader, 'close'):
+        shp_reader.close()
+
+
+def map_file(file_name):
+    '''Returns a read-only memory map of a file, which reads like a file but
+    without a system call for each of the many little reads of a shapefile.
+    '''
+    with open(file_name, 'rb') as mapped_file:
+        return mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def open_zipped_shapefile(archive, member=None):
+    '''Returns the shp, shx and dbf file objects of the shapefile member
+    (the .shp file, or the only one if None) of a zip file.
+    '''
+    zip_file = zipfile.ZipFile(archive)
+    members = {info.filename.lower(): info for info in zip_file.infolist()}
+    if member is None:
+        shps = [name for name in members if name.endswith('.shp')]
+        if len(shps) != 1:
+            raise ValueError(
+                '{} holds {} shapefiles - give the path of the .shp in it, '
+                'e.g. {}/{}'.format(archive, len(shps), archive,
+                                    shps[0] if shps else 'name.shp'))
+        member = members[shps[0]].filename
+    base_name = os.path.splitext(member)[0].lower()
+    files = {}
+    for extension in SHAPEFILE_EXTENSIONS:
+        info = members.get(base_name + extension)
+        if info is None:
+            raise ValueError('{} has no {}{}'.format(
+                archive, base_name, extension))
+        files[extension[1:]] = open_zip_member(zip_file, info)
+    zip_file.close()
+    return files
+
+
+def open_zip_member(zip_file, info):
+    '''Returns a file object for a member of a zip file that can seek.'''
+    member = zip_file.open(info)
+    if member.seekable():
+        return LazySeekFile(member, info.file_size)
+    with member:
+        copy = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+        shutil.copyfileobj(member, copy)
+    copy.seek(0)
+    return copy
+
+
+def gzip_size(file_name):
+    '''Returns the uncompressed size of a gzip file (modulo 4GB), from the
+    last 4 bytes of it.
+    '''
+    with open(file_name, 'rb') as gzip_file:
+        gzip_file.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', gzip_file.read(4))[0]
+
+
+class LazySeekFile(object):
+    '''Wraps a file that can only seek by decompressing everything up to the
+    new position, e.g. a member of a zip file. Seeks are put off until the
+    file is next read, so the way shapefile.Reader finds the size of a file -
+    seeking to the end and straight back - costs nothing. The file must have
+    just been opened, as its position is kept track of here rather than asked
+    for with tell().
+    '''
+    def __init__(self, file, size):
+        self.file = file
+        self.size = size
+        self.position = 0
+        self.file_position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = offset
+        return offset
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        if self.file_position != self.position:
+            self.file.seek(self.position)
+        data = self.file.read(size)
+        self.position += len(data)
+        self.file_position = self.position
+        return data
+
+    def close(self):
+        self.file.close()
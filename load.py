@@ -0,0 +1,80 @@
+'''
+Sends the payloads written by an importer with --transform-to (see
+payload_shards.py) to the API.
+
+The payloads are uploaded the same way as by the importers, so the import
+options like --workers, --async and --batch-size can be used, and --jobs
+sends several shards at once. Each shard goes to the url its payloads were
+made for, unless --apiurl is given.
+
+Example usage:
+
+    python import_codepoints.py codepo_gb.zip --transform-to /data/codepoints --compress
+    python load.py /data/codepoints --apitoken $API_LOCAL_TOKEN --workers 8 --jobs 4
+'''
+import json
+
+import click
+
+from checkpoint import LineReader
+from importers import (
+    ImportCommand, checkpoint_options, import_options, jobs_option)
+from inputs import open_input
+from payload_shards import read_shard_url, shard_files
+from profiling import profile_options
+from record_counts import count_lines
+
+
+class LoadImportCommand(ImportCommand):
+    def __init__(self, file_names, api_url, token, **options):
+        super(LoadImportCommand, self).__init__(api_url, token, **options)
+        self.file_names = shard_files(file_names)
+        # --apiurl, which overrides the urls in the shards
+        self.fixed_url = api_url
+
+    def count_records(self, file_name):
+        return count_lines(file_name)
+
+    def process_line(self, line):
+        return self.post_payload(line['payload'], line['identifier'])
+
+    def import_file(self, file_name, loopstats):
+        checkpoint = self.open_checkpoint(file_name, loopstats)
+        if checkpoint.complete:
+            return
+        self.use_url(self.fixed_url or read_shard_url(file_name))
+        with open_input(file_name) as shard_file:
+            lines = LineReader(shard_file, 'utf-8', checkpoint.position)
+            self.process_all_checkpointed(
+                ((line['identifier'], line, lines.offset)
+                 for line in map(json.loads, lines)),
+                self.process_line, checkpoint)
+
+    def run(self):
+        loopstats = self.import_files(self.file_names)
+        self.remove_checkpoints(self.file_names)
+        self.dead_letters.close()
+        loopstats.report()
+        return loopstats
+
+
+@click.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@click.option(
+    '--apiurl', default=None,
+    help='API url (default: the one each shard\'s payloads were made for)')
+@click.option('--apitoken', help='API authentication token')
+@import_options
+@jobs_option
+@checkpoint_options
+@profile_options
+def load(paths, apiurl, apitoken, **options):
+    if not paths:
+        raise click.UsageError(
+            'Give the shards to load, or the directories they are in')
+    command = LoadImportCommand(paths, apiurl, apitoken, **options)
+    command.run()
+
+
+if __name__ == '__main__':
+    load()
@@ -1,4 +1,7 @@
 import datetime
+import math
+import random
+import threading
 import time
 from collections import defaultdict
 
@@ -28,48 +31,332 @@ class LoopStats(object):
             loopstats.add('error: {}'.format(e), x['id'])
         else:
             loopstats.add('processed ok', x['id'])
-        loopstats.print_every_x_iterations(100)
-    print(loopstats)
+        loopstats.print_every_x_seconds(10)
+    loopstats.report()
+
+    By default every iteration_id is kept, in loopstats.outcomes. For loops
+    over millions of rows, compact=True keeps just the counts, and a few
+    example ids of each outcome, so that the memory used stays the same
+    however long the loop goes on. Since outcomes often include an error
+    message, which could make every one different, it also only keeps track
+    of max_outcomes different outcomes, and counts the rest together.
+
+    To see where the time goes, add_timing() records how long each stage of
+    an iteration took (e.g. 'read', 'network'), and add() can be given how
+    long the whole iteration took. The stats then show percentiles of each:
+
+        Timings (ms)                         p50       p95       p99
+        read                               0.003     0.005     0.011
+        network                            1.521     3.620     8.611
+        imported                           1.810     4.305    10.240
+
+    add_total() keeps a running total of anything else worth reporting, e.g.
+    the bytes saved by rounding coordinates:
+
+        Totals: 2,310,460 geometry bytes, 1,502,114 geometry bytes saved
+
+    report() prints the stats, and writes a snapshot() of them to each of
+    loopstats.sinks, for monitoring a long import (see metrics.py).
     '''
-    def __init__(self, num_iterations=None):
+    def __init__(self, num_iterations=None, compact=False, max_examples=5,
+                 max_outcomes=50):
         '''
         num_iterations - the expected number of iterations in the loop.
                          It's requred if you want it to show progress % and
                          estimate remaining time.
+        compact - only keep max_examples ids of each outcome, and
+                  max_outcomes different outcomes
         '''
         self.start_time = time.time()
         self.outcomes = defaultdict(list)
+        self.counts = defaultdict(int)
         self.count = 0
+        # iterations done before this run, e.g. before resuming an import
+        self.count_before_start = 0
         self.num_iterations = num_iterations
+        self.compact = compact
+        self.max_examples = max_examples
+        self.max_outcomes = max_outcomes
+        # stage or outcome: Histogram of how long they took
+        self.stage_timings = defaultdict(Histogram)
+        self.outcome_timings = defaultdict(Histogram)
+        # name: running total, see add_total()
+        self.totals = defaultdict(int)
+        # timings can be added by several worker threads
+        self.timings_lock = threading.Lock()
+        # objects with a write(snapshot) method that report() passes a
+        # snapshot() to, e.g. the sinks in metrics.py
+        self.sinks = []
+        self.last_report = self.start_time
+        # see call_every_x_iterations()
+        self.callback_every = None
+        self.callback = None
+
+    def __getstate__(self):
+        # LoopStats kept by --jobs worker processes are sent back to be merged
+        state = self.__dict__.copy()
+        del state['timings_lock']
+        state['callback_every'] = state['callback'] = None
+        return state
 
-    def add(self, outcome, iteration_id):
-        self.outcomes[outcome or 'processed'].append(iteration_id)
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.timings_lock = threading.Lock()
+
+    def outcome_key(self, outcome):
+        '''Returns the outcome to count an iteration under - the outcome
+        itself, unless there are too many different ones already.
+        '''
+        outcome = outcome or 'processed'
+        if self.compact and outcome not in self.counts and \
+                len(self.counts) >= self.max_outcomes:
+            return OTHER_OUTCOMES
+        return outcome
+
+    def add(self, outcome, iteration_id, seconds=None):
+        '''Counts an iteration. seconds is how long it took, if known.'''
+        outcome = self.outcome_key(outcome)
+        self.counts[outcome] += 1
         self.count += 1
+        if seconds is not None:
+            with self.timings_lock:
+                self.outcome_timings[outcome].add(seconds)
+        if self.compact:
+            self.add_example(outcome, iteration_id)
+        else:
+            self.outcomes[outcome].append(iteration_id)
+        if self.callback_every and self.count % self.callback_every == 0:
+            self.callback(self)
+
+    def call_every_x_iterations(self, num_iterations, callback):
+        '''Has add() call callback(loopstats) every num_iterations, e.g. to
+        take a memory snapshot with --profile-memory-every.
+        '''
+        self.callback_every = num_iterations
+        self.callback = callback
+
+    def add_timing(self, stage, seconds):
+        '''Records how long one stage of an iteration took.'''
+        with self.timings_lock:
+            self.stage_timings[stage].add(seconds)
+
+    def add_total(self, name, amount):
+        '''Adds amount to the running total called name.'''
+        with self.timings_lock:
+            self.totals[name] += amount
+
+    def add_example(self, outcome, iteration_id):
+        '''Keeps iteration_id as an example of the outcome, if it is one of
+        max_examples picked at random from the count so far (reservoir
+        sampling). The first example is always kept, to show in the stats.
+        '''
+        examples = self.outcomes[outcome]
+        if len(examples) < self.max_examples:
+            examples.append(iteration_id)
+            return
+        index = random.randrange(self.counts[outcome])
+        if 0 < index < self.max_examples:
+            examples[index] = iteration_id
+
+    def add_count(self, outcome, count, example=None):
+        '''Adds iterations that were done before this run started, e.g. those
+        recorded in a checkpoint of an import that is being resumed.
+        '''
+        outcome = self.outcome_key(outcome)
+        self.counts[outcome] += count
+        if example is not None:
+            if self.compact:
+                self.add_example(outcome, example)
+            else:
+                self.outcomes[outcome].append(example)
+        self.count += count
+        self.count_before_start += count
+
+    def merge(self, other):
+        '''Adds in the outcomes counted by another LoopStats, e.g. one kept by
+        a worker process.
+        '''
+        for outcome, count in other.counts.items():
+            outcome_key = self.outcome_key(outcome)
+            self.counts[outcome_key] += count
+            for row in other.outcomes.get(outcome, ()):
+                if self.compact:
+                    self.add_example(outcome_key, row)
+                else:
+                    self.outcomes[outcome_key].append(row)
+        for stage, histogram in other.stage_timings.items():
+            self.stage_timings[stage].merge(histogram)
+        for outcome, histogram in other.outcome_timings.items():
+            self.outcome_timings[self.outcome_key(outcome)].merge(histogram)
+        for name, amount in other.totals.items():
+            self.totals[name] += amount
+        self.count += other.count
+        self.count_before_start += other.count_before_start
+        self.start_time = min(self.start_time, other.start_time)
 
     def print_every_x_iterations(self, num_iterations, **kwargs):
         if self.count % num_iterations != 0 or self.count == 0:
             return
-        print(self.stats(self, **kwargs))
+        print(self.stats(**kwargs))
+
+    def print_every_x_seconds(self, seconds):
+        '''Reports the stats if it's been that long since they last were.
+        Unlike print_every_x_iterations() it costs next to nothing on a fast
+        loop, and still reports on a slow one.
+        '''
+        if time.time() - self.last_report >= seconds:
+            self.report()
+
+    def report(self):
+        '''Prints the stats and writes a snapshot of them to the sinks.'''
+        self.last_report = time.time()
+        print(self.stats())
+        if self.sinks:
+            snapshot = self.snapshot()
+            for sink in self.sinks:
+                sink.write(snapshot)
 
     def __str__(self):
-        return self.stats(self)
+        return self.stats()
 
-    def stats(self, print_rate=True):
+    def progress(self):
+        '''Returns (seconds taken, iterations per second this run, seconds
+        remaining, fraction complete). The last two are None unless
+        num_iterations was given.
+        '''
         time_taken = time.time() - self.start_time
-        rate_per_hour = self.count / (time_taken) * 60 * 60
-        for outcome, rows in self.outcomes.items():
-            print('{:,} {} e.g. {}'.format(len(rows), outcome, rows[0]))
+        count_this_run = self.count - self.count_before_start
+        rate = count_this_run / time_taken if time_taken > 0 else 0.0
+        time_remaining = fraction_complete = None
+        if self.num_iterations:
+            fraction_complete = float(self.count) / self.num_iterations
+            if count_this_run:
+                time_remaining = max(time_taken * (
+                    self.num_iterations - self.count) / count_this_run, 0)
+        return time_taken, rate, time_remaining, fraction_complete
+
+    def stats(self, print_rate=True):
+        time_taken, rate, time_remaining, fraction_complete = self.progress()
+        lines = ['{:,} {} e.g. {}'.format(
+            count, outcome,
+            self.outcomes[outcome][0] if self.outcomes.get(outcome) else '-')
+            for outcome, count in self.counts.items()]
         stats = 'Count: {:,}'.format(self.count)
         if print_rate:
-            stats += ' Rate: {:,.0f}/hour'.format(round(rate_per_hour, -3))
+            stats += ' Rate: {:,.0f}/hour'.format(round(rate * 60 * 60, -3))
         if print_rate:
             stats += ' Time: {} taken' \
                 .format(datetime.timedelta(seconds=int(time_taken)))
-        if self.num_iterations:
-            percent_complete = float(self.count) / self.num_iterations * 100
-            time_remaining = time_taken * \
-                (self.num_iterations / self.count - 1.0)
+        if time_remaining is not None:
             stats += ', {} remaining. Progress: {:.0f}%'.format(
                 datetime.timedelta(seconds=int(time_remaining)),
-                percent_complete)
-        return stats + '\n'
+                fraction_complete * 100)
+        lines.append(stats)
+        if self.totals:
+            lines.append('Totals: ' + ', '.join(
+                '{:,} {}'.format(amount, name)
+                for name, amount in sorted(self.totals.items())))
+        return '\n'.join(lines) + '\n' + self.timings()
+
+    def snapshot(self):
+        '''Returns the stats as a dict, for the metrics sinks (see
+        metrics.py). Timings are in seconds.
+        '''
+        time_taken, rate, time_remaining, fraction_complete = self.progress()
+        with self.timings_lock:
+            stages = {stage: histogram.quantiles()
+                      for stage, histogram in self.stage_timings.items()}
+            outcomes = {outcome: histogram.quantiles()
+                        for outcome, histogram in self.outcome_timings.items()}
+        return {
+            'time': time.time(),
+            'count': self.count,
+            'num_iterations': self.num_iterations,
+            'outcomes': dict(self.counts),
+            'seconds_taken': time_taken,
+            'rate_per_second': rate,
+            'seconds_remaining': time_remaining,
+            'fraction_complete': fraction_complete,
+            'stage_seconds': stages,
+            'outcome_seconds': outcomes,
+            'totals': dict(self.totals),
+        }
+
+    def timings(self):
+        '''Returns lines of the percentiles of the stage and outcome timings,
+        or '' if none were recorded.
+        '''
+        with self.timings_lock:
+            histograms = sorted(self.stage_timings.items(),
+                                key=lambda item: STAGES.index(item[0])
+                                if item[0] in STAGES else len(STAGES)) + \
+                sorted(self.outcome_timings.items())
+            if not histograms:
+                return ''
+            lines = ['{:<30} {:>9} {:>9} {:>9}'.format(
+                'Timings (ms)', 'p50', 'p95', 'p99')]
+            for name, histogram in histograms:
+                lines.append('{:<30} {:>9.3f} {:>9.3f} {:>9.3f}'.format(
+                    name[:30], *(histogram.percentile(percent) * 1000
+                                 for percent in (50, 95, 99))))
+        return '\n'.join(lines) + '\n'
+
+
+# the stages of importing a row, in order
+STAGES = ['read', 'transform', 'serialize', 'network', 'response']
+
+
+class Histogram(object):
+    '''Counts of durations, in buckets that get 2^(1/4) times (19%) wider
+    each time, from a microsecond up. That makes percentiles accurate to
+    within 10%, from a few dozen counts however many durations are added.
+    '''
+    MIN_SECONDS = 1e-6
+    BUCKETS_PER_DOUBLING = 4
+
+    def __init__(self):
+        # bucket index: count
+        self.buckets = defaultdict(int)
+        self.count = 0
+        # the seconds of them all, for the _sum of a Prometheus summary
+        self.total = 0.0
+
+    def add(self, seconds):
+        if seconds > self.MIN_SECONDS:
+            index = int(math.log2(seconds / self.MIN_SECONDS) *
+                        self.BUCKETS_PER_DOUBLING) + 1
+        else:
+            index = 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percent):
+        '''Returns the duration that percent of those added were within (the
+        top of the bucket it falls in).
+        '''
+        rank = percent / 100.0 * self.count
+        running_count = 0
+        for index in sorted(self.buckets):
+            running_count += self.buckets[index]
+            if running_count >= rank:
+                return self.MIN_SECONDS * \
+                    2 ** (index / float(self.BUCKETS_PER_DOUBLING))
+        return 0.0
+
+    def quantiles(self, percents=(50, 95, 99)):
+        '''Returns {'p50': seconds, ...}, the count and the sum.'''
+        quantiles = {'p{}'.format(percent): self.percentile(percent)
+                     for percent in percents}
+        quantiles['count'] = self.count
+        quantiles['sum'] = self.total
+        return quantiles
+
+
+OTHER_OUTCOMES = '(other outcomes)'
@@ -0,0 +1,168 @@
+'''
+A manifest remembers what was imported last time, so that a re-import of a
+monthly dataset can send only the records that are new or have changed, with
+--changed-only.
+
+It maps each record's natural key (e.g. the postcode of a Code-Point row) to
+a hash of the payload that was imported for it. Both are stored as 64 bit
+hashes, in the file and in memory: the keys sorted in one array and the
+payload hashes in another, looked up by bisecting the keys. That is 16 bytes
+per record - about 30MB for all of Code-Point - plus another 16 for each
+record that is new or has changed, until the manifest is saved. Only payloads
+the API accepted are added, so a record that failed is sent again next time.
+'''
+import array
+import bisect
+import hashlib
+import heapq
+import itertools
+import operator
+import os
+import threading
+
+import payload_json
+
+
+MAGIC = b'LAIMANIFEST1\n'
+
+
+def digest(data):
+    '''64 bit hash of a string or bytes.'''
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return int.from_bytes(hashlib.sha1(data).digest()[:8], 'little')
+
+
+# number of updates sorted at a time when saving
+RUN_SIZE = 65536
+
+
+class Manifest(object):
+    def __init__(self, path, key_field):
+        self.path = path
+        self.key_field = key_field
+        # the key hashes saved last time, sorted, and their payload hashes
+        self.keys = array.array('Q')
+        self.payload_hashes = array.array('Q')
+        # key hash, payload hash, ... of the payloads imported since it was
+        # loaded, in the order they were imported
+        self.updates = array.array('Q')
+        self.lock = threading.Lock()
+
+    def load(self):
+        '''Reads the saved manifest, if there is one. Returns True if it was
+        loaded.
+        '''
+        try:
+            with open(self.path, 'rb') as manifest_file:
+                if manifest_file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(
+                        'Not a manifest file: {}'.format(self.path))
+                pairs = array.array('Q')
+                pairs.frombytes(manifest_file.read())
+        except FileNotFoundError:
+            return False
+        keys = pairs[0::2]
+        if all(map(operator.lt, keys, keys[1:])):
+            self.keys, self.payload_hashes = keys, pairs[1::2]
+        else:
+            self.keys, self.payload_hashes = merge_runs(
+                [pairs_of(run) for run in sorted_runs(pairs)])
+        return True
+
+    def hash_payload(self, payload):
+        '''Returns (key hash, payload hash) for a payload, or (None, None) if
+        it has no natural key.
+        '''
+        key = payload.get(self.key_field)
+        if key is None:
+            return None, None
+        encoded = payload_json.dumps(
+            payload, sort_keys=True, separators=(',', ':'), default=str)
+        return digest(str(key)), digest(encoded)
+
+    def saved_hash(self, key_hash):
+        '''Returns the payload hash saved for the key hash, or None.'''
+        index = bisect.bisect_left(self.keys, key_hash)
+        if index < len(self.keys) and self.keys[index] == key_hash:
+            return self.payload_hashes[index]
+        return None
+
+    def unchanged(self, key_hash, payload_hash):
+        '''Returns True if the payload is the one imported last time.'''
+        if key_hash is None:
+            return False
+        return self.saved_hash(key_hash) == payload_hash
+
+    def update(self, key_hash, payload_hash):
+        if key_hash is None or self.saved_hash(key_hash) == payload_hash:
+            return
+        with self.lock:
+            self.updates.append(key_hash)
+            self.updates.append(payload_hash)
+
+    def merge(self, updates):
+        '''Adds the updates made by another process.'''
+        with self.lock:
+            self.updates.extend(updates)
+
+    def save(self):
+        if not self.updates:
+            return
+        with self.lock:
+            updates, self.updates = self.updates, array.array('Q')
+        runs = [zip(self.keys, self.payload_hashes)]
+        runs.extend(pairs_of(run) for run in sorted_runs(updates))
+        del updates
+        self.keys, self.payload_hashes = merge_runs(runs)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # as with checkpoints, never leave half a file behind
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as manifest_file:
+            manifest_file.write(MAGIC)
+            for start in range(0, len(self.keys), RUN_SIZE):
+                stop = start + RUN_SIZE
+                pairs = array.array('Q', itertools.chain.from_iterable(
+                    zip(self.keys[start:stop],
+                        self.payload_hashes[start:stop])))
+                manifest_file.write(pairs.tobytes())
+        os.replace(temp_path, self.path)
+
+
+def sorted_runs(pairs):
+    '''Returns the array of key hash, payload hash, ... pairs as arrays of
+    RUN_SIZE pairs at a time, each sorted by the key hashes.
+    '''
+    runs = []
+    for start in range(0, len(pairs), 2 * RUN_SIZE):
+        run = pairs[start:start + 2 * RUN_SIZE]
+        runs.append(array.array('Q', itertools.chain.from_iterable(
+            sorted(zip(run[0::2], run[1::2]),
+                   key=operator.itemgetter(0)))))
+    return runs
+
+
+def pairs_of(run):
+    '''Returns an iterator of the (key hash, payload hash) pairs of a run.'''
+    return zip(itertools.islice(run, 0, None, 2),
+               itertools.islice(run, 1, None, 2))
+
+
+def merge_runs(runs):
+    '''Merges iterators of (key hash, payload hash) pairs sorted by key hash
+    into an array of the key hashes and one of their payload hashes. Where a
+    key hash is in several runs, or several times in one, the last pair
+    wins.
+    '''
+    keys = array.array('Q')
+    payload_hashes = array.array('Q')
+    merged = heapq.merge(*runs, key=operator.itemgetter(0))
+    for key_hash, pairs in itertools.groupby(
+            merged, key=operator.itemgetter(0)):
+        for _, payload_hash in pairs:
+            pass
+        keys.append(key_hash)
+        payload_hashes.append(payload_hash)
+    return keys, payload_hashes
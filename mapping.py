@@ -0,0 +1,131 @@
+'''
+Declarative mappings from the columns of a CSV row to the fields of an API
+payload, e.g.
+
+    CODEPOINT_MAPPING = FieldMapping([
+        ('postcode', Column('Postcode', normalise_postcode)),
+        ('quality', 'Positional_quality_indicator'),
+        ('point', Point(Column('Eastings', float),
+                        Column('Northings', float))),
+        ('srid', Constant(27700)),
+    ], columns=CODEPOINT_COLUMNS)
+
+A column is given by its name in the header or, for files without one, in
+columns - or simply by its index. A plain string or int is short for
+Column(name) with no converter. Rows without a value in each of the required
+columns are skipped, with None in place of their payload.
+
+compile() turns a mapping into a function of the row that returns the
+payload. It looks up the columns once, and generates the code for the
+function, so a row is turned into a payload by a single dict display of
+row[i] and converter calls:
+
+    def extract(row):
+        return {'postcode': _0(row[0]), 'quality': row[1], ...}
+'''
+
+
+class Column(object):
+    def __init__(self, name, convert=None):
+        '''
+        name - the column's name in the header, or its index
+        convert - function to call on the value e.g. float
+        '''
+        self.name = name
+        self.convert = convert
+
+    def expression(self, compiler):
+        code = 'row[{}]'.format(compiler.index(self.name))
+        if self.convert is None:
+            return code
+        return '{}({})'.format(compiler.add_name(self.convert), code)
+
+
+class Constant(object):
+    def __init__(self, value):
+        self.value = value
+
+    def expression(self, compiler):
+        return compiler.add_name(self.value)
+
+
+class Point(object):
+    '''A GeoJSON Point of the x and y columns.'''
+    def __init__(self, x, y):
+        self.x = as_field(x)
+        self.y = as_field(y)
+
+    def expression(self, compiler):
+        return "{{'type': 'Point', 'coordinates': [{}, {}]}}".format(
+            self.x.expression(compiler), self.y.expression(compiler))
+
+
+class Fields(object):
+    '''A nested dict of fields, in the order given.'''
+    def __init__(self, fields):
+        self.fields = [(name, as_field(field)) for name, field in fields]
+
+    def expression(self, compiler):
+        return '{' + ', '.join(
+            '{!r}: {}'.format(name, field.expression(compiler))
+            for name, field in self.fields) + '}'
+
+
+def as_field(field):
+    if isinstance(field, (str, int)):
+        return Column(field)
+    return field
+
+
+class FieldMapping(Fields):
+    def __init__(self, fields, columns=None, required=()):
+        '''
+        fields - (payload field, column or field) pairs
+        columns - the column names, for files without a header
+        required - the columns a row must have a value in to be imported
+        '''
+        super(FieldMapping, self).__init__(fields)
+        self.columns = columns
+        self.required = [as_field(column) for column in required]
+        # tuple of header: compiled function
+        self.compiled = {}
+
+    def compile(self, header=None):
+        '''Returns a function that takes a row with the header (or
+        self.columns, if header is None) and returns the payload.
+        '''
+        header = tuple(header or self.columns or ())
+        extract = self.compiled.get(header)
+        if extract is None:
+            compiler = Compiler(header)
+            source = 'def extract(row):\n'
+            if self.required:
+                source += '    if not ({}):\n        return None\n'.format(
+                    ' and '.join(column.expression(compiler)
+                                 for column in self.required))
+            source += '    return {}\n'.format(self.expression(compiler))
+            exec(compile(source, '<FieldMapping>', 'exec'),
+                 compiler.namespace)
+            extract = self.compiled[header] = compiler.namespace['extract']
+            extract.source = source
+        return extract
+
+
+class Compiler(object):
+    def __init__(self, header):
+        self.indexes = {name: index for index, name in enumerate(header)}
+        # the converters and constants used by the generated code
+        self.namespace = {}
+
+    def index(self, name):
+        if isinstance(name, int):
+            return name
+        try:
+            return self.indexes[name]
+        except KeyError:
+            raise ValueError('Column {!r} is not in the header'.format(name))
+
+    def add_name(self, value):
+        name = '_{}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
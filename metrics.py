@@ -0,0 +1,121 @@
+'''
+Sinks for LoopStats snapshots, so that a long import can be watched by
+something other than a person reading its output.
+
+JSONLinesSink appends each snapshot to a file as a line of JSON:
+
+    {"time": 1488369600.0, "importer": "CodepointImportCommand",
+     "count": 120000, "outcomes": {"imported": 119990, ...},
+     "rate_per_second": 412.5, "seconds_remaining": 4000.1, ...}
+
+PrometheusTextfileSink rewrites a file in the Prometheus text format each
+time, for node_exporter's textfile collector to pick up:
+
+    landavailability_import_records_total{importer="...",outcome="imported"} 119990
+    landavailability_import_stage_seconds{importer="...",stage="network",quantile="0.99"} 0.0084
+'''
+import json
+import os
+
+
+class JSONLinesSink(object):
+    def __init__(self, path, labels=None):
+        self.path = path
+        # added to every snapshot, e.g. {'importer': 'CodepointImportCommand'}
+        self.labels = labels or {}
+
+    def write(self, snapshot):
+        line = dict(self.labels)
+        line.update(snapshot)
+        with open(self.path, 'a', encoding='utf-8') as metrics_file:
+            metrics_file.write(json.dumps(line, sort_keys=True) + '\n')
+
+
+class PrometheusTextfileSink(object):
+    def __init__(self, path, labels=None, prefix='landavailability_import'):
+        self.path = path
+        self.labels = labels or {}
+        self.prefix = prefix
+
+    def write(self, snapshot):
+        text = prometheus_text(snapshot, self.labels, self.prefix)
+        # the collector may read it at any moment, so never let it see half
+        # a file
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(text)
+        os.replace(temp_path, self.path)
+
+
+def prometheus_text(snapshot, labels=None, prefix='landavailability_import'):
+    '''Returns a LoopStats snapshot in the Prometheus text format.'''
+    labels = labels or {}
+    lines = []
+
+    def metric(name, metric_type, help_text, samples):
+        name = '{}_{}'.format(prefix, name)
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for sample_labels, value in samples:
+            if value is None:
+                continue
+            all_labels = dict(labels)
+            all_labels.update(sample_labels)
+            lines.append('{}{} {}'.format(
+                name, format_labels(all_labels), repr(float(value))))
+
+    metric('records_total', 'counter', 'Records processed, by outcome.',
+           [({'outcome': outcome}, count)
+            for outcome, count in sorted(snapshot['outcomes'].items())])
+    metric('records_expected', 'gauge', 'Records expected in the input.',
+           [({}, snapshot['num_iterations'])])
+    metric('rate_per_second', 'gauge',
+           'Records processed per second this run.',
+           [({}, snapshot['rate_per_second'])])
+    metric('seconds_taken', 'gauge', 'Seconds since the import started.',
+           [({}, snapshot['seconds_taken'])])
+    metric('seconds_remaining', 'gauge',
+           'Estimated seconds until the import finishes.',
+           [({}, snapshot['seconds_remaining'])])
+    metric('fraction_complete', 'gauge',
+           'Fraction of the expected records processed.',
+           [({}, snapshot['fraction_complete'])])
+    for kind, key in (('stage', 'stage_seconds'),
+                      ('outcome', 'outcome_seconds')):
+        metric(key, 'summary', 'Seconds taken, by {}.'.format(kind),
+               quantile_samples(kind, snapshot[key]))
+        for name, quantiles in sorted(snapshot[key].items()):
+            all_labels = dict(labels)
+            all_labels[kind] = name
+            for total in ('sum', 'count'):
+                lines.append('{}_{}_{}{} {}'.format(
+                    prefix, key, total, format_labels(all_labels),
+                    repr(float(quantiles[total]))))
+    metric('last_update_timestamp_seconds', 'gauge',
+           'When this snapshot was taken.', [({}, snapshot['time'])])
+    return '\n'.join(lines) + '\n'
+
+
+def quantile_samples(kind, quantiles_by_name):
+    samples = []
+    for name, quantiles in sorted(quantiles_by_name.items()):
+        for quantile, seconds in sorted(quantiles.items()):
+            if quantile not in ('count', 'sum'):
+                samples.append((
+                    {kind: name,
+                     'quantile': str(int(quantile[1:]) / 100.0)},
+                    seconds))
+    return samples
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, escape_label_value(value))
+        for name, value in sorted(labels.items())) + '}'
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
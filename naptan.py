@@ -0,0 +1,61 @@
+'''
+The layout of NaPTAN's Stops.csv, and the payloads made from it for the bus
+stop, metro/tube and train stop endpoints.
+'''
+from mapping import Column, Constant, FieldMapping, Point
+
+
+NAPTAN_HEADER = [
+    'ATCOCode', 'NaptanCode', 'PlateCode', 'CleardownCode', 'CommonName',
+    'CommonNameLang', 'ShortCommonName', 'ShortCommonNameLang', 'Landmark',
+    'LandmarkLang', 'Street', 'StreetLang', 'Crossing', 'CrossingLang',
+    'Indicator', 'IndicatorLang', 'Bearing', 'NptgLocalityCode',
+    'LocalityName', 'ParentLocalityName', 'GrandParentLocalityName',
+    'Town', 'TownLang', 'Suburb', 'SuburbLang', 'LocalityCentre',
+    'GridType', 'Easting', 'Northing', 'Longitude', 'Latitude', 'StopType',
+    'BusStopType', 'TimingStatus', 'DefaultWaitTime', 'Notes', 'NotesLang',
+    'AdministrativeAreaCode', 'CreationDateTime', 'ModificationDateTime',
+    'RevisionNumber', 'Modification', 'Status'
+]
+
+STOP_TYPE = NAPTAN_HEADER.index('StopType')
+
+# StopTypes of the stops each endpoint wants
+BUS_STOP_TYPES = frozenset(['BCT', 'BCE', 'BST', 'BCS', 'BCQ'])
+METRO_TUBE_STOP_TYPES = frozenset(['TMU', 'MET', 'PLT'])
+TRAIN_STOP_TYPES = frozenset(['RSE', 'RLY', 'RPL'])
+
+POINT = Point(Column('Longitude', float), Column('Latitude', float))
+SRID = Constant(4326)
+
+BUS_STOP_MAPPING = FieldMapping([
+    ('amic_code', 'ATCOCode'),
+    ('point', POINT),
+    ('name', 'CommonName'),
+    ('direction', 'Indicator'),
+    ('area', 'ParentLocalityName'),
+    ('road', 'Street'),
+    ('nptg_code', 'NaptanCode'),
+    ('srid', SRID),
+], columns=NAPTAN_HEADER)
+
+METRO_TUBE_MAPPING = FieldMapping([
+    ('atco_code', 'ATCOCode'),
+    ('name', 'CommonName'),
+    ('naptan_code', 'NaptanCode'),
+    ('locality', 'LocalityName'),
+    ('point', POINT),
+    ('srid', SRID),
+], columns=NAPTAN_HEADER)
+
+TRAIN_STOP_MAPPING = FieldMapping([
+    ('atcode_code', 'ATCOCode'),
+    ('naptan_code', 'NaptanCode'),
+    ('point', POINT),
+    ('main_road', 'Street'),
+    ('side_road', Constant('')),
+    ('type', 'Landmark'),
+    ('nptg_code', 'NptgLocalityCode'),
+    ('local_reference', 'ShortCommonName'),
+    ('srid', SRID),
+], columns=NAPTAN_HEADER)
@@ -0,0 +1,143 @@
+'''
+The options of ImportCommand, in groups for the parts of an import they
+change. The click commands pass them on as keyword arguments, e.g.
+workers=8, batch_size=100, which ImportOptions sorts into the groups:
+
+    concurrency   --jobs, --workers, --max-in-flight, --pool-size, --async
+                  and --adaptive
+    retry         --retries and --breaker-threshold
+    bulk          --batch-size, --batch-bytes and --bulk-url
+    checkpoint    --resume and --checkpoint-every
+    manifest      --changed-only and --manifest
+    cache         --cache
+    transform     --transform-to, --shard-size and --compress
+    reporting     --report-every, --metrics-jsonl, --metrics-prom and
+                  --dead-letters
+    geometry      --round-coordinates, --precision and --simplify
+'''
+import collections
+import inspect
+
+from geometry import PRECISION
+from retry import CircuitBreaker, RetryPolicy
+
+
+DEFAULT_CHECKPOINT_EVERY = 10000
+
+
+class ConcurrencyOptions(object):
+    def __init__(self, jobs=1, workers=1, max_in_flight=None, pool_size=None,
+                 use_async=False, adaptive=False):
+        self.jobs = max(jobs or 1, 1)
+        self.workers = max(workers or 1, 1)
+        self.use_async = use_async
+        self.max_in_flight = max_in_flight or (
+            1000 if use_async else self.workers * 2)
+        self.pool_size = pool_size or max(10, self.workers)
+        self.adaptive = adaptive
+
+
+class RetryOptions(object):
+    def __init__(self, retries=3, breaker_threshold=20):
+        self.policy = RetryPolicy(retries)
+        self.breaker = CircuitBreaker(breaker_threshold)
+
+
+class BulkOptions(object):
+    def __init__(self, batch_size=None, batch_bytes=1000000, bulk_url=None):
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        # None for the API url
+        self.url = bulk_url
+
+
+class CheckpointOptions(object):
+    def __init__(self, resume=False, checkpoint_every=None):
+        self.resume = resume
+        # off unless asked for, as they are written next to the input files
+        if checkpoint_every is None:
+            checkpoint_every = DEFAULT_CHECKPOINT_EVERY if resume else 0
+        self.every = checkpoint_every
+
+
+class ManifestOptions(object):
+    def __init__(self, changed_only=False, manifest=None):
+        self.changed_only = changed_only
+        # None for the default, in ~/.landavailability-import/
+        self.path = manifest
+
+
+class CacheOptions(object):
+    def __init__(self, cache=None):
+        self.directory = cache
+
+
+class TransformOptions(object):
+    def __init__(self, transform_to=None, shard_size=100000, compress=False):
+        self.directory = transform_to
+        self.shard_size = shard_size
+        self.compress = compress
+
+
+class ReportingOptions(object):
+    def __init__(self, report_every=10, metrics_jsonl=None, metrics_prom=None,
+                 dead_letters=None):
+        self.every = report_every
+        self.metrics_jsonl = metrics_jsonl
+        self.metrics_prom = metrics_prom
+        self.dead_letters = dead_letters
+
+
+class GeometryOptions(object):
+    def __init__(self, round_coordinates=False, precision=None,
+                 simplify=None):
+        self.round_coordinates = round_coordinates
+        self.precision = precision
+        self.simplify = simplify
+
+    def shrinks(self):
+        '''Returns True if the options change the geometries at all.'''
+        return bool(self.round_coordinates or self.precision is not None or
+                    self.simplify)
+
+    def shrink(self, geometry, srid):
+        '''Returns the Geometry simplified and rounded as the options say.'''
+        if self.simplify:
+            geometry = geometry.simplified(self.simplify)
+        decimals = self.precision
+        if decimals is None and self.round_coordinates:
+            decimals = PRECISION.get(srid)
+        if decimals is not None:
+            geometry = geometry.rounded(decimals)
+        return geometry
+
+    def version(self):
+        return '{} {} {}'.format(
+            self.round_coordinates, self.precision, self.simplify)
+
+
+class ImportOptions(object):
+    '''Sorts the keyword arguments of ImportCommand into the groups, with the
+    defaults for the ones that aren't given.
+    '''
+    GROUPS = collections.OrderedDict([
+        ('concurrency', ConcurrencyOptions),
+        ('retry', RetryOptions),
+        ('bulk', BulkOptions),
+        ('checkpoint', CheckpointOptions),
+        ('manifest', ManifestOptions),
+        ('cache', CacheOptions),
+        ('transform', TransformOptions),
+        ('reporting', ReportingOptions),
+        ('geometry', GeometryOptions),
+    ])
+
+    def __init__(self, **options):
+        for name, group in self.GROUPS.items():
+            setattr(self, name, group(**{
+                argument: options.pop(argument)
+                for argument in inspect.signature(group).parameters
+                if argument in options}))
+        if options:
+            raise TypeError('Unknown import options: {}'.format(
+                ', '.join(sorted(options))))
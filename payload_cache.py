@@ -0,0 +1,160 @@
+'''
+A cache of the payloads made from an input file, so that importing the same
+file again - e.g. the real import after a --dry-run, or another go once the
+API has been fixed - sends the payloads straight to the API without reading
+and transforming the file again.
+
+With --cache DIR, an import that reads a whole file from the start saves what
+each record came to in DIR/<importer>-<hash of the path>.payloads:
+
+    LAPAYLOADS1\\n
+    <length><key>         JSON of the path, size, mtime and importer version
+    <length><entry>...    marshal of (iteration id, outcome, payloads)
+
+where payloads is a list of (target, identifier, payload) for each call of
+post_payload() - target being the index of the ImportCommand that made it,
+for importers that post to several endpoints. The outcome is only kept for a
+record that posted nothing, e.g. "no shapefile".
+
+The file is only kept if the whole input is imported, and is only used if
+the input file and the importer's code are just as they were. It is read
+through a memory map.
+'''
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from inputs import split_archive_path
+from manifest import digest
+from payload_json import without_geometries
+
+
+MAGIC = b'LAPAYLOADS1\n'
+LENGTH = struct.Struct('<I')
+
+
+def cache_key(file_name, version):
+    '''Returns the key of the input file's cache, which changes whenever the
+    file or the importer does.
+    '''
+    archive, member = split_archive_path(file_name)
+    stat = os.stat(archive or file_name)
+    return {
+        'path': os.path.abspath(file_name),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'version': version,
+        # marshal's format can change between versions of Python
+        'python': sys.version_info[:2],
+    }
+
+
+def source_version():
+    '''Returns a hash of the source of the modules loaded from this directory
+    - the importer, its FieldMappings and the helpers they use - which stands
+    for the version of the importer.
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sources = []
+    for name, module in sorted(list(sys.modules.items())):
+        path = getattr(module, '__file__', None)
+        if path and path.endswith('.py') and \
+                os.path.dirname(os.path.abspath(path)) == directory:
+            with open(path, 'rb') as source_file:
+                sources.append(source_file.read())
+    return '{:016x}'.format(digest(b'\n'.join(sources)))
+
+
+class PayloadCache(object):
+    def __init__(self, directory, importer_name, file_name, version):
+        self.path = os.path.join(directory, '{}-{:016x}.payloads'.format(
+            importer_name, digest(os.path.abspath(file_name))))
+        self.key = json.loads(json.dumps(cache_key(file_name, version)))
+        self.file = None
+        self.lock = threading.Lock()
+        # until a record can't be saved
+        self.complete = True
+
+    def exists(self):
+        '''Returns True if there is a complete cache for the input file as it
+        is now.
+        '''
+        try:
+            with open(self.path, 'rb') as cache_file:
+                if cache_file.read(len(MAGIC)) != MAGIC:
+                    return False
+                length, = LENGTH.unpack(cache_file.read(LENGTH.size))
+                return json.loads(
+                    cache_file.read(length).decode('utf-8')) == self.key
+        except (OSError, ValueError, struct.error):
+            return False
+
+    def entries(self, start=0):
+        '''Yields (iteration id, outcome, payloads) for each record, from
+        entry number start on.
+        '''
+        with open(self.path, 'rb') as cache_file, \
+                mmap.mmap(cache_file.fileno(), 0,
+                          access=mmap.ACCESS_READ) as mapped:
+            offset = len(MAGIC)
+            length, = LENGTH.unpack_from(mapped, offset)
+            offset += LENGTH.size + length
+            index = 0
+            end = len(mapped)
+            while offset < end:
+                length, = LENGTH.unpack_from(mapped, offset)
+                offset += LENGTH.size
+                if index >= start:
+                    yield marshal.loads(mapped[offset:offset + length])
+                offset += length
+                index += 1
+
+    def start_writing(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path + '.tmp', 'wb')
+        key = json.dumps(self.key, sort_keys=True).encode('utf-8')
+        self.file.write(MAGIC + LENGTH.pack(len(key)) + key)
+
+    def write(self, iteration_id, outcome, payloads):
+        if payloads:
+            # the identifiers of the payloads stand in for it
+            iteration_id = outcome = None
+        else:
+            if not isinstance(iteration_id, (str, int, list, tuple)):
+                iteration_id = str(iteration_id)
+            if not isinstance(outcome, str):
+                outcome = None
+        try:
+            try:
+                entry = marshal.dumps((iteration_id, outcome, payloads))
+            except ValueError:
+                # a Geometry is saved as its GeoJSON
+                entry = marshal.dumps((iteration_id, outcome,
+                                       without_geometries(payloads)))
+        except ValueError:
+            # e.g. a date in a payload, which marshal can't save - the cache
+            # would be missing the record, so it can't be kept
+            self.complete = False
+            return
+        with self.lock:
+            if self.file is not None:
+                self.file.write(LENGTH.pack(len(entry)) + entry)
+
+    def finish(self):
+        '''Keeps the cache, once every record has been written to it.'''
+        self.close(keep=self.complete)
+
+    def close(self, keep=False):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+            if keep:
+                os.replace(self.path + '.tmp', self.path)
+            else:
+                os.remove(self.path + '.tmp')
@@ -0,0 +1,123 @@
+'''
+Encodes payloads as JSON, like json.dumps(), apart from also taking
+Geometry objects (see geometry.py) as values, which it writes as their
+GeoJSON straight from their arrays of coordinates - without making the
+nested lists of __geo_interface__ first. The text is exactly what
+json.dumps() makes of the payload with __geo_interface__ in place of each
+Geometry, so payloads can hold a Geometry wherever they would hold its
+GeoJSON.
+
+The rest of the payload is encoded by json.dumps(), with a placeholder for
+each Geometry, which is then swapped for its GeoJSON. The coordinates of a
+ring are formatted all at once, with a single % of a format string like
+'[%r, %r], [%r, %r], ...', which is quicker than the json module going
+through a list of tuples. The coordinates that were ints in the GeoJSON the
+Geometry was made from get %d in place of %r, so they stay ints.
+'''
+import json
+import math
+
+from geometry import Geometry
+
+
+PLACEHOLDER = '\x00geometry\x00'
+ENCODED_PLACEHOLDER = json.dumps(PLACEHOLDER)
+
+
+def dumps(obj, separators=None, sort_keys=False, default=None):
+    '''Returns obj as JSON text, like json.dumps().'''
+    geometries = []
+
+    def encode_default(value):
+        if isinstance(value, Geometry):
+            geometries.append(value)
+            return PLACEHOLDER
+        if default is None:
+            raise TypeError('Object of type {} is not JSON serializable'
+                            .format(value.__class__.__name__))
+        return default(value)
+
+    if isinstance(obj, Geometry):
+        return encode_geometry(obj, separators, sort_keys)
+    text = json.dumps(obj, separators=separators, sort_keys=sort_keys,
+                      default=encode_default)
+    if not geometries:
+        return text
+    pieces = text.split(ENCODED_PLACEHOLDER)
+    encoded = [pieces[0]]
+    for geometry, piece in zip(geometries, pieces[1:]):
+        encoded.append(encode_geometry(geometry, separators, sort_keys))
+        encoded.append(piece)
+    return ''.join(encoded)
+
+
+def without_geometries(obj):
+    '''Returns the payload (or list or tuple of them) with the GeoJSON of
+    each Geometry in place of it.
+    '''
+    if isinstance(obj, Geometry):
+        return obj.__geo_interface__
+    if isinstance(obj, dict):
+        return {key: without_geometries(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return obj.__class__(without_geometries(value) for value in obj)
+    return obj
+
+
+def encode_geometry(geometry, separators=None, sort_keys=False):
+    '''Returns the GeoJSON text of a Geometry.'''
+    item_separator, key_separator = separators or (', ', ': ')
+    if not all(map(math.isfinite, geometry.coordinates)) or \
+            geometry.z is not None and not math.isfinite(geometry.z):
+        # json writes NaN and Infinity, not repr()'s nan and inf
+        return json.dumps(geometry.__geo_interface__, separators=separators,
+                          sort_keys=sort_keys)
+    coordinates = geometry.coordinates
+    dimensions = geometry.dimensions
+    # the z of with_z() is written out once, in the format, rather than for
+    # every vertex
+    z_format = [] if geometry.z is None else [repr(geometry.z)]
+    position = '[' + item_separator.join(['%r'] * dimensions + z_format) + ']'
+    integers = geometry.integers
+    ring_offsets = geometry.ring_offsets
+    polygon_offsets = geometry.polygon_offsets
+
+    def ring_format(start, end):
+        if integers is None:
+            return item_separator.join([position] * (end - start))
+        return item_separator.join(
+            '[' + item_separator.join([
+                '%d' if integer else '%r' for integer in integers[
+                    vertex * dimensions:(vertex + 1) * dimensions]] +
+                z_format) + ']'
+            for vertex in range(start, end))
+
+    def encode_ring(ring):
+        start = ring_offsets[ring]
+        end = ring_offsets[ring + 1]
+        return '[' + ring_format(start, end) % \
+            tuple(coordinates[start * dimensions:end * dimensions]) + ']'
+
+    def encode_polygon(polygon):
+        return '[' + item_separator.join(
+            encode_ring(ring)
+            for ring in range(polygon_offsets[polygon],
+                              polygon_offsets[polygon + 1])) + ']'
+
+    if geometry.type == 'Point':
+        # just the one position, not in a list
+        text = encode_ring(0)[1:-1] or '[]'
+    elif geometry.type == 'LineString':
+        text = encode_ring(0)
+    elif geometry.type in ('MultiLineString', 'Polygon'):
+        text = encode_polygon(0)
+    else:
+        text = '[' + item_separator.join(
+            encode_polygon(polygon)
+            for polygon in range(geometry.num_polygons())) + ']'
+    members = [('type', json.dumps(geometry.type)), ('coordinates', text)]
+    if sort_keys:
+        members.sort()
+    return '{' + item_separator.join(
+        '"{}"{}{}'.format(key, key_separator, value)
+        for key, value in members) + '}'
@@ -0,0 +1,116 @@
+'''
+Payload shards split an import in two: --transform-to DIR writes the payloads
+an importer makes to files in DIR instead of POSTing them, and load.py sends
+them to the API later - or somewhere else, or more than once.
+
+Each payload is a line of JSON, like a dead letter (see dead_letters.py)
+without the error:
+
+    {"url": "http://localhost:8000/api/codepoints/", "identifier": "CB1 1AA",
+     "payload": {"postcode": "CB11AA", ...}}
+
+The lines are split into shards of --shard-size payloads, named
+<importer>-<process id>-<number>.ndjson (.ndjson.gz with --compress), so
+that the processes of --jobs never share a file and load.py can send
+several shards at once. A shard only has the payloads for one url.
+'''
+import glob
+import gzip
+import json
+import os
+import threading
+
+import payload_json
+from inputs import open_input
+
+
+SHARD_EXTENSIONS = ('.ndjson', '.ndjson.gz')
+
+
+class ShardWriter(object):
+    def __init__(self, directory, prefix, url, shard_size=100000,
+                 compress=False):
+        self.directory = directory
+        self.prefix = prefix
+        self.url = url
+        self.shard_size = shard_size
+        self.compress = compress
+        self.lock = threading.Lock()
+        self.file = None
+        self.num_shards = 0
+        self.num_lines = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['file'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def write(self, payload, identifier=None):
+        line = payload_json.dumps({
+            'url': self.url,
+            'identifier': identifier,
+            'payload': payload,
+        }).encode('utf-8') + b'\n'
+        with self.lock:
+            if self.file is None:
+                self.file = self.open_shard()
+            self.file.write(line)
+            self.num_lines += 1
+            if self.num_lines >= self.shard_size:
+                self.close_shard()
+
+    def open_shard(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, '{}-{}-{:05d}{}'.format(
+            self.prefix, os.getpid(), self.num_shards,
+            SHARD_EXTENSIONS[self.compress]))
+        self.num_shards += 1
+        self.num_lines = 0
+        if self.compress:
+            # level 6 compresses nearly as well as 9, and is much faster
+            return gzip.open(path, 'wb', compresslevel=6)
+        return open(path, 'wb')
+
+    def close_shard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        '''Finishes the shard being written, so the next payload starts a new
+        one.
+        '''
+        with self.lock:
+            self.close_shard()
+
+
+def existing_shards(directory, prefix):
+    return glob.glob(os.path.join(
+        glob.escape(directory), glob.escape(prefix) + '-*.ndjson*'))
+
+
+def shard_files(paths):
+    '''Returns the shard files given, with each directory replaced by the
+    shards in it.
+    '''
+    file_names = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_names.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.endswith(SHARD_EXTENSIONS)))
+        else:
+            file_names.append(path)
+    return file_names
+
+
+def read_shard_url(file_name):
+    '''Returns the url of the payloads in a shard, from its first line.'''
+    with open_input(file_name) as shard_file:
+        line = shard_file.readline()
+    return json.loads(line.decode('utf-8'))['url'] if line.strip() else None
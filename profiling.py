@@ -0,0 +1,237 @@
+'''
+--profile for the import commands, to find where an import spends its time
+and memory without wrapping the script in cProfile by hand:
+
+    python import_codepoints.py codepoints.csv --profile /tmp/codepoints
+
+By default a thread samples the stacks of all the threads every few
+milliseconds (so the --workers threads are included too) and writes:
+
+    /tmp/codepoints.collapsed  one line per stack with the number of samples,
+                               for flamegraph.pl or speedscope
+    /tmp/codepoints.top.txt    the functions most often seen, by their own
+                               samples and with the functions they call
+
+--profiler cprofile uses cProfile instead, which counts every call of the
+main thread, and writes /tmp/codepoints.pstats and the top.txt summary.
+
+--profile-memory-every N also traces memory allocations, and every N records
+writes the lines that allocated the most memory still in use (e.g. the
+greenbelts dict, or LoopStats outcomes) to /tmp/codepoints.memory.txt.
+'''
+import collections
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+
+import click
+
+
+# the Profiler of the running command, if --profile was given
+active_profiler = None
+
+
+def profile_options(command):
+    '''Decorator that adds --profile and its options to a click command, and
+    runs the command under a Profiler when it is given.
+    '''
+    @functools.wraps(command)
+    def profiled_command(*args, **kwargs):
+        prefix = kwargs.pop('profile')
+        profiler_name = kwargs.pop('profiler')
+        top = kwargs.pop('profile_top')
+        memory_every = kwargs.pop('profile_memory_every')
+        if not prefix:
+            return command(*args, **kwargs)
+        with Profiler(prefix, profiler_name, top, memory_every):
+            return command(*args, **kwargs)
+
+    profiled_command = click.option(
+        '--profile-memory-every', type=int, default=0, metavar='N',
+        help='With --profile, write the lines holding the most memory every '
+        'N records (tracing memory makes the import a few times slower)')(
+        profiled_command)
+    profiled_command = click.option(
+        '--profile-top', type=int, default=30, metavar='N',
+        help='Number of functions in the --profile summary (default: 30)')(
+        profiled_command)
+    profiled_command = click.option(
+        '--profiler', type=click.Choice(['sample', 'cprofile']),
+        default='sample',
+        help='sample all threads every few ms (default), or cprofile every '
+        'call of the main thread')(profiled_command)
+    profiled_command = click.option(
+        '--profile', default=None, metavar='PREFIX',
+        help='Profile the import, writing PREFIX.collapsed (or .pstats) and '
+        'PREFIX.top.txt')(profiled_command)
+    return profiled_command
+
+
+def watch_loopstats(loopstats):
+    '''Lets the running Profiler, if there is one, watch loopstats.'''
+    if active_profiler is not None:
+        active_profiler.watch(loopstats)
+
+
+class Profiler(object):
+    '''Context manager that profiles the code run inside it, and writes the
+    results to files starting with prefix when it exits.
+    '''
+    def __init__(self, prefix, profiler='sample', top=30, memory_every=0,
+                 interval=0.005):
+        self.prefix = prefix
+        self.profiler = profiler
+        self.top = top
+        self.memory_every = memory_every
+        self.interval = interval
+        self.pid = os.getpid()
+        self.sampler = None
+        self.cprofile = None
+        self.memory_file = None
+        self.memory_lock = threading.Lock()
+
+    def __enter__(self):
+        global active_profiler
+        active_profiler = self
+        if self.memory_every:
+            tracemalloc.start()
+            self.memory_file = open(self.prefix + '.memory.txt', 'w')
+        if self.profiler == 'cprofile':
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        else:
+            self.sampler = Sampler(self.interval)
+            self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global active_profiler
+        active_profiler = None
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.write_cprofile()
+        else:
+            self.sampler.stop()
+            self.write_samples()
+        if self.memory_every:
+            self.snapshot_memory(None)
+            tracemalloc.stop()
+            self.memory_file.close()
+        print('Wrote the profile to {}.*'.format(self.prefix))
+
+    def watch(self, loopstats):
+        '''Takes memory snapshots as the records are counted in loopstats.'''
+        # not in a --jobs process, which inherited the profiler on fork
+        if self.memory_every and os.getpid() == self.pid:
+            loopstats.call_every_x_iterations(
+                self.memory_every, self.snapshot_memory)
+
+    def snapshot_memory(self, loopstats):
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__)])
+        current, peak = tracemalloc.get_traced_memory()
+        with self.memory_lock:
+            self.memory_file.write(
+                '{}: {:.1f}MB traced (peak {:.1f}MB)\n'.format(
+                    'At the end' if loopstats is None else
+                    'After {:,} records'.format(loopstats.count),
+                    current / 1e6, peak / 1e6))
+            for stat in snapshot.statistics('lineno')[:self.top]:
+                frame = stat.traceback[0]
+                self.memory_file.write('{:>12,} bytes {:>10,} blocks  '
+                                       '{}:{}\n'.format(
+                                           stat.size, stat.count,
+                                           frame.filename, frame.lineno))
+            self.memory_file.write('\n')
+            self.memory_file.flush()
+
+    def write_cprofile(self):
+        self.cprofile.dump_stats(self.prefix + '.pstats')
+        summary = io.StringIO()
+        stats = pstats.Stats(self.cprofile, stream=summary)
+        stats.sort_stats('tottime').print_stats(self.top)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        with open(self.prefix + '.top.txt', 'w') as top_file:
+            top_file.write(summary.getvalue())
+
+    def write_samples(self):
+        stacks = self.sampler.stacks
+        with open(self.prefix + '.collapsed', 'w') as collapsed_file:
+            for stack, count in sorted(stacks.items()):
+                collapsed_file.write('{} {}\n'.format(';'.join(stack), count))
+        with open(self.prefix + '.top.txt', 'w') as top_file:
+            top_file.write(top_functions(stacks, self.top))
+
+
+class Sampler(object):
+    '''Counts the stacks of all the other threads, sampled every interval
+    seconds on a background thread.
+    '''
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        # tuple of function names, outermost first: number of samples
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+        # code object: function name
+        self.names = {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[self.stack(frame)] += 1
+
+    def stack(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            name = self.names.get(code)
+            if name is None:
+                name = self.names[code] = '{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno)
+            names.append(name)
+            frame = frame.f_back
+        return tuple(reversed(names))
+
+
+def top_functions(stacks, top=30):
+    '''Returns a summary of the functions with the most samples of their
+    own, and the most including the functions they call.
+    '''
+    own = collections.Counter()
+    total = collections.Counter()
+    for stack, count in stacks.items():
+        if not stack:
+            continue
+        own[stack[-1]] += count
+        for name in set(stack):
+            total[name] += count
+    num_samples = sum(stacks.values()) or 1
+    lines = ['{:,} samples'.format(sum(stacks.values()))]
+    for title, counts in (('Own samples', own),
+                          ('Samples including calls', total)):
+        lines.append('')
+        lines.append(title + ':')
+        lines.append('{:>8} {:>6}  {}'.format('Samples', '%', 'Function'))
+        for name, count in counts.most_common(top):
+            lines.append('{:>8,} {:>5.1f}%  {}'.format(
+                count, count * 100.0 / num_samples, name))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,159 @@
+'''
+Counts the records in the input files before they are imported, so that
+LoopStats can show how far through the import is and how long is left.
+
+The counts are quick, because they only look at the bytes of the files,
+without parsing anything:
+
+    CSV         the newlines outside of quoted values
+    NDJSON      the lines
+    VOA         the lines starting '01*'
+    shapefile   the size of the .shx index, which has 8 bytes a record
+
+Compressed CSV, NDJSON and VOA files would have to be decompressed to be
+counted, which takes longer than it is worth, so for them the count is None.
+
+A CSV without quotes is counted at about 0.7-0.9 seconds a GB on a slow
+machine, most of which is bytes.count() itself - so it is under a second a
+GB, but not well under. The 1MB chunks with quotes in them take about four
+times as long, so a CSV that quotes every value takes about 3 seconds a GB.
+'''
+import os
+import zipfile
+
+from inputs import gzip_size, is_zip, split_archive_path
+
+
+CHUNK_SIZE = 1024 * 1024
+
+BOM = b'\xef\xbb\xbf'
+
+# every byte apart from '"' and '\n', to delete them with bytes.translate
+NOT_QUOTE_OR_NEWLINE = bytes(
+    byte for byte in range(256) if byte not in b'"\n')
+
+
+def count_csv_records(file_name, skip_header=False):
+    '''Returns the number of rows in a CSV file, not counting the newlines in
+    quoted values, or None if it is compressed.
+    '''
+    if is_compressed(file_name):
+        return None
+    count = 0
+    in_quotes = False
+    last_byte = b'\n'
+    for chunk in iter_chunks(file_name):
+        if not in_quotes and chunk.find(b'"') == -1:
+            # find() is much quicker than translate() - and most CSVs don't
+            # quote anything
+            count += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+            continue
+        # Just the quotes and newlines are needed to tell which newlines are
+        # quoted. Quotes next to each other can go too, two at a time (e.g.
+        # the "" of an escaped quote, or the end of one value and the start
+        # of the next), without changing whether a newline is in quotes.
+        marks = chunk.translate(None, NOT_QUOTE_OR_NEWLINE) \
+            .replace(b'""', b'')
+        count += marks.count(b'\n')
+        # that leaves few enough quotes to go through the quoted parts
+        parts = marks.split(b'"')
+        quoted = parts[0 if in_quotes else 1::2]
+        count -= b''.join(quoted).count(b'\n')
+        if len(parts) % 2 == 0:
+            in_quotes = not in_quotes
+        last_byte = chunk[-1:]
+    if last_byte != b'\n':
+        # the last row has no newline after it
+        count += 1
+    if skip_header and count:
+        count -= 1
+    return count
+
+
+def count_lines(file_name):
+    '''Returns the number of lines in a file e.g. of NDJSON, or None if it is
+    compressed.
+    '''
+    if is_compressed(file_name):
+        return None
+    count = 0
+    last_byte = b'\n'
+    for chunk in iter_chunks(file_name):
+        count += chunk.count(b'\n')
+        last_byte = chunk[-1:]
+    return count if last_byte == b'\n' else count + 1
+
+
+def count_voa_records(file_name):
+    '''Returns the number of '01' records in a VOA file, or None if it is
+    compressed.
+    '''
+    if is_compressed(file_name):
+        return None
+    count = 0
+    for chunk in iter_chunks(file_name, overlap=len(b'\n01*') - 1):
+        if not count and chunk.lstrip(BOM).startswith(b'01*'):
+            # the first record, which has no newline before it
+            count += 1
+        count += chunk.count(b'\n01*')
+    return count
+
+
+def count_shapefile_records(file_name):
+    '''Returns the number of records in a shapefile (or a zip file of one, or
+    a .shp.gz with its .shx.gz etc.) from the size of its .shx index.
+    '''
+    archive, member = split_archive_path(file_name)
+    if archive is None and is_zip(file_name):
+        archive = file_name
+    if archive is not None:
+        with zipfile.ZipFile(archive) as zip_file:
+            shx_sizes = [
+                info.file_size for info in zip_file.infolist()
+                if info.filename.lower().endswith('.shx') and (
+                    member is None or info.filename.lower() ==
+                    os.path.splitext(member)[0].lower() + '.shx')]
+        if len(shx_sizes) != 1:
+            return None
+        return shx_records(shx_sizes[0])
+    lower_name = file_name.lower()
+    if lower_name.endswith('.shp.gz'):
+        return shx_records(gzip_size(file_name[:-len('.shp.gz')] + '.shx.gz'))
+    if lower_name.endswith('.shp'):
+        return shx_records(os.path.getsize(file_name[:-len('.shp')] + '.shx'))
+    return None
+
+
+def shx_records(shx_size):
+    # a 100 byte header, then the offset and length of each record
+    return max(shx_size - 100, 0) // 8
+
+
+def is_compressed(file_name):
+    return split_archive_path(file_name)[0] is not None or \
+        file_name.lower().endswith(('.gz', '.bz2', '.zip'))
+
+
+def iter_chunks(file_name, overlap=0):
+    '''Yields the bytes of a file in CHUNK_SIZE chunks. Each chunk also has
+    the first overlap bytes of the next one, so that a search for something
+    that long finds it in exactly one chunk.
+
+    The chunks are read into the same bytearray, which is small enough to
+    stay in the CPU's cache while it is searched, so each chunk is only good
+    until the next one is read.
+    '''
+    buffer = bytearray(CHUNK_SIZE + overlap)
+    view = memoryview(buffer)
+    with open(file_name, 'rb') as input_file:
+        size = input_file.readinto(buffer)
+        while size:
+            yield buffer if size == len(buffer) else buffer[:size]
+            if size < len(buffer):
+                return
+            # the overlap is the start of the next chunk
+            buffer[:overlap] = buffer[CHUNK_SIZE:]
+            size = input_file.readinto(view[overlap:])
+            if size:
+                size += overlap
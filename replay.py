@@ -0,0 +1,82 @@
+'''
+Sends the payloads in dead letter files (see dead_letters.py) to the API
+again, e.g. once the API has been fixed to accept them, or after editing the
+payloads in the file.
+
+The payloads are uploaded the same way as by the importers, so the import
+options like --workers and --batch-size can be used. Each goes to the url it
+was sent to first time, unless --apiurl is given. Those that fail again are
+written to a new dead letters file.
+
+Example usage:
+
+    python replay.py failed-CodepointImportCommand-20170301-120000.ndjson --apitoken $API_LOCAL_TOKEN
+'''
+import collections
+
+import click
+
+from dead_letters import read_dead_letters
+from importers import ImportCommand, import_options
+from profiling import profile_options
+
+
+class ReplayImportCommand(ImportCommand):
+    def __init__(self, file_names, api_url, token, **options):
+        super(ReplayImportCommand, self).__init__(api_url, token, **options)
+        self.file_names = file_names
+        # --apiurl, which overrides the urls in the dead letters
+        self.fixed_url = api_url
+
+    def process_dead_letter(self, dead_letter):
+        if 'payload' not in dead_letter:
+            return 'not replayed - failed before the payload was made'
+        return self.post_payload(
+            dead_letter['payload'], dead_letter['identifier'])
+
+    def replay_file(self, file_name, loopstats):
+        '''Sends the payloads in a dead letters file, going through it once
+        for each url in it (e.g. the endpoints of import_naptan.py).
+        '''
+        urls = [self.fixed_url] if self.fixed_url else \
+            unique(dead_letter['url']
+                   for dead_letter in read_dead_letters(file_name))
+        for url in urls:
+            print('Replaying {0} to {1}'.format(file_name, url))
+            self.use_url(url)
+            self.process_all(
+                ((dead_letter['identifier'], dead_letter)
+                 for dead_letter in read_dead_letters(file_name)
+                 if self.fixed_url or dead_letter['url'] == url),
+                self.process_dead_letter, loopstats)
+
+    def run(self):
+        loopstats = self.create_loopstats()
+        for file_name in self.file_names:
+            self.replay_file(file_name, loopstats)
+        self.dead_letters.close()
+        loopstats.report()
+        return loopstats
+
+
+def unique(values):
+    '''Returns the different values, in the order they first appear.'''
+    return list(collections.OrderedDict.fromkeys(values))
+
+
+@click.command()
+@click.argument('filenames', nargs=-1, type=click.Path(exists=True))
+@click.option(
+    '--apiurl', default=None,
+    help='API url (default: the one the payloads were first sent to)')
+@click.option('--apitoken', help='API authentication token')
+@import_options
+@profile_options
+def replay(filenames, apiurl, apitoken, **options):
+    if not filenames:
+        raise click.UsageError('Give the dead letter files to replay')
+    command = ReplayImportCommand(filenames, apiurl, apitoken, **options)
+    command.run()
+
+if __name__ == '__main__':
+    replay()
@@ -0,0 +1,197 @@
+'''
+Keeps an import going when the API has a bad moment, without hammering it
+while it's down.
+
+Every request an importer makes goes through ImportCommand, which:
+
+* retries requests that fail with a connection error, a 429 or a 5xx, after
+  a jittered exponential backoff - or as long as the Retry-After header asks
+* with --adaptive, lowers the number of requests in flight when the API
+  slows down or starts failing, and creeps it back up when it recovers
+  (additive increase, multiplicative decrease - like TCP)
+* pauses the whole import when too many requests in a row have failed even
+  after retrying, and gives up after being paused too many times in a row
+
+Requests that fail with any other 4xx are not retried - the record itself
+is the problem, so it is recorded as an error and the import carries on.
+'''
+import email.utils
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+class ImportAborted(Exception):
+    '''Raised to stop an import when the API has stayed down for too long.'''
+
+
+def should_retry(status_code):
+    '''Whether a response with this status (None for a connection error)
+    means the API is struggling, rather than the record being bad.
+    '''
+    return status_code is None or status_code in RETRY_STATUS_CODES
+
+
+def parse_retry_after(value):
+    '''Returns the number of seconds a Retry-After header asks to wait, or
+    None if there isn't one. It can be seconds or an HTTP date.
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy(object):
+    '''How many times to retry a request, and how long to wait in between.'''
+    def __init__(self, retries=3, backoff=0.5, max_backoff=60):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        '''Seconds to wait before retry number `attempt` (counting from 0).
+
+        Waits a random time up to backoff * 2^attempt ("full jitter"), so
+        that workers that failed together don't all retry together.
+        '''
+        retry_after = parse_retry_after(retry_after)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class ConcurrencyController(object):
+    '''Adjusts how many requests may be in flight, between minimum and
+    maximum, from the latency and failures of the responses (AIMD).
+
+    The limit goes up by about one for each limit's worth of healthy
+    responses, and is halved - at most once per round trip - when a response
+    is overloaded or takes more than latency_tolerance times the fastest
+    latency seen (or target_latency, if that is given).
+    '''
+    def __init__(self, maximum, minimum=1, target_latency=None,
+                 latency_tolerance=3.0):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.target_latency = target_latency
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(maximum)
+        self.min_latency = None
+        self.last_decrease = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def current_limit(self):
+        return int(self.limit)
+
+    def slow(self, latency):
+        if self.target_latency:
+            return latency > self.target_latency
+        return latency > self.min_latency * self.latency_tolerance
+
+    def record(self, latency, overloaded=False):
+        '''Records the latency of a response, and whether it was a failure
+        that means the API is overloaded.
+        '''
+        with self.lock:
+            if not overloaded and (self.min_latency is None or
+                                   latency < self.min_latency):
+                self.min_latency = latency
+            if overloaded or self.slow(latency):
+                now = time.monotonic()
+                # the responses to the requests that were already in flight
+                # say nothing about the new limit, so wait a round trip
+                if now - self.last_decrease > latency:
+                    self.last_decrease = now
+                    self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+class CircuitBreaker(object):
+    '''Pauses all requests for a cooldown after `threshold` requests in a row
+    have failed (after retrying).
+
+    The cooldown doubles each time the breaker trips again without a request
+    succeeding in between, up to max_cooldown, and after max_trips the import
+    is stopped with ImportAborted, so it can be resumed when the API is back.
+    '''
+    def __init__(self, threshold=20, cooldown=30, max_cooldown=600,
+                 max_trips=8):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_trips = max_trips
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def wait_time(self):
+        '''Seconds until requests may be sent again, 0 if they may now.'''
+        return max(0, self.open_until - time.monotonic())
+
+    def wait(self):
+        '''Blocks while the breaker is open.'''
+        while True:
+            wait_time = self.wait_time()
+            if not wait_time:
+                return
+            time.sleep(wait_time)
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.trips = 0
+
+    def failed(self):
+        if not self.threshold:
+            return
+        with self.lock:
+            self.failures += 1
+            if self.failures < self.threshold or self.wait_time():
+                return
+            self.trips += 1
+            if self.trips > self.max_trips:
+                raise ImportAborted(
+                    'The API is still failing after pausing {} times - '
+                    'stopping the import'.format(self.max_trips))
+            pause = min(self.max_cooldown,
+                        self.cooldown * 2 ** (self.trips - 1))
+            print('{} requests in a row failed - pausing the import for {}s'
+                  .format(self.failures, pause))
+            self.open_until = time.monotonic() + pause
+            # after the pause one more failure trips it again
+            self.failures = self.threshold - 1
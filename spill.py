@@ -0,0 +1,48 @@
+'''
+A temporary file to put values in until they are wanted again, for grouping
+records that are mostly - but not always - next to each other in a file.
+Each group is dealt with as soon as its last record is read, and only the
+odd group that is interrupted by another is spilled to disk in the meantime,
+so memory is bounded by the biggest group rather than the whole file.
+'''
+import os
+import pickle
+import tempfile
+
+
+class SpillFile(object):
+    def __init__(self, directory=None):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        # the offset and length in the file of each value added, by key
+        self.index = {}
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        self.index.setdefault(key, []).append((offset, len(data)))
+
+    def pop(self, key):
+        '''Returns the values added with the key, in the order they were
+        added, and forgets them.
+        '''
+        values = []
+        for offset, length in self.index.pop(key, []):
+            self.file.seek(offset)
+            values.append(pickle.loads(self.file.read(length)))
+        return values
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
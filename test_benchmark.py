@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+from benchmark import regressions, run_benchmark
+
+
+class TestBenchmark(TestCase):
+    def test_run_benchmark(self):
+        for name in ('codepoints', 'substations'):
+            result = run_benchmark(name, 20)
+
+            self.assertEqual(result['rows'], 20)
+            self.assertEqual(result['requests'], 20)
+            self.assertGreater(result['p99_ms'], 0)
+            self.assertGreaterEqual(result['p99_ms'], result['p50_ms'])
+            self.assertGreater(result['rows_per_sec'], 0)
+            self.assertGreater(result['peak_rss_mb'], 0)
+
+    def test_regressions(self):
+        baseline = {'voa': {'rows_per_sec': 1000, 'peak_rss_mb': 40}}
+        ok = {'voa': {'rows_per_sec': 800, 'peak_rss_mb': 48}}
+        slow = {'voa': {'rows_per_sec': 700, 'peak_rss_mb': 40}}
+
+        self.assertEqual(list(regressions(ok, baseline, 0.25)), [])
+        self.assertEqual(list(regressions(slow, baseline, 0.25)),
+                         ['voa: 700 rows/sec, down from 1,000'])
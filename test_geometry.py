@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import tempfile
+from array import array
+from unittest import TestCase
+
+import shapefile
+
+from benchmark import (
+    greenbelts_input, lr_polygons_input, ring, write_shapefile)
+from fake_api import FakeAPIServer
+from geometry import Geometry, signed_area
+from import_greenbelts import GreenbeltsImportCommand
+from import_lr_polygons import PolygonsImportCommand
+from inputs import open_shapefile
+from payload_json import dumps
+
+
+class TestGeometry(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def shapes(self, shape_type, geometries):
+        file_name = os.path.join(self.directory, 'shapes.shp')
+        write_shapefile(file_name, shape_type, [('ID', 'N', 10)],
+                        [(geometry, [i])
+                         for i, geometry in enumerate(geometries)])
+        return [shape_record.shape for shape_record in
+                open_shapefile(file_name).iterShapeRecords()]
+
+    def assertSameGeoJSON(self, shapes):
+        for shape in shapes:
+            self.assertEqual(
+                json.dumps(Geometry.from_shape(shape).__geo_interface__),
+                json.dumps(shape.__geo_interface__))
+
+    def test_points(self):
+        shapes = self.shapes(shapefile.POINT, [(1.5, 2.5), (545000, 258000)])
+        self.assertSameGeoJSON(shapes)
+        self.assertEqual(Geometry.from_shape(shapes[0]).num_vertices(), 1)
+
+    def test_lines(self):
+        shapes = self.shapes(shapefile.POLYLINE, [
+            [[(0, 0), (1, 1)]],
+            [[(0, 0), (1, 1)], [(2, 2), (3, 3), (4, 4)]]])
+        self.assertSameGeoJSON(shapes)
+        self.assertEqual(
+            [Geometry.from_shape(shape).type for shape in shapes],
+            ['LineString', 'MultiLineString'])
+
+    def test_polygons(self):
+        shapes = self.shapes(shapefile.POLYGON, [
+            [ring(0, 0, 10)],
+            # with a hole
+            [ring(0, 0, 10), ring(0, 0, 2)[::-1]],
+            # two polygons
+            [ring(0, 0, 10), ring(100, 0, 2)]])
+        self.assertSameGeoJSON(shapes)
+        geometry = Geometry.from_shape(shapes[2])
+        self.assertEqual(geometry.type, 'MultiPolygon')
+        self.assertEqual(list(geometry.ring_offsets), [0, 21, 42])
+        self.assertEqual(list(geometry.polygon_offsets), [0, 1, 2])
+
+    def test_signed_area(self):
+        square = array('d', [0, 0, 0, 2, 2, 2, 2, 0, 0, 0])
+        self.assertEqual(signed_area(square), -4)
+        anticlockwise = array('d', [0, 0, 2, 0, 2, 2, 0, 2, 0, 0])
+        self.assertEqual(signed_area(anticlockwise), 4)
+
+    def test_extend_and_with_z(self):
+        multipolygon = Geometry.multipolygon()
+        multipolygon.extend(Geometry.from_geo_interface({
+            'type': 'Polygon',
+            'coordinates': [[(0, 0), (0, 1), (1, 0), (0, 0)]]}))
+        multipolygon.extend(Geometry.from_geo_interface({
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [[(5, 5), (5, 6), (6, 5), (5, 5)],
+                 [(5.1, 5.1), (5.2, 5.1), (5.1, 5.2), (5.1, 5.1)]]]}))
+
+        self.assertEqual(multipolygon.num_polygons(), 2)
+        self.assertEqual(multipolygon.num_vertices(), 12)
+        self.assertEqual(multipolygon.with_z().__geo_interface__, {
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [[(0, 0, 0), (0, 1, 0), (1, 0, 0), (0, 0, 0)]],
+                [[(5, 5, 0), (5, 6, 0), (6, 5, 0), (5, 5, 0)],
+                 [(5.1, 5.1, 0), (5.2, 5.1, 0), (5.1, 5.2, 0),
+                  (5.1, 5.1, 0)]]]})
+        self.assertEqual(
+            multipolygon.with_z(7).positions(0)[0], (0, 0, 7))
+        # the z stays an int, as import_greenbelts.py has always sent it
+        baseline = json.dumps({
+            'type': 'MultiPolygon',
+            'coordinates': [[[(x, y, 0) for x, y in ring] for ring in polygon]
+                            for polygon in multipolygon.__geo_interface__[
+                                'coordinates']]})
+        self.assertEqual(
+            json.dumps(multipolygon.with_z().__geo_interface__), baseline)
+        self.assertEqual(dumps(multipolygon.with_z()), baseline)
+        with self.assertRaises(ValueError):
+            multipolygon.extend(Geometry.from_geo_interface(
+                {'type': 'Point', 'coordinates': (1, 2)}))
+
+    def test_rounded(self):
+        geometry = Geometry.from_geo_interface({
+            'type': 'Polygon',
+            'coordinates': [[(0.8607692231732531, 52.95391007095734),
+                             (0.8607667846123711, 52.95391891517057),
+                             (0.8607808527669906, 52.95392068053286),
+                             (0.8607692231732531, 52.95391007095734)]]})
+
+        self.assertEqual(geometry.rounded(7).positions(0), [
+            (0.8607692, 52.9539101), (0.8607668, 52.9539189),
+            (0.8607809, 52.9539207), (0.8607692, 52.9539101)])
+
+    def test_simplified(self):
+        line = Geometry.from_geo_interface({
+            'type': 'LineString',
+            'coordinates': [(0, 0), (1, 0.01), (2, 0), (3, 5), (4, 5)]})
+        self.assertEqual(line.simplified(0.1).positions(0),
+                         [(0, 0), (2, 0), (3, 5), (4, 5)])
+        self.assertEqual(line.simplified(100).positions(0),
+                         [(0, 0), (4, 5)])
+
+        circle = Geometry.from_geo_interface({
+            'type': 'MultiPolygon',
+            'coordinates': [[ring(0, 0, 10, 100)], [ring(50, 0, 1)]]})
+        simplified = circle.simplified(0.5)
+        self.assertLess(simplified.num_vertices(), 40)
+        self.assertEqual(simplified.num_polygons(), 2)
+        # a ring stays a ring, however big the tolerance
+        for polygon in circle.simplified(100).__geo_interface__[
+                'coordinates']:
+            self.assertEqual(len(polygon[0]), 4)
+            self.assertEqual(polygon[0][0], polygon[0][-1])
+
+    def test_simplified_stays_valid(self):
+        outer = [(0, 0), (0, 10), (10, 10), (10, 0), (5, -0.4), (0, 0)]
+        for hole in (
+                # in the dip of the bottom edge, which simplifying would
+                # straighten out to leave the hole outside
+                [(4.9, -0.3), (5, -0.2), (5.1, -0.3), (4.9, -0.3)],
+                # across where the straightened edge would be
+                [(4.9, -0.3), (5, 0.2), (5.1, -0.3), (4.9, -0.3)]):
+            polygon = Geometry.from_geo_interface(
+                {'type': 'Polygon', 'coordinates': [outer, hole]})
+            self.assertEqual(polygon.simplified(0.5).positions(0), outer)
+            self.assertEqual(polygon.simplified(0.5).positions(1), hole)
+        # with the hole further in, the dip goes
+        polygon = Geometry.from_geo_interface({
+            'type': 'Polygon',
+            'coordinates': [outer, [(4, 4), (5, 5), (6, 4), (4, 4)]]})
+        self.assertEqual(polygon.simplified(0.5).positions(0),
+                         outer[:4] + outer[5:])
+
+        # simplified on its own, this ring would cross itself
+        crossing = [(7.7, 2.4), (-1, 5), (-0.7, 1.9), (6.7, -7), (2.7, -1.2),
+                    (6.4, -2.2), (7.7, 2.4)]
+        polygon = Geometry.from_geo_interface(
+            {'type': 'Polygon', 'coordinates': [crossing]})
+        self.assertEqual(polygon.simplified(3).positions(0), crossing)
+
+    def test_greenbelts(self):
+        server = FakeAPIServer(keep_records=True).start()
+        try:
+            file_name = greenbelts_input(self.directory, 12)[1]
+            GreenbeltsImportCommand(
+                file_name, server.url + 'api/greenbelts/', 'abc',
+                trial_run=False).run()
+        finally:
+            server.stop()
+
+        # polygons 0-4, 5-9 and 10-11 are in the same greenbelt and district
+        self.assertEqual(
+            sorted((record['code'], len(record['geom']['coordinates']))
+                   for record in server.records),
+            [('Greenbelt 0 | District 0', 5),
+             ('Greenbelt 1 | District 0', 5),
+             ('Greenbelt 2 | District 1', 2)])
+        self.assertEqual(server.records[0]['geom']['type'], 'MultiPolygon')
+        self.assertEqual(
+            server.records[0]['geom']['coordinates'][0][0][0][2], 0)
+
+    def test_shrink_payloads(self):
+        server = FakeAPIServer(keep_records=True).start()
+        try:
+            file_name = lr_polygons_input(self.directory, 20)[1]
+            command = PolygonsImportCommand(
+                file_name, server.url, 'abc', jobs=2, round_coordinates=True,
+                simplify=0.5)
+            loopstats = command.import_files(command.partitions())
+        finally:
+            server.stop()
+
+        self.assertEqual(len(server.records), 20)
+        # rounded to centimetres, and the 21 vertices of the ring of radius 4
+        # simplified to within 50cm
+        for record in server.records:
+            coordinates = record['geom']['coordinates'][0]
+            self.assertLess(len(coordinates), 15)
+            for x, y in coordinates:
+                self.assertEqual(round(x, 2), x)
+        self.assertGreater(loopstats.totals['geometry bytes'], 0)
+        self.assertGreater(loopstats.totals['geometry bytes saved'],
+                           loopstats.totals['geometry bytes'] / 2)
@@ -0,0 +1,666 @@
+import array
+import csv
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock, skipIf
+
+import click
+import shapefile
+
+from benchmark import (
+    cambridge_input, ring, schools_input, write_shapefile)
+from fake_api import FakeAPIServer
+from dead_letters import DeadLetterFile, read_dead_letters
+from import_cambridge_lands import CambridgeLandsImportCommand
+from import_naptan import NaptanImportCommand
+from import_schools import SchoolsImportCommand
+from importers import (
+    CSVImportCommand, ImportCommand, ShapefileImportCommand, aiohttp,
+    partition_records, shx_offsets)
+from inputs import close_shapefile, map_file, open_shapefile
+from load import LoadImportCommand
+from loopstats import LoopStats
+from manifest import Manifest
+from naptan import NAPTAN_HEADER
+from replay import ReplayImportCommand
+
+
+class TestProcessAll(TestCase):
+    def process(self, item):
+        return 'even' if item % 2 == 0 else 'odd'
+
+    def test_sequential(self):
+        loopstats = LoopStats()
+        ImportCommand(None, None).process_all(
+            ((i, i) for i in range(10)), self.process, loopstats)
+
+        self.assertEqual(loopstats.count, 10)
+        self.assertEqual(loopstats.outcomes['even'], [0, 2, 4, 6, 8])
+
+    def test_workers(self):
+        loopstats = LoopStats()
+        command = ImportCommand(None, None, workers=4, max_in_flight=3)
+        command.process_all(
+            ((i, i) for i in range(1000)), self.process, loopstats)
+
+        self.assertEqual(loopstats.count, 1000)
+        self.assertEqual(len(loopstats.outcomes['odd']), 500)
+        self.assertEqual(sorted(loopstats.outcomes['even']),
+                         list(range(0, 1000, 2)))
+
+    def test_workers_exception(self):
+        def process(item):
+            if item == 50:
+                raise ValueError(item)
+
+        with self.assertRaises(ValueError):
+            ImportCommand(None, None, workers=4).process_all(
+                ((i, i) for i in range(100)), process, LoopStats())
+
+    def test_options(self):
+        command = ImportCommand(
+            'http://api/', None, workers=16, batch_size=10, retries=5)
+        self.assertEqual(command.options.concurrency.max_in_flight, 32)
+        self.assertEqual(command.options.concurrency.pool_size, 16)
+        self.assertEqual(command.options.retry.policy.retries, 5)
+        self.assertEqual(command.batcher.batch_size, 10)
+        self.assertEqual(command.batcher.url, 'http://api/')
+        with self.assertRaises(TypeError):
+            ImportCommand(None, None, wokers=16)
+
+
+class TestPostPayload(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(
+            reject='"id": 42}', keep_records=True).start()
+        self.api_url = self.server.url + 'api/'
+        self.directory = tempfile.mkdtemp()
+        self.dead_letters = os.path.join(self.directory, 'failed.ndjson')
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def process(self, item):
+        if item % 10 == 0:
+            return 'skipped'
+        return self.command.post_payload({'id': item}, item)
+
+    def test_post_payload(self):
+        self.command = ImportCommand(self.api_url, 'abc')
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(20)), self.process, loopstats)
+
+        self.assertEqual(len(loopstats.outcomes['imported']), 18)
+        self.assertEqual(len(self.server.records), 18)
+
+    @skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_process_all_async(self):
+        self.command = ImportCommand(
+            self.api_url, 'abc', use_async=True, max_in_flight=10,
+            dead_letters=self.dead_letters)
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(200)), self.process, loopstats)
+
+        self.assertEqual(len(loopstats.outcomes['imported']), 179)
+        self.assertEqual(len(loopstats.outcomes['skipped']), 20)
+        self.assertEqual(
+            sorted(payload['id'] for payload in self.server.records),
+            [i for i in range(200) if i % 10 and i != 42])
+
+    def test_async_without_aiohttp(self):
+        self.command = ImportCommand(
+            self.api_url, 'abc', use_async=True,
+            dead_letters=self.dead_letters)
+        with mock.patch('importers.aiohttp', None):
+            with self.assertRaisesRegex(click.UsageError, 'aiohttp'):
+                self.command.process_all(
+                    ((i, i) for i in range(10)), self.process, LoopStats())
+
+    def test_bulk(self):
+        self.command = ImportCommand(
+            self.api_url, 'abc', batch_size=16, batch_bytes=200,
+            dead_letters=self.dead_letters)
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(100)), self.process, loopstats)
+
+        self.assertEqual(loopstats.count, 100)
+        self.assertEqual(len(loopstats.outcomes['imported']), 89)
+        self.assertEqual(len(loopstats.outcomes['skipped']), 10)
+        errors = [outcome for outcome in loopstats.outcomes
+                  if outcome.startswith('ERROR')]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(loopstats.outcomes[errors[0]], [42])
+        self.assertEqual(len(self.server.records), 89)
+
+    def test_dead_letters_replay(self):
+        self.command = ImportCommand(
+            self.api_url, 'abc', workers=4, dead_letters=self.dead_letters)
+        self.command.process_all(
+            ((i, i) for i in range(100)), self.process, LoopStats())
+        self.command.dead_letters.close()
+        dead_letters = list(read_dead_letters(self.dead_letters))
+        self.assertEqual(len(dead_letters), 1)
+        self.assertEqual(dead_letters[0]['payload'], {'id': 42})
+        self.assertEqual(dead_letters[0]['status_code'], 400)
+
+        self.server.reject = None
+        loopstats = ReplayImportCommand(
+            [self.dead_letters], None, 'abc', batch_size=10,
+            dead_letters=self.dead_letters + '.2').run()
+        self.assertEqual(loopstats.outcomes['imported'], [42])
+        self.assertEqual(self.server.records[-1], {'id': 42})
+
+    def test_replay_several_urls(self):
+        dead_letters = DeadLetterFile(self.dead_letters)
+        for i in range(6):
+            dead_letters.write(
+                self.server.url + ('busstops/', 'trainstops/')[i % 2], i,
+                500, 'error', {'id': i})
+        dead_letters.close()
+
+        for options in ({}, {'batch_size': 2}):
+            ReplayImportCommand(
+                [self.dead_letters], None, 'abc',
+                dead_letters=self.dead_letters + '.2', **options).run()
+
+        self.assertEqual(self.server.records_created,
+                         {'/busstops/': 6, '/trainstops/': 6})
+        self.assertEqual(
+            sorted(record['id'] for record in self.server.records),
+            sorted(list(range(6)) * 2))
+
+    def test_stage_timings(self):
+        self.command = ImportCommand(self.api_url, 'abc', workers=2)
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(20)), self.process, loopstats)
+
+        self.assertEqual(
+            sorted(loopstats.stage_timings),
+            ['network', 'read', 'response', 'serialize', 'transform'])
+        self.assertEqual(loopstats.stage_timings['read'].count, 20)
+        self.assertEqual(loopstats.stage_timings['network'].count, 18)
+        self.assertEqual(loopstats.outcome_timings['skipped'].count, 2)
+
+    def test_retry(self):
+        self.server.fail_first = 5
+        self.command = ImportCommand(
+            self.api_url, 'abc', workers=2, retries=5)
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(5)), self.process, loopstats)
+
+        self.assertEqual(len(loopstats.outcomes['imported']), 4)
+        self.assertEqual(len(self.server.records), 4)
+
+    def test_retries_exhausted(self):
+        self.server.fail_first = 2
+        self.command = ImportCommand(
+            self.api_url, 'abc', retries=1, dead_letters=self.dead_letters)
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(1, 3)), self.process, loopstats)
+
+        self.assertEqual(loopstats.outcomes['imported'], [2])
+
+    def test_bulk_with_workers(self):
+        self.command = ImportCommand(
+            self.api_url, 'abc', batch_size=10, workers=4,
+            dead_letters=self.dead_letters)
+        loopstats = LoopStats()
+        self.command.process_all(
+            ((i, i) for i in range(1000)), self.process, loopstats)
+
+        self.assertEqual(loopstats.count, 1000)
+        self.assertEqual(len(loopstats.outcomes['imported']), 899)
+        self.assertEqual(len(self.server.records), 899)
+
+
+class PostcodesImportCommand(CSVImportCommand):
+    def process_row(self, row):
+        return self.post_payload({'postcode': row[0]}, row[0])
+
+
+class CSVFilesTestCase(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.file_names = []
+        for area in ('AB', 'CB', 'SW'):
+            file_name = os.path.join(self.directory, area + '.csv')
+            with open(file_name, 'w') as csvfile:
+                for i in range(50):
+                    csvfile.write('{}{} 1AA,10\n'.format(area, i))
+            self.file_names.append(file_name)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+
+class TestImportFiles(CSVFilesTestCase):
+    def test_jobs(self):
+        command = PostcodesImportCommand(
+            self.file_names, self.server.url, 'abc', jobs=3)
+
+        loopstats = command.import_files(self.file_names)
+
+        self.assertEqual(loopstats.count, 150)
+        self.assertEqual(loopstats.counts['imported'], 150)
+        self.assertEqual(len(self.server.records), 150)
+
+
+class FailingPostcodesImportCommand(PostcodesImportCommand):
+    def process_row(self, row):
+        if row[0] == 'CB20 1AA':
+            raise KeyboardInterrupt
+        return super(FailingPostcodesImportCommand, self).process_row(row)
+
+
+class TestResume(CSVFilesTestCase):
+    def test_resume(self):
+        command = FailingPostcodesImportCommand(
+            self.file_names, self.server.url, 'abc', checkpoint_every=7)
+        with self.assertRaises(KeyboardInterrupt):
+            command.run()
+        self.assertEqual(len(self.server.records), 70)
+
+        command = PostcodesImportCommand(
+            self.file_names, self.server.url, 'abc', resume=True)
+        loopstats = command.import_files(self.file_names)
+
+        self.assertEqual(loopstats.count, 150)
+        self.assertEqual(loopstats.counts['imported'], 150)
+        self.assertEqual(len(self.server.records), 150)
+        self.assertEqual(
+            len(set(record['postcode'] for record in self.server.records)),
+            150)
+
+    def test_no_checkpoints_by_default(self):
+        command = FailingPostcodesImportCommand(
+            self.file_names, self.server.url, 'abc')
+        with self.assertRaises(KeyboardInterrupt):
+            command.run()
+
+        self.assertEqual(
+            [name for name in os.listdir(self.directory)
+             if name.endswith('.checkpoint')], [])
+
+    def test_resume_with_workers(self):
+        command = FailingPostcodesImportCommand(
+            self.file_names, self.server.url, 'abc', checkpoint_every=7,
+            workers=4)
+        with self.assertRaises(KeyboardInterrupt):
+            command.run()
+
+        command = PostcodesImportCommand(
+            self.file_names, self.server.url, 'abc', resume=True)
+        loopstats = command.import_files(self.file_names)
+
+        # a few rows that were in flight may be sent twice, but none missed
+        self.assertEqual(loopstats.count, 150)
+        self.assertEqual(
+            len(set(record['postcode'] for record in self.server.records)),
+            150)
+
+
+class TestTransformLoad(CSVFilesTestCase):
+    def transform(self, **options):
+        shards = os.path.join(self.directory, 'shards')
+        command = PostcodesImportCommand(
+            self.file_names, self.server.url + 'api/', 'abc',
+            transform_to=shards, shard_size=40, **options)
+        loopstats = command.import_files(self.file_names)
+        self.assertEqual(loopstats.counts['transformed'], 150)
+        self.assertEqual(self.server.records, [])
+        return shards
+
+    def test_transform_load(self):
+        shards = self.transform(workers=2)
+        # a shard per 40 payloads, each file starting a new one
+        self.assertEqual(len(os.listdir(shards)), 6)
+
+        command = LoadImportCommand([shards], None, 'abc', workers=4)
+        loopstats = command.run()
+
+        self.assertEqual(loopstats.counts['imported'], 150)
+        self.assertEqual(
+            len(set(record['postcode'] for record in self.server.records)),
+            150)
+
+    def test_compressed_jobs_bulk(self):
+        shards = self.transform(jobs=3, compress=True)
+        self.assertTrue(all(name.endswith('.ndjson.gz')
+                            for name in os.listdir(shards)))
+
+        command = LoadImportCommand(
+            [shards], self.server.url + 'other/', 'abc', jobs=2,
+            batch_size=7)
+        loopstats = command.run()
+
+        self.assertEqual(loopstats.counts['imported'], 150)
+        self.assertEqual(self.server.records_created, {'/other/': 150})
+
+    def test_existing_shards(self):
+        self.transform()
+        with self.assertRaises(click.UsageError):
+            self.transform()
+
+
+class PolygonsImportCommand(ShapefileImportCommand):
+    def process_record(self, record):
+        return self.post_payload({
+            'id': record.record[0],
+            'geom': record.shape.__geo_interface__}, record.record[0])
+
+
+class TestShapefileJobs(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'polygons.shp')
+        # a few big polygons at the start, so a part can't just be a quarter
+        # of the records
+        write_shapefile(
+            self.file_name, shapefile.POLYGON, [('ID', 'N', 10)],
+            [([ring(i, i, 10, 400 if i < 10 else 5)], [i])
+             for i in range(200)])
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_partition_records(self):
+        shp_reader = open_shapefile(self.file_name)
+        offsets = shx_offsets(shp_reader)
+        close_shapefile(shp_reader)
+        self.assertEqual(len(offsets), 200)
+
+        boundaries = partition_records(offsets, 4)
+
+        self.assertEqual(boundaries[0], 0)
+        self.assertEqual(boundaries[-1], 200)
+        self.assertEqual(boundaries, sorted(set(boundaries)))
+        # the big polygons are split between the first parts
+        self.assertLess(boundaries[2], 10)
+
+    def test_jobs(self):
+        command = PolygonsImportCommand(
+            self.file_name, self.server.url, 'abc', jobs=3)
+        command.run()
+
+        self.assertEqual(len(self.server.records), 200)
+        self.assertEqual(
+            sorted(record['id'] for record in self.server.records),
+            list(range(200)))
+        self.assertEqual(self.server.records[0]['geom']['type'], 'Polygon')
+        self.assertEqual(
+            [name for name in os.listdir(self.directory)
+             if name.endswith('.checkpoint')], [])
+
+    def test_files_closed(self):
+        maps = []
+
+        def recording_map_file(file_name):
+            maps.append(map_file(file_name))
+            return maps[-1]
+
+        with mock.patch('inputs.map_file', recording_map_file):
+            PolygonsImportCommand(
+                self.file_name, self.server.url, 'abc').run()
+            PolygonsImportCommand(
+                self.file_name, self.server.url, 'abc', jobs=3).partitions()
+
+        # the .shp, .shx and .dbf of the import and of the partitions
+        self.assertEqual(len(maps), 6)
+        self.assertTrue(all(mapped.closed for mapped in maps))
+
+    def test_resume_with_other_jobs(self):
+        # left by an import with --jobs 2
+        with open(self.file_name + '.records-0-50.checkpoint', 'w') as f:
+            f.write('{}')
+        command = PolygonsImportCommand(
+            self.file_name, self.server.url, 'abc', resume=True)
+        with self.assertRaises(click.UsageError):
+            command.run()
+        self.assertEqual(self.server.records, [])
+
+
+class KeyedPostcodesImportCommand(PostcodesImportCommand):
+    natural_key = 'postcode'
+
+    def process_row(self, row):
+        return self.post_payload({'postcode': row[0], 'n': row[1]}, row[0])
+
+
+class TestChangedOnly(CSVFilesTestCase):
+    def import_files(self, **options):
+        command = KeyedPostcodesImportCommand(
+            self.file_names, self.server.url, 'abc', changed_only=True,
+            manifest=os.path.join(self.directory, 'manifest'), **options)
+        return command.import_files(self.file_names)
+
+    def test_changed_only(self):
+        self.import_files(jobs=3)
+        self.assertEqual(len(self.server.records), 150)
+
+        with open(self.file_names[1], 'a') as csvfile:
+            csvfile.write('CB0 1AA,11\n')
+        loopstats = self.import_files(workers=2, batch_size=10)
+
+        self.assertEqual(loopstats.outcomes['imported'], [['CB0 1AA', '11']])
+        self.assertEqual(loopstats.counts['unchanged'], 150)
+
+    def test_no_manifest_by_default(self):
+        command = KeyedPostcodesImportCommand(
+            self.file_names, self.server.url, 'abc')
+        self.assertIsNone(command.manifest)
+
+    def test_manifest(self):
+        path = os.path.join(self.directory, 'manifest')
+        manifest = Manifest(path, 'postcode')
+        for n in (1, 2, 3):
+            for i in range(0, 100, n):
+                manifest.update(i * 7919 % 101, n)
+            with mock.patch('manifest.RUN_SIZE', 16):
+                manifest.save()
+        self.assertEqual(manifest.updates, array.array('Q'))
+
+        manifest = Manifest(path, 'postcode')
+        manifest.load()
+        self.assertEqual(len(manifest.keys), 100)
+        self.assertEqual(list(manifest.keys), sorted(manifest.keys))
+        self.assertTrue(manifest.unchanged(7919 % 101, 1))
+        self.assertTrue(manifest.unchanged(2 * 7919 % 101, 2))
+        self.assertTrue(manifest.unchanged(3 * 7919 % 101, 3))
+        self.assertTrue(manifest.unchanged(6 * 7919 % 101, 3))
+        self.assertFalse(manifest.unchanged(6 * 7919 % 101, 2))
+        self.assertFalse(manifest.unchanged(100, 1))
+
+
+class StoppingSchoolsImportCommand(SchoolsImportCommand):
+    def process_row(self, row):
+        if row[0] == '100012':
+            raise KeyboardInterrupt
+        return super(StoppingSchoolsImportCommand, self).process_row(row)
+
+
+class TestSchools(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.file_name = schools_input(self.directory, 20)[0]
+        # a school without a Northing isn't imported
+        with open(self.file_name, encoding='latin1') as csvfile:
+            rows = list(csv.reader(csvfile))
+        rows[4][71] = ''
+        with open(self.file_name, 'w', encoding='latin1') as csvfile:
+            csv.writer(csvfile).writerows(rows)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def import_schools(self, command_class=SchoolsImportCommand, **options):
+        command = command_class(
+            [self.file_name], self.server.url, 'abc', True,
+            encoding='ISO-8859-1', **options)
+        return command.import_files([self.file_name])
+
+    def test_resume(self):
+        with self.assertRaises(KeyboardInterrupt):
+            self.import_schools(
+                StoppingSchoolsImportCommand, checkpoint_every=1)
+        # the header is read again, to look up the columns in
+        loopstats = self.import_schools(resume=True)
+
+        self.assertEqual(loopstats.count, 20)
+        self.assertEqual(
+            sorted(record['urn'] for record in self.server.records),
+            [str(100000 + i) for i in range(20) if i != 3])
+        self.assertEqual(self.server.records[0], {
+            'urn': '100000', 'la_name': 'Cambridgeshire',
+            'school_name': 'School 0', 'school_type': 'PRIMARY',
+            'school_capacity': 420, 'school_pupils': 398,
+            'postcode': 'CB00AP',
+            'point': {'type': 'Point', 'coordinates': [545000.0, 258000.0]},
+            'srid': 27700})
+
+
+class TestNaptan(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'Stops.csv')
+        stop_types = ['BCT', 'FER', 'MET', 'RLY', 'TXR', 'BCS', 'PLT', 'FTD']
+        with open(self.file_name, 'w', encoding='latin1') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+            writer.writerow(NAPTAN_HEADER)
+            for i in range(80):
+                row = [''] * len(NAPTAN_HEADER)
+                row[0] = 'ATCO{}'.format(i)
+                row[29], row[30] = '-2.5', '51.4'
+                row[31] = stop_types[i % len(stop_types)]
+                if i % 5 == 0:
+                    # a row that spans several lines
+                    row[35] = 'Notes\nBCT\n"quoted"'
+                writer.writerow(row)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def import_naptan(self, **options):
+        command = NaptanImportCommand(
+            [self.file_name], self.server.url + 'busstops/',
+            self.server.url + 'metrotubes/', self.server.url + 'trainstops/',
+            'abc', manifest=os.path.join(self.directory, 'manifest'),
+            dead_letters=os.path.join(self.directory, 'failed.ndjson'),
+            **options)
+        return command.import_files([self.file_name])
+
+    def assert_imported(self, loopstats):
+        self.assertEqual(loopstats.count, 80)
+        self.assertEqual(loopstats.counts['bus stops: imported'], 20)
+        self.assertEqual(loopstats.counts['metro/tube stops: imported'], 20)
+        self.assertEqual(loopstats.counts['train stops: imported'], 10)
+        self.assertEqual(
+            loopstats.counts['not a bus, metro/tube or train stop'], 30)
+        self.assertEqual(self.server.records_created, {
+            '/busstops/': 20, '/metrotubes/': 20, '/trainstops/': 10})
+
+    def test_import_naptan(self):
+        self.assert_imported(self.import_naptan())
+
+    def test_import_naptan_bulk(self):
+        self.assert_imported(self.import_naptan(workers=4, batch_size=8))
+
+    @skipIf(aiohttp is None, 'aiohttp is not installed')
+    def test_import_naptan_async(self):
+        self.assert_imported(self.import_naptan(use_async=True))
+
+    def test_import_naptan_cache(self):
+        cache = os.path.join(self.directory, 'cache')
+        self.assert_imported(self.import_naptan(cache=cache))
+
+        loopstats = self.import_naptan(cache=cache, workers=2)
+
+        self.assertEqual(loopstats.count, 80)
+        self.assertEqual(
+            loopstats.counts['not a bus, metro/tube or train stop'], 30)
+        self.assertEqual(loopstats.counts['bus stops: imported'], 20)
+        self.assertEqual(loopstats.counts['metro/tube stops: imported'], 20)
+        self.assertEqual(loopstats.counts['train stops: imported'], 10)
+        self.assertEqual(self.server.records_created, {
+            '/busstops/': 40, '/metrotubes/': 40, '/trainstops/': 20})
+
+    def test_import_naptan_resume(self):
+        self.assert_imported(self.import_naptan(checkpoint_every=7))
+
+        # the counts come from the finished checkpoint, skipped rows and all
+        loopstats = self.import_naptan(resume=True)
+
+        self.assertEqual(loopstats.count, 80)
+        self.assertEqual(
+            loopstats.counts['not a bus, metro/tube or train stop'], 30)
+        self.assertEqual(loopstats.counts['bus stops: imported'], 20)
+
+    def test_import_naptan_transform_load(self):
+        shards = os.path.join(self.directory, 'shards')
+        loopstats = self.import_naptan(transform_to=shards)
+        self.assertEqual(loopstats.counts['bus stops: transformed'], 20)
+
+        LoadImportCommand([shards], None, 'abc', workers=2).run()
+
+        self.assertEqual(self.server.records_created, {
+            '/busstops/': 20, '/metrotubes/': 20, '/trainstops/': 10})
+
+
+class TestCambridgeLands(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.file_name = cambridge_input(self.directory, 9)[0]
+        # rather than the HMRC API, and its cache
+        lookup = mock.patch(
+            'hmrc_addressbase.lookup_uprn_in_addressbase',
+            return_value=[{'address': {'lines': ['1 High Street'],
+                                       'town': 'Cambridge'},
+                           'location': [52.2, 0.12]}])
+        lookup.start()
+        self.addCleanup(lookup.stop)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def import_cambridge(self, **options):
+        command = CambridgeLandsImportCommand(
+            [self.file_name], self.server.url + 'api/locations/', 'abc',
+            self.server.url + 'api/', 'abc', self.server.url + 'api/voa/',
+            'abc', dead_letters=os.path.join(self.directory, 'failed.ndjson'),
+            **options)
+        return command.import_files([self.file_name])
+
+    def assert_imported(self, loopstats):
+        # a third of the rows aren't vacant
+        self.assertEqual(loopstats.counts['processed with voa data'], 6)
+        self.assertEqual(loopstats.counts['Ignore - not vacant'], 3)
+        self.assertEqual(self.server.records_created,
+                         {'/api/locations/': 6})
+
+    def test_import_cambridge(self):
+        self.assert_imported(self.import_cambridge())
+
+    def test_import_cambridge_bulk(self):
+        self.assert_imported(self.import_cambridge(workers=2, batch_size=4))
+
+    def test_import_cambridge_async(self):
+        # the lookups would block the event loop
+        with self.assertRaises(click.UsageError):
+            self.import_cambridge(use_async=True)
@@ -0,0 +1,161 @@
+import bz2
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase, mock
+
+import shapefile
+
+from benchmark import write_shapefile
+from checkpoint import LineReader
+from fake_api import FakeAPIServer
+from inputs import expand_inputs, open_input, open_shapefile, sidecar_path
+from test_importers import PostcodesImportCommand
+
+
+def without_seek(self, *args):
+    raise io.UnsupportedOperation('seek')
+
+
+def without_tell(self):
+    raise io.UnsupportedOperation('tell')
+
+
+# zip members as they are before Python 3.7
+zip_members_without_seek = mock.patch.multiple(
+    zipfile.ZipExtFile, seekable=lambda self: False, seek=without_seek,
+    tell=without_tell)
+
+
+class InputsTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+
+class TestOpenInput(InputsTestCase):
+    def test_compressed(self):
+        with gzip.open(self.path('a.csv.gz'), 'wb') as gzip_file:
+            gzip_file.write(b'AB1 1AA,10\n')
+        with bz2.open(self.path('a.csv.bz2'), 'wb') as bz2_file:
+            bz2_file.write(b'AB1 1AA,10\n')
+
+        for name in ('a.csv.gz', 'a.csv.bz2'):
+            with open_input(self.path(name)) as csvfile:
+                self.assertEqual(csvfile.read(), b'AB1 1AA,10\n')
+
+    def test_zip_members(self):
+        with zipfile.ZipFile(self.path('codepo.zip'), 'w') as zip_file:
+            zip_file.writestr('Data/CSV/cb.csv', 'CB1 1AA,10\n')
+            zip_file.writestr('Data/CSV/ab.csv', 'AB1 1AA,10\n')
+            zip_file.writestr('Doc/licence.txt', 'OGL')
+
+        file_names = expand_inputs(
+            [self.path('codepo.zip'), self.path('other.csv')])
+
+        self.assertEqual(file_names, [
+            self.path('codepo.zip/Data/CSV/ab.csv'),
+            self.path('codepo.zip/Data/CSV/cb.csv'),
+            self.path('other.csv')])
+        with open_input(file_names[1]) as csvfile:
+            self.assertEqual(csvfile.read(), b'CB1 1AA,10\n')
+        self.assertEqual(sidecar_path(file_names[1], '.checkpoint'),
+                         self.path('codepo.zip-Data-CSV-cb.csv.checkpoint'))
+        self.assertEqual(sidecar_path(file_names[2], '.checkpoint'),
+                         self.path('other.csv.checkpoint'))
+
+    @zip_members_without_seek
+    def test_zip_member_without_seek(self):
+        with zipfile.ZipFile(self.path('codepo.zip'), 'w',
+                             zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('ab.csv', 'AB1 1AA,10\n"AB1\n1AB",20\n')
+        file_name = self.path('codepo.zip/ab.csv')
+
+        with open_input(file_name) as csvfile:
+            lines = LineReader(csvfile, 'utf-8')
+            self.assertEqual(next(csv.reader(lines)), ['AB1 1AA', '10'])
+            position = lines.offset
+            self.assertEqual(position, 11)
+        # resuming reads up to the position, rather than seeking
+        with open_input(file_name) as csvfile:
+            lines = LineReader(csvfile, 'utf-8', position)
+            self.assertEqual(list(csv.reader(lines)), [['AB1\n1AB', '20']])
+            self.assertEqual(lines.current_line_start(), 24)
+
+
+class TestOpenShapefile(InputsTestCase):
+    def setUp(self):
+        super(TestOpenShapefile, self).setUp()
+        write_shapefile(
+            self.path('gb.shp'), shapefile.POLYGON, [('NAME', 'C', 20)],
+            [([[[0, 0], [0, i + 1], [1, 0], [0, 0]]], ['gb{}'.format(i)])
+             for i in range(20)])
+
+    def assert_shapes(self, shp_reader):
+        shape_records = list(shp_reader.iterShapeRecords())
+        self.assertEqual(len(shape_records), 20)
+        self.assertEqual(shape_records[7].record[0], 'gb7')
+        self.assertEqual(list(shape_records[7].shape.points[1]), [0, 8])
+        self.assertEqual(list(shp_reader.shape(19).points[1]), [0, 20])
+
+    def test_zip(self):
+        with zipfile.ZipFile(self.path('gb.shp.zip'), 'w',
+                             zipfile.ZIP_DEFLATED) as zip_file:
+            for extension in ('.shp', '.shx', '.dbf'):
+                zip_file.write(self.path('gb' + extension),
+                               'England/GB' + extension)
+
+        self.assert_shapes(open_shapefile(self.path('gb.shp.zip')))
+        self.assert_shapes(
+            open_shapefile(self.path('gb.shp.zip/England/GB.shp')))
+        with zip_members_without_seek:
+            self.assert_shapes(open_shapefile(self.path('gb.shp.zip')))
+
+    def test_gzip(self):
+        for extension in ('.shp', '.shx', '.dbf'):
+            with open(self.path('gb' + extension), 'rb') as shp_file, \
+                    gzip.open(self.path('gb' + extension + '.gz'),
+                              'wb') as gzip_file:
+                gzip_file.write(shp_file.read())
+
+        self.assert_shapes(open_shapefile(self.path('gb.shp.gz')))
+
+    def test_zip_of_several(self):
+        with zipfile.ZipFile(self.path('two.zip'), 'w') as zip_file:
+            zip_file.writestr('a.shp', b'')
+            zip_file.writestr('b.shp', b'')
+
+        with self.assertRaises(ValueError):
+            open_shapefile(self.path('two.zip'))
+
+
+class TestImportZip(InputsTestCase):
+    def test_import_zip_and_gzip(self):
+        server = FakeAPIServer(keep_records=True).start()
+        self.addCleanup(server.stop)
+        with zipfile.ZipFile(self.path('postcodes.zip'), 'w',
+                             zipfile.ZIP_DEFLATED) as zip_file:
+            for area in ('AB', 'CB'):
+                zip_file.writestr(area + '.csv', ''.join(
+                    '{}{} 1AA,10\n'.format(area, i) for i in range(50)))
+        with gzip.open(self.path('SW.csv.gz'), 'wt') as gzip_file:
+            for i in range(50):
+                gzip_file.write('SW{} 1AA,10\n'.format(i))
+        file_names = [self.path('postcodes.zip'), self.path('SW.csv.gz')]
+
+        command = PostcodesImportCommand(
+            file_names, server.url, 'abc', jobs=2, checkpoint_every=7)
+        loopstats = command.import_files(command.file_names)
+
+        self.assertEqual(loopstats.counts['imported'], 150)
+        self.assertEqual(
+            len(set(record['postcode'] for record in server.records)), 150)
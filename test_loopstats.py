@@ -0,0 +1,125 @@
+from unittest import TestCase
+
+from loopstats import Histogram, LoopStats
+
+
+class TestLoopStats(TestCase):
+    def test_merge(self):
+        loopstats = LoopStats()
+        loopstats.add('imported', 1)
+        loopstats.add(None, 2)
+        other = LoopStats()
+        other.add('imported', 3)
+        other.add('ERROR', 4)
+
+        loopstats.merge(other)
+
+        self.assertEqual(loopstats.count, 4)
+        self.assertEqual(loopstats.outcomes['imported'], [1, 3])
+        self.assertEqual(loopstats.outcomes['processed'], [2])
+        self.assertEqual(loopstats.outcomes['ERROR'], [4])
+
+    def test_compact(self):
+        loopstats = LoopStats(compact=True, max_examples=3, max_outcomes=2)
+        for i in range(1000):
+            loopstats.add('imported' if i % 10 else 'ERROR {}'.format(i), i)
+
+        self.assertEqual(loopstats.count, 1000)
+        self.assertEqual(loopstats.counts['imported'], 900)
+        self.assertEqual(loopstats.counts['ERROR 0'], 1)
+        self.assertEqual(loopstats.counts['(other outcomes)'], 99)
+        self.assertEqual(len(loopstats.outcomes['imported']), 3)
+        self.assertEqual(loopstats.outcomes['imported'][0], 1)
+        self.assertEqual(len(loopstats.outcomes), 3)
+
+    def test_merge_compact(self):
+        loopstats = LoopStats(compact=True, max_examples=2)
+        other = LoopStats()
+        for i in range(10):
+            other.add('imported', i)
+
+        loopstats.merge(other)
+
+        self.assertEqual(loopstats.counts['imported'], 10)
+        self.assertEqual(len(loopstats.outcomes['imported']), 2)
+
+    def test_timings(self):
+        loopstats = LoopStats()
+        loopstats.add_timing('network', 0.002)
+        loopstats.add('imported', 1, 0.003)
+
+        lines = loopstats.timings().splitlines()
+
+        self.assertEqual(lines[1].split()[0], 'network')
+        self.assertEqual(lines[2].split()[0], 'imported')
+
+    def test_totals(self):
+        loopstats = LoopStats()
+        loopstats.add_total('geometry bytes', 1000)
+        other = LoopStats()
+        other.add_total('geometry bytes', 2500)
+        other.add_total('geometry bytes saved', 1200)
+
+        loopstats.merge(other)
+
+        self.assertEqual(loopstats.snapshot()['totals'], {
+            'geometry bytes': 3500, 'geometry bytes saved': 1200})
+        self.assertIn(
+            'Totals: 3,500 geometry bytes, 1,200 geometry bytes saved',
+            loopstats.stats())
+
+    def test_stats_returns_outcomes(self):
+        loopstats = LoopStats(10)
+        loopstats.add('imported', 'CB1')
+        loopstats.add('ERROR', 'CB2')
+
+        stats = loopstats.stats()
+
+        self.assertIn('1 imported e.g. CB1\n', stats)
+        self.assertIn('1 ERROR e.g. CB2\n', stats)
+        self.assertIn('Progress: 20%', stats)
+
+    def test_print_every_x_seconds(self):
+        loopstats = LoopStats()
+        snapshots = []
+        loopstats.sinks.append(SnapshotList(snapshots))
+        loopstats.add('imported', 1)
+
+        loopstats.print_every_x_seconds(60)
+        self.assertEqual(snapshots, [])
+        loopstats.last_report -= 60
+        loopstats.print_every_x_seconds(60)
+
+        self.assertEqual(len(snapshots), 1)
+        self.assertEqual(snapshots[0]['outcomes'], {'imported': 1})
+
+
+class SnapshotList(object):
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+class TestHistogram(TestCase):
+    def test_percentile(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.add(i / 1000.0)
+
+        for percent in (50, 95, 99):
+            self.assertAlmostEqual(
+                histogram.percentile(percent), percent / 100.0,
+                delta=percent / 1000.0 * 2)
+
+    def test_merge(self):
+        histogram = Histogram()
+        histogram.add(0.5)
+        other = Histogram()
+        other.add(0.25)
+        other.add(0.25)
+        histogram.merge(other)
+
+        self.assertEqual(histogram.quantiles()['count'], 3)
+        self.assertEqual(histogram.quantiles()['sum'], 1.0)
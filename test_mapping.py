@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+from mapping import Column, Constant, FieldMapping, Fields, Point
+
+
+MAPPING = FieldMapping([
+    ('id', 'ID'),
+    ('name', Column('Name', str.upper)),
+    ('point', Point(Column('X', float), Column('Y', float))),
+    ('details', Fields([('count', Column(3, int))])),
+    ('srid', Constant(4326)),
+], columns=['ID', 'Name', 'X', 'Y'])
+
+
+class TestFieldMapping(TestCase):
+    def test_columns(self):
+        extract = MAPPING.compile()
+
+        self.assertEqual(extract(['1', 'a', '0.5', '7']), {
+            'id': '1',
+            'name': 'A',
+            'point': {'type': 'Point', 'coordinates': [0.5, 7.0]},
+            'details': {'count': 7},
+            'srid': 4326,
+        })
+
+    def test_header(self):
+        # the columns are looked up in the header of the file
+        extract = MAPPING.compile(['Y', 'X', 'Name', 'ID'])
+
+        payload = extract(['7', '0.5', 'a', '1'])
+
+        self.assertEqual(payload['id'], '1')
+        self.assertEqual(payload['point']['coordinates'], [0.5, 7.0])
+        self.assertIs(MAPPING.compile(['Y', 'X', 'Name', 'ID']), extract)
+
+    def test_required(self):
+        mapping = FieldMapping(
+            [('id', 'ID')], columns=['ID', 'X', 'Y'], required=['X', 'Y'])
+        extract = mapping.compile()
+
+        self.assertEqual(extract(['1', '0.5', '7']), {'id': '1'})
+        self.assertIsNone(extract(['1', '0.5', '']))
+        self.assertIsNone(extract(['1', '', '']))
+
+    def test_missing_column(self):
+        with self.assertRaises(ValueError):
+            MAPPING.compile(['ID', 'Name', 'X'])
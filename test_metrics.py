@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from loopstats import LoopStats
+from metrics import JSONLinesSink, PrometheusTextfileSink
+
+
+class TestSinks(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.loopstats = LoopStats(4)
+        self.loopstats.add('imported', 1, 0.002)
+        self.loopstats.add('ERROR "bad"', 2, 0.001)
+        self.loopstats.add_timing('network', 0.001)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_json_lines(self):
+        path = os.path.join(self.directory, 'metrics.jsonl')
+        self.loopstats.sinks.append(
+            JSONLinesSink(path, {'importer': 'Test'}))
+
+        self.loopstats.report()
+        self.loopstats.report()
+
+        with open(path) as metrics_file:
+            lines = [json.loads(line) for line in metrics_file]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['importer'], 'Test')
+        self.assertEqual(lines[0]['outcomes'],
+                         {'imported': 1, 'ERROR "bad"': 1})
+        self.assertEqual(lines[0]['fraction_complete'], 0.5)
+        self.assertEqual(lines[0]['stage_seconds']['network']['count'], 1)
+
+    def test_prometheus(self):
+        path = os.path.join(self.directory, 'import.prom')
+        self.loopstats.sinks.append(
+            PrometheusTextfileSink(path, {'importer': 'Test'}))
+
+        self.loopstats.report()
+
+        with open(path) as metrics_file:
+            text = metrics_file.read()
+        self.assertIn('# TYPE landavailability_import_records_total counter',
+                      text)
+        self.assertIn(
+            'landavailability_import_records_total'
+            '{importer="Test",outcome="ERROR \\"bad\\""} 1.0\n', text)
+        self.assertIn(
+            'landavailability_import_stage_seconds'
+            '{importer="Test",quantile="0.99",stage="network"} ', text)
+        self.assertIn(
+            'landavailability_import_stage_seconds_sum'
+            '{importer="Test",stage="network"} 0.001\n', text)
+        self.assertIn(
+            'landavailability_import_stage_seconds_count'
+            '{importer="Test",stage="network"} 1.0\n', text)
+        self.assertIn(
+            'landavailability_import_outcome_seconds_sum'
+            '{importer="Test",outcome="imported"} 0.002\n', text)
+        self.assertFalse(os.path.exists(path + '.tmp'))
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import click
+import shapefile
+
+from benchmark import write_shapefile
+from fake_api import FakeAPIServer
+from importers import CSVImportCommand, ShapefileImportCommand
+from manifest import digest
+from payload_cache import PayloadCache
+
+
+class CountingImportCommand(CSVImportCommand):
+    # the postcode to stop the import at, as if interrupted
+    stop_at = None
+
+    def process_row(self, row):
+        if row[0] == self.stop_at:
+            raise KeyboardInterrupt
+        self.rows_processed += 1
+        if row[0].startswith('X'):
+            return 'skipped'
+        return self.post_payload(
+            {'postcode': row[0], 'n': float(row[1])}, row[0])
+
+    def process_cached(self, entry):
+        iteration_id, outcome, payloads = entry
+        if any(identifier == self.stop_at for _, identifier, _ in payloads):
+            raise KeyboardInterrupt
+        return super(CountingImportCommand, self).process_cached(entry)
+
+
+class PointsImportCommand(ShapefileImportCommand):
+    def process_record(self, record):
+        return self.post_payload(
+            {'name': record.record[0],
+             'point': list(record.shape.points[0])}, record.record[0])
+
+
+class TestPayloadCache(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.file_name = os.path.join(self.directory, 'postcodes.csv')
+        with open(self.file_name, 'w') as csvfile:
+            for i in range(60):
+                csvfile.write('{}{} 1AA,{}\n'.format(
+                    'X' if i % 10 == 0 else 'CB', i, i / 3))
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def import_csv(self, stop_at=None, **options):
+        options.setdefault('cache', self.cache_dir)
+        command = CountingImportCommand(
+            [self.file_name], self.server.url, 'abc', **options)
+        command.rows_processed = 0
+        command.stop_at = stop_at
+        loopstats = command.import_files(command.file_names)
+        return command, loopstats
+
+    def test_replay(self):
+        command, loopstats = self.import_csv()
+        self.assertEqual(command.rows_processed, 60)
+        self.assertEqual(os.listdir(self.cache_dir), [
+            'CountingImportCommand-{:016x}.payloads'.format(
+                digest(os.path.abspath(self.file_name)))])
+
+        command, cached_loopstats = self.import_csv(workers=3)
+
+        self.assertEqual(command.rows_processed, 0)
+        self.assertEqual(cached_loopstats.counts, loopstats.counts)
+        self.assertEqual(cached_loopstats.counts['skipped'], 6)
+        self.assertEqual(
+            sorted(self.server.records[54:], key=lambda r: r['postcode']),
+            sorted(self.server.records[:54], key=lambda r: r['postcode']))
+
+    def test_changed_file(self):
+        self.import_csv()
+        with open(self.file_name, 'a') as csvfile:
+            csvfile.write('CB99 1AA,1\n')
+
+        command, loopstats = self.import_csv()
+
+        self.assertEqual(command.rows_processed, 61)
+
+    def test_interrupted(self):
+        class FailingImportCommand(CountingImportCommand):
+            def process_row(self, row):
+                if row[0] == 'CB31 1AA':
+                    raise KeyboardInterrupt
+                return super(FailingImportCommand, self).process_row(row)
+
+        command = FailingImportCommand(
+            [self.file_name], self.server.url, 'abc', cache=self.cache_dir)
+        command.rows_processed = 0
+        with self.assertRaises(KeyboardInterrupt):
+            command.import_files(command.file_names)
+
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_resume_with_cache(self):
+        self.import_csv()
+        # stopped reading the file without --cache, so the checkpoint is of
+        # a byte offset, which isn't an entry of the cache
+        with self.assertRaises(KeyboardInterrupt):
+            self.import_csv(stop_at='CB31 1AA', cache=None, checkpoint_every=1)
+
+        command, loopstats = self.import_csv(resume=True)
+        self.assertEqual(command.rows_processed, 29)
+        self.assertEqual(loopstats.count, 60)
+        self.assertEqual(loopstats.counts['imported'], 54)
+
+        # and stopped sending the cached payloads, which only the cache can
+        # resume from
+        with self.assertRaises(KeyboardInterrupt):
+            self.import_csv(stop_at='CB31 1AA', checkpoint_every=1)
+        with self.assertRaises(click.UsageError):
+            self.import_csv(cache=None, resume=True)
+        command, loopstats = self.import_csv(resume=True)
+        self.assertEqual(command.rows_processed, 0)
+        self.assertEqual(loopstats.count, 60)
+        self.assertEqual(loopstats.counts['imported'], 54)
+
+    def test_shapefile(self):
+        file_name = os.path.join(self.directory, 'points.shp')
+        write_shapefile(
+            file_name, shapefile.POINT, [('NAME', 'C', 20)],
+            [((i, i / 7), ['p{}'.format(i)]) for i in range(30)])
+
+        for i in range(2):
+            command = PointsImportCommand(
+                file_name, self.server.url, 'abc', cache=self.cache_dir)
+            command.run()
+
+        self.assertEqual(len(self.server.records), 60)
+        self.assertEqual(self.server.records[:30], self.server.records[30:])
+        cache = command.open_payload_cache(file_name)
+        self.assertTrue(cache.exists())
+        self.assertEqual(
+            next(cache.entries(29)),
+            (None, None,
+             [(0, 'p29', {'name': 'p29', 'point': [29.0, 29 / 7]})]))
+
+    def test_not_marshallable(self):
+        cache = PayloadCache(self.cache_dir, 'Test', self.file_name, '1')
+        cache.start_writing()
+        cache.write('a', 'imported', [(0, 'a', {'a': object()})])
+        cache.finish()
+
+        self.assertFalse(cache.exists())
+        self.assertEqual(os.listdir(self.cache_dir), [])
@@ -0,0 +1,126 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from benchmark import ring, substations_input
+from fake_api import FakeAPIServer
+from geometry import Geometry
+from import_substations import SubstationsImportCommand
+from payload_json import dumps, without_geometries
+
+
+GEOMETRIES = [
+    {'type': 'Point', 'coordinates': (1.5, -0.0)},
+    {'type': 'Point', 'coordinates': ()},
+    {'type': 'LineString', 'coordinates': [(0, 1e-5), (1e20, 0.1 + 0.2)]},
+    {'type': 'MultiLineString',
+     'coordinates': [[(0, 1), (2, 3)], [(4, 5), (6, 7)]]},
+    {'type': 'Polygon', 'coordinates': [ring(0.86076922317, 52.9539100, 1)]},
+    {'type': 'MultiPolygon',
+     'coordinates': [[ring(0, 0, 1), ring(0, 0, 0.1)[::-1]],
+                     [ring(545000, 258000, 1)]]},
+    {'type': 'Polygon', 'coordinates': [[(0, float('nan')), (1, 1)]]},
+    {'type': 'Point', 'coordinates': [545000, 258000]},
+    {'type': 'Point', 'coordinates': [545000, 258000.5, 10]},
+    {'type': 'MultiPolygon',
+     'coordinates': [[[(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]],
+                     [ring(545000, 258000, 1)]]},
+]
+
+
+OPTIONS = ({}, {'separators': (',', ':')},
+           {'separators': (',', ':'), 'sort_keys': True})
+
+
+class TestPayloadJSON(TestCase):
+    def assert_same_as_json_dumps(self, geometry, geojson):
+        payload = {'id': 1, 'geom': geometry,
+                   'more': [geometry, {'geom': geometry}]}
+        expected = {'id': 1, 'geom': geojson,
+                    'more': [geojson, {'geom': geojson}]}
+        for options in OPTIONS:
+            self.assertEqual(dumps(payload, **options),
+                             json.dumps(expected, **options))
+            self.assertEqual(dumps(geometry, **options),
+                             json.dumps(geojson, **options))
+
+    def test_same_as_json_dumps(self):
+        # of the GeoJSON the Geometry was made from, ints and all
+        for geojson in GEOMETRIES:
+            self.assert_same_as_json_dumps(
+                Geometry.from_geo_interface(geojson), geojson)
+
+    def test_changed_geometries(self):
+        geometries = [Geometry.from_geo_interface(geometry)
+                      for geometry in GEOMETRIES]
+        changed = [
+            geometries[5].with_z(0.0),
+            geometries[5].with_z(0),
+            geometries[1].with_z(-1.5).rounded(0),
+            geometries[9].rounded(2),
+            geometries[9].simplified(0.5),
+            Geometry.multipolygon(),
+        ]
+        merged = Geometry.multipolygon()
+        merged.extend(geometries[5])
+        merged.extend(geometries[9])
+        changed.append(merged)
+        for geometry in changed:
+            self.assert_same_as_json_dumps(
+                geometry, geometry.__geo_interface__)
+
+    def test_integers(self):
+        square = '[[[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]]]'
+        geometry = Geometry.from_geo_interface(GEOMETRIES[9])
+        self.assertIn(square, dumps(geometry.rounded(2).simplified(0.5)))
+        merged = Geometry.multipolygon()
+        merged.extend(Geometry.from_geo_interface(GEOMETRIES[5]))
+        merged.extend(geometry)
+        self.assertIn(square, dumps(merged))
+
+    def test_default(self):
+        payload = {'date': datetime.date(2017, 3, 1)}
+        with self.assertRaises(TypeError):
+            dumps(payload)
+        self.assertEqual(dumps(payload, default=str),
+                         '{"date": "2017-03-01"}')
+
+    def test_without_geometries(self):
+        geometry = Geometry.from_geo_interface(GEOMETRIES[4])
+        self.assertEqual(
+            without_geometries([(0, 'a', {'geom': geometry, 'n': 1})]),
+            [(0, 'a', {'geom': geometry.__geo_interface__, 'n': 1})])
+
+
+class TestGeometryPayloads(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.file_name = substations_input(self.directory, 10)[1]
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_bulk_and_cache(self):
+        # with --precision, the substations have a Geometry in their payloads
+        cache_dir = os.path.join(self.directory, 'cache')
+        for options in ({'batch_size': 4}, {'cache': cache_dir},
+                        {'cache': cache_dir}):
+            command = SubstationsImportCommand(
+                self.file_name, self.server.url, 'abc', precision=12,
+                manifest=os.path.join(self.directory, 'manifest'), **options)
+            command.run()
+
+        self.assertEqual(len(self.server.records), 30)
+        self.assertEqual(self.server.records[:10], self.server.records[10:20])
+        self.assertEqual(self.server.records[:10], self.server.records[20:])
+        self.assertEqual(self.server.records[0]['geom'],
+                         json.loads(json.dumps(Geometry.from_geo_interface(
+                             {'type': 'Polygon',
+                              'coordinates': [ring(545000, 258000, 20)]})
+                             .rounded(12).__geo_interface__)))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import click
+from click.testing import CliRunner
+
+from loopstats import LoopStats
+from profiling import profile_options, top_functions, watch_loopstats
+
+
+class TestProfileOptions(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_command(self, *args):
+        @click.command()
+        @click.option('--rows', type=int, default=1000)
+        @profile_options
+        def command(rows):
+            loopstats = LoopStats()
+            watch_loopstats(loopstats)
+            for i in range(rows):
+                loopstats.add('imported', i)
+            click.echo('{} imported'.format(loopstats.count))
+
+        return CliRunner().invoke(command, args, catch_exceptions=False)
+
+    def test_without_profile(self):
+        result = self.run_command()
+        self.assertEqual(result.output, '1000 imported\n')
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_profile(self):
+        prefix = os.path.join(self.directory, 'profile')
+        result = self.run_command('--profile', prefix,
+                                  '--profile-memory-every', '400')
+
+        self.assertIn('1000 imported\n', result.output)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ['profile.collapsed', 'profile.memory.txt', 'profile.top.txt'])
+        with open(prefix + '.memory.txt') as memory_file:
+            memory = memory_file.read()
+        self.assertIn('After 400 records: ', memory)
+        self.assertIn('After 800 records: ', memory)
+        self.assertIn('At the end: ', memory)
+
+    def test_cprofile(self):
+        prefix = os.path.join(self.directory, 'profile')
+        self.run_command('--profile', prefix, '--profiler', 'cprofile')
+
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['profile.pstats', 'profile.top.txt'])
+
+
+class TestTopFunctions(TestCase):
+    def test_top_functions(self):
+        top = top_functions({('main', 'read'): 3, ('main', 'post'): 1,
+                             ('main',): 1})
+
+        self.assertIn('5 samples', top)
+        own, including = top.split('Samples including calls:')
+        self.assertIn('       3  60.0%  read', own)
+        self.assertIn('       5 100.0%  main', including)
@@ -0,0 +1,72 @@
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase, mock
+
+import shapefile
+
+import record_counts
+from benchmark import voa_input, write_shapefile
+from record_counts import (
+    count_csv_records, count_shapefile_records, count_voa_records)
+
+
+class TestRecordCounts(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_csv(self):
+        rows = [['header', 'x']] + [
+            ['AB{} 1AA'.format(i), 'a\n"b"\n' * (i % 3), 'c""'] if i % 7
+            else ['{}'.format(i), '2'] for i in range(500)]
+        with open(self.path('a.csv'), 'w', newline='') as csvfile:
+            csv.writer(csvfile, lineterminator='\n').writerows(rows)
+
+        self.assertEqual(count_csv_records(self.path('a.csv')), 501)
+        self.assertEqual(
+            count_csv_records(self.path('a.csv'), skip_header=True), 500)
+        # quotes and quoted newlines split between chunks
+        for chunk_size in (1, 2, 3, 17, 1000):
+            with mock.patch.object(record_counts, 'CHUNK_SIZE', chunk_size):
+                self.assertEqual(count_csv_records(self.path('a.csv')), 501)
+
+    def test_csv_without_last_newline(self):
+        with open(self.path('b.csv'), 'wb') as csvfile:
+            csvfile.write(b'a,b\nc,"d\ne"')
+        self.assertEqual(count_csv_records(self.path('b.csv')), 2)
+        open(self.path('empty.csv'), 'w').close()
+        self.assertEqual(count_csv_records(self.path('empty.csv')), 0)
+
+    def test_compressed_csv(self):
+        with gzip.open(self.path('c.csv.gz'), 'wb') as gzip_file:
+            gzip_file.write(b'a,b\n')
+        self.assertIsNone(count_csv_records(self.path('c.csv.gz')))
+
+    def test_voa(self):
+        file_name = voa_input(self.directory, 100)[0]
+
+        self.assertEqual(count_voa_records(file_name), 100)
+        with mock.patch.object(record_counts, 'CHUNK_SIZE', 5):
+            self.assertEqual(count_voa_records(file_name), 100)
+
+    def test_shapefile(self):
+        write_shapefile(
+            self.path('gb.shp'), shapefile.POINT, [('NAME', 'C', 20)],
+            [((i, i), ['gb{}'.format(i)]) for i in range(30)])
+        with zipfile.ZipFile(self.path('gb.zip'), 'w') as zip_file:
+            for extension in ('.shp', '.shx', '.dbf'):
+                zip_file.write(self.path('gb' + extension), 'gb' + extension)
+
+        self.assertEqual(count_shapefile_records(self.path('gb.shp')), 30)
+        self.assertEqual(count_shapefile_records(self.path('gb.zip')), 30)
+        self.assertEqual(
+            count_shapefile_records(self.path('gb.zip/gb.shp')), 30)
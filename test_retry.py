@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from retry import (
+    CircuitBreaker, ConcurrencyController, ImportAborted, RetryPolicy,
+    parse_retry_after)
+
+
+class TestRetryPolicy(TestCase):
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for attempt in range(10):
+            self.assertLessEqual(policy.delay(attempt), min(2 ** attempt, 5))
+
+    def test_retry_after(self):
+        self.assertEqual(RetryPolicy().delay(0, '7'), 7)
+        self.assertEqual(parse_retry_after(None), None)
+        self.assertEqual(
+            parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+
+
+class TestConcurrencyController(TestCase):
+    def test_aimd(self):
+        controller = ConcurrencyController(16)
+        controller.record(0.1)
+        controller.record(0.1, overloaded=True)
+        self.assertEqual(controller.current_limit(), 8)
+        # a slow response so soon after is from the same round trip
+        controller.record(1.0)
+        self.assertEqual(controller.current_limit(), 8)
+        for i in range(100):
+            controller.record(0.1)
+        self.assertEqual(controller.current_limit(), 16)
+
+
+class TestCircuitBreaker(TestCase):
+    def test_abort(self):
+        breaker = CircuitBreaker(threshold=3, cooldown=0, max_trips=2)
+        for i in range(4):
+            breaker.failed()
+        breaker.succeeded()
+        for i in range(4):
+            breaker.failed()
+        with self.assertRaises(ImportAborted):
+            breaker.failed()
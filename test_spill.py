@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import shapefile
+
+from benchmark import ring, write_shapefile
+from fake_api import FakeAPIServer
+from geometry import Geometry
+from import_greenbelts import GreenbeltsImportCommand
+from spill import SpillFile
+
+
+class TestSpillFile(TestCase):
+    def test_add_and_pop(self):
+        with SpillFile() as spilled:
+            spilled.add('a', {'n': 1})
+            spilled.add('b', Geometry.from_geo_interface(
+                {'type': 'Point', 'coordinates': (1.5, 2.5)}))
+            spilled.add('a', {'n': 2})
+
+            self.assertIn('a', spilled)
+            self.assertEqual(len(spilled), 2)
+            self.assertEqual(spilled.pop('a'), [{'n': 1}, {'n': 2}])
+            self.assertNotIn('a', spilled)
+            self.assertEqual(spilled.pop('a'), [])
+            self.assertEqual(
+                spilled.pop('b')[0].__geo_interface__,
+                {'type': 'Point', 'coordinates': (1.5, 2.5)})
+
+
+class TestGreenbelts(TestCase):
+    def setUp(self):
+        self.server = FakeAPIServer(keep_records=True).start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_interrupted_greenbelts(self):
+        file_name = os.path.join(self.directory, 'greenbelt.shp')
+        write_shapefile(
+            file_name, shapefile.POLYGON,
+            [('GB_name', 'C', 80), ('LA_name', 'C', 80),
+             ('ONS_code', 'C', 10), ('Perim_km', 'N', 18, 8),
+             ('Area_ha', 'N', 18, 8)],
+            [([ring(i, 53, 0.1)], [name, 'District', 'E07000001', 1.5, i])
+             for i, name in enumerate('AABACBB')])
+
+        command = GreenbeltsImportCommand(
+            file_name, self.server.url + 'api/greenbelts/', 'abc',
+            trial_run=False)
+        command.run()
+
+        # each is imported after its last record
+        self.assertEqual(
+            [(record['gb_name'], record['area'], record['perimeter'],
+              [polygon[0][0][0] for polygon in record['geom']['coordinates']])
+             for record in self.server.records],
+            [('A', 4, 4.5, [0.1, 1.1, 3.1]),
+             ('C', 4, 1.5, [4.1]),
+             ('B', 13, 4.5, [2.1, 5.1, 6.1])])
+        self.assertEqual(len(command.spilled), 0)
+        self.assertIsNone(command.greenbelt)